@@ -0,0 +1,205 @@
+"""Controle de admissão e descarte de carga para o /chat.
+
+Limita quantos turnos rodam ao mesmo tempo no agente. Requisições excedentes
+esperam numa fila limitada (FIFO) por no máximo CHAT_MAX_QUEUE_TIME segundos;
+com a fila cheia, a resposta é um 429 imediato com Retry-After. Assim um pico
+de tráfego degrada com respostas rápidas em vez de deixar todos os turnos
+lentos até estourarem o tempo.
+
+Um turno abandonado (deadline ou desconexão) continua ocupando a vaga até a
+thread do agente realmente terminar (Slot.hold), para que in_flight conte o
+trabalho que ainda consome threads e cota do modelo.
+
+Toda a coordenação acontece no event loop do servidor (sem locks).
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", 8))
+MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 32))
+MAX_QUEUE_TIME = float(os.getenv("CHAT_MAX_QUEUE_TIME", 5))
+
+# Peso da média móvel exponencial dos tempos medidos
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Requisição descartada pelo controle de admissão"""
+
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Slot:
+    """Vaga obtida em AdmissionController.slot()"""
+
+    def __init__(self):
+        self.pending = None
+
+    def hold(self, future):
+        """Só devolve a vaga quando `future` terminar (mesmo se o bloco sair antes)"""
+        self.pending = future
+
+
+class AdmissionController:
+    """Limitador de concorrência com fila de espera limitada.
+
+    Args:
+        max_in_flight: Máximo de turnos executando ao mesmo tempo.
+        max_queue: Máximo de requisições esperando por uma vaga.
+        max_queue_time: Tempo máximo de espera na fila (segundos).
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, max_queue_time: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+
+        self._in_flight = 0
+        self._waiters: deque = deque()
+
+        # Métricas
+        self._admitted = 0
+        self._queued = 0
+        self._shed_queue_full = 0
+        self._shed_timeout = 0
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_service = 1.0
+        self._abandoned = 0
+        self._abandoned_running = 0
+
+    async def acquire(self, max_wait: Optional[float] = None):
+        """Obtém uma vaga, esperando na fila se necessário.
+
+        Args:
+            max_wait: Limite adicional de espera (ex.: tempo restante da
+                deadline da requisição). Vale o menor entre este e
+                max_queue_time.
+
+        Raises:
+            AdmissionRejected: 429 se a fila estiver cheia, 503 se a espera
+                na fila estourar o tempo.
+        """
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._admitted += 1
+            self._record_wait(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._shed_queue_full += 1
+            raise AdmissionRejected(429, self._retry_after(), "Fila de atendimento cheia")
+
+        timeout = self.max_queue_time
+        if max_wait is not None:
+            timeout = min(timeout, max_wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queued += 1
+        started = time.monotonic()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga foi entregue no mesmo instante: devolve
+                self.release()
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._shed_timeout += 1
+            raise AdmissionRejected(503, self._retry_after(), "Tempo de espera na fila esgotado")
+
+        self._admitted += 1
+        self._record_wait(time.monotonic() - started)
+
+    def release(self):
+        """Libera a vaga, entregando-a diretamente ao próximo da fila"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, max_wait: Optional[float] = None):
+        """Context manager: adquire uma vaga e a libera ao final.
+
+        Se o bloco sair com um trabalho registrado em Slot.hold() ainda
+        rodando, a vaga só é liberada quando ele terminar.
+        """
+        await self.acquire(max_wait)
+        started = time.monotonic()
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            pending = slot.pending
+            if pending is not None and not pending.done():
+                self._abandoned += 1
+                self._abandoned_running += 1
+                pending.add_done_callback(lambda _: self._finish_abandoned(started))
+            else:
+                self._finish(started)
+
+    def _finish(self, started: float):
+        self._record_service(time.monotonic() - started)
+        self.release()
+
+    def _finish_abandoned(self, started: float):
+        self._abandoned_running -= 1
+        self._finish(started)
+
+    def stats(self) -> dict:
+        """Métricas atuais do controle de admissão"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "max_queue_time": self.max_queue_time,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self._admitted,
+            "queued": self._queued,
+            "shed_queue_full": self._shed_queue_full,
+            "shed_timeout": self._shed_timeout,
+            "abandoned": self._abandoned,
+            "abandoned_running": self._abandoned_running,
+            "avg_wait_ms": round(self._avg_wait * 1000, 1),
+            "max_wait_ms": round(self._max_wait * 1000, 1),
+            "avg_service_ms": round(self._avg_service * 1000, 1),
+        }
+
+    # ------------------------------------------------------------------------
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _record_wait(self, seconds: float):
+        self._avg_wait += _EWMA_ALPHA * (seconds - self._avg_wait)
+        self._max_wait = max(self._max_wait, seconds)
+
+    def _record_service(self, seconds: float):
+        self._avg_service += _EWMA_ALPHA * (seconds - self._avg_service)
+
+    def _retry_after(self) -> int:
+        """Estimativa (segundos) de quando a fila atual terá sido drenada"""
+        backlog = len(self._waiters) + 1
+        estimate = self._avg_service * backlog / max(1, self.max_in_flight)
+        return max(1, math.ceil(estimate))
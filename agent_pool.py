@@ -0,0 +1,352 @@
+"""Pool de instâncias do agente por perfil de configuração.
+
+Em vez de um LanggraphAgent global compartilhado por todas as threads (sem
+garantia de que query() seja seguro em paralelo), cada perfil tem N
+instâncias construídas e aquecidas (set_up) na startup. Um turno pega uma
+instância livre (checkout), usa só ela e a devolve no fim; sem instância
+livre dentro do prazo, PoolTimeout.
+
+Uma instância que falha AGENT_MAX_FAILURES vezes seguidas é descartada e
+substituída em segundo plano; a nova só entra no pool depois de construída
+e aquecida com sucesso (senão tenta de novo a cada REPLACE_RETRY_INTERVAL).
+Deadline e cancelamento não contam como falha; cota e indisponibilidade do
+Vertex AI (429/5xx) também não, porque trocar a instância não resolve: não
+zeram nem somam à sequência e ficam em upstream_errors.
+
+Limitação: não há sonda de saúde no checkout nem com a instância parada. O
+defeito só é detectado pelos turnos que falham (até AGENT_MAX_FAILURES
+turnos com erro visível ao cliente antes da troca); uma chamada de teste ao
+modelo custaria cota e latência em todo checkout.
+
+Perfis: o "default" vem das variáveis AGENT_MODEL, AGENT_TEMPERATURE,
+AGENT_MAX_OUTPUT_TOKENS e AGENT_POOL_SIZE. Outros perfis (por tenant ou
+corpus) ficam num JSON em AGENT_PROFILES_PATH e herdam do default o que não
+definirem:
+
+    {"rh-sp": {"corpus_ids": ["123", "456"], "pool_size": 2},
+     "preciso": {"temperature": 0.1}}
+
+O perfil é escolhido por requisição (campo `profile` ou header
+X-Agent-Profile). Todas as instâncias usam o mesmo checkpointer, então a
+conversa continua em qualquer instância.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from typing import Callable, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+import eventlog
+from deadline import DeadlineExceeded, RequestCancelled
+
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", os.getenv("CHAT_MAX_IN_FLIGHT", 8)))
+AGENT_PROFILES_PATH = os.getenv("AGENT_PROFILES_PATH")
+AGENT_MAX_FAILURES = int(os.getenv("AGENT_MAX_FAILURES", 3))
+REPLACE_RETRY_INTERVAL = 10.0
+
+DEFAULT_PROFILE = "default"
+
+# Erros do turno que não indicam problema na instância
+_EXPECTED_ERRORS = (DeadlineExceeded, RequestCancelled)
+
+# Falhas do serviço do modelo: atingem todas as instâncias igualmente
+_UPSTREAM_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.GatewayTimeout,
+)
+
+
+@dataclass(frozen=True)
+class AgentProfile:
+    """Configuração de um grupo de instâncias do agente"""
+    name: str
+    model: str = "gemini-2.0-flash"
+    temperature: float = 0.7
+    max_output_tokens: int = 1024
+    corpus_ids: tuple = ()  # vazio: CORPUS_IDS/CORPUS_ID
+    pool_size: int = AGENT_POOL_SIZE
+
+    def model_kwargs(self) -> dict:
+        return {"temperature": self.temperature, "max_output_tokens": self.max_output_tokens}
+
+
+def load_profiles(path: Optional[str] = AGENT_PROFILES_PATH) -> dict:
+    """Perfis configurados, por nome (sempre inclui o default)"""
+    default = AgentProfile(
+        DEFAULT_PROFILE,
+        model=os.getenv("AGENT_MODEL", AgentProfile.model),
+        temperature=float(os.getenv("AGENT_TEMPERATURE", AgentProfile.temperature)),
+        max_output_tokens=int(os.getenv("AGENT_MAX_OUTPUT_TOKENS", AgentProfile.max_output_tokens)),
+    )
+    profiles = {DEFAULT_PROFILE: default}
+    if not path:
+        return profiles
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    allowed = {f.name for f in fields(AgentProfile)} - {"name"}
+    for name, spec in data.items():
+        unknown = set(spec) - allowed
+        if unknown:
+            raise ValueError(f"Perfil {name!r}: campos desconhecidos {sorted(unknown)}")
+        values = {**asdict(default), **spec, "name": name}
+        values["corpus_ids"] = tuple(values["corpus_ids"])
+        profiles[name] = AgentProfile(**values)
+    return profiles
+
+
+# Perfil do turno atual (a ferramenta e a busca adiantada leem os corpus dele)
+_current = contextvars.ContextVar("agent_profile", default=None)
+
+
+@contextmanager
+def profile_scope(profile: AgentProfile):
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+def current_profile() -> Optional[AgentProfile]:
+    return _current.get()
+
+
+class UnknownProfile(KeyError):
+    """Perfil pedido não está configurado"""
+
+
+class PoolTimeout(Exception):
+    """Nenhuma instância livre dentro do prazo"""
+
+
+class AgentPool:
+    """Instâncias de um perfil, com checkout/devolução e substituição.
+
+    Args:
+        profile: Configuração das instâncias.
+        factory: Constrói uma instância a partir do perfil.
+        size: Número de instâncias (padrão profile.pool_size).
+    """
+
+    def __init__(self, profile: AgentProfile, factory: Callable, size: Optional[int] = None):
+        self.profile = profile
+        self.factory = factory
+        self.size = max(1, size or profile.pool_size)
+        self._idle = []  # LIFO: a instância usada por último é a mais quente
+        self._failures = {}  # id(instância) -> falhas seguidas
+        self._cond = threading.Condition()
+        self._closed = False
+        self._live = 0
+        self._in_use = 0
+        self._replacing = 0
+
+        # Métricas
+        self.checkouts = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.failures = 0
+        self.upstream_errors = 0
+        self.replaced = 0
+        self.replace_errors = 0
+        self.peak_in_use = 0
+
+    def _build(self):
+        instance = self.factory(self.profile)
+        # Aquece: cria o cliente do modelo e compila o grafo antes do 1º turno
+        if hasattr(instance, "set_up"):
+            instance.set_up()
+        return instance
+
+    def _add(self, instance, replaced: bool = False):
+        with self._cond:
+            self._idle.append(instance)
+            self._failures[id(instance)] = 0
+            self._live += 1
+            if replaced:
+                self.replaced += 1
+            self._cond.notify()
+
+    def fill(self) -> int:
+        """Constrói as instâncias em paralelo; as que falharem são repostas
+        em segundo plano. Levanta o erro se nenhuma for construída."""
+        missing = self.size - self._live
+        if missing <= 0:
+            return 0
+        errors = []
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            futures = [executor.submit(self._build) for _ in range(missing)]
+            for future in futures:
+                try:
+                    self._add(future.result())
+                except Exception as e:
+                    errors.append(e)
+        if errors and self._live == 0:
+            raise errors[0]
+        for _ in errors:
+            self._replace_later()
+        return missing - len(errors)
+
+    @contextmanager
+    def checkout(self, timeout: float):
+        """Reserva uma instância durante o bloco"""
+        instance = self._acquire(timeout)
+        try:
+            yield instance
+        except _EXPECTED_ERRORS:
+            self._release(instance, failed=False)
+            raise
+        except _UPSTREAM_ERRORS:
+            self._release(instance, failed=None)
+            raise
+        except BaseException:
+            self._release(instance, failed=True)
+            raise
+        else:
+            self._release(instance, failed=False)
+
+    def _acquire(self, timeout: float):
+        started = time.monotonic()
+        with self._cond:
+            if not self._idle:
+                self.waited += 1
+            while not self._idle:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0 or self._closed:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"Nenhuma instância do agente livre no perfil {self.profile.name!r}"
+                    )
+                self._cond.wait(remaining)
+            instance = self._idle.pop()
+            self._in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self._in_use)
+            self.checkouts += 1
+            waited = time.monotonic() - started
+            self.wait_seconds += waited
+            self.max_wait = max(self.max_wait, waited)
+        return instance
+
+    def _release(self, instance, failed: Optional[bool]):
+        """failed=None: erro do serviço do modelo, não conta nem zera a sequência"""
+        with self._cond:
+            self._in_use -= 1
+            key = id(instance)
+            if failed is None:
+                self.upstream_errors += 1
+            elif failed:
+                self.failures += 1
+                self._failures[key] = self._failures.get(key, 0) + 1
+            else:
+                self._failures[key] = 0
+            if self._failures.get(key, 0) >= AGENT_MAX_FAILURES:
+                # Instância com defeito: sai do pool e é reposta
+                del self._failures[key]
+                self._live -= 1
+                discard = True
+            else:
+                self._idle.append(instance)
+                self._cond.notify()
+                discard = False
+        if discard:
+            self._replace_later()
+
+    def _replace_later(self):
+        with self._cond:
+            self._replacing += 1
+        threading.Thread(
+            target=self._replace, name=f"agent-pool-{self.profile.name}", daemon=True
+        ).start()
+
+    def _replace(self):
+        try:
+            while not self._closed:
+                try:
+                    instance = self._build()
+                except Exception as e:
+                    with self._cond:
+                        self.replace_errors += 1
+                    eventlog.log("agent_pool.replace_error", level="error", exc=e,
+                                 profile=self.profile.name)
+                    time.sleep(REPLACE_RETRY_INTERVAL)
+                    continue
+                self._add(instance, replaced=True)
+                return
+        finally:
+            with self._cond:
+                self._replacing -= 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "model": self.profile.model,
+                "size": self.size,
+                "live": self._live,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "peak_in_use": self.peak_in_use,
+                "utilization": round(self._in_use / self.size, 3),
+                "checkouts": self.checkouts,
+                "waited": self.waited,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+                "upstream_errors": self.upstream_errors,
+                "replacing": self._replacing,
+                "replaced": self.replaced,
+                "replace_errors": self.replace_errors,
+            }
+
+
+class PoolRegistry:
+    """Pools por nome de perfil"""
+
+    def __init__(self):
+        self.pools = {}
+
+    def __bool__(self) -> bool:
+        return DEFAULT_PROFILE in self.pools
+
+    def start(self, profiles: dict, factory: Callable):
+        """Constrói os pools; erro no default é propagado, nos demais só logado"""
+        for name, profile in profiles.items():
+            pool = AgentPool(profile, factory)
+            try:
+                pool.fill()
+            except Exception as e:
+                if name == DEFAULT_PROFILE:
+                    raise
+                eventlog.log("agent_pool.profile_unavailable", level="error", exc=e, profile=name)
+                continue
+            self.pools[name] = pool
+
+    def get(self, name: Optional[str] = None) -> AgentPool:
+        pool = self.pools.get(name or DEFAULT_PROFILE)
+        if pool is None:
+            raise UnknownProfile(name)
+        return pool
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+    def stats(self) -> dict:
+        return {name: pool.stats() for name, pool in self.pools.items()}
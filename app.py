@@ -4,23 +4,66 @@ Implementação oficial conforme: https://docs.cloud.google.com/agent-builder/ag
 """
 
 import os
+import time
 import uuid
-from typing import Optional
+from typing import Literal, Optional
 from dotenv import load_dotenv
 
 # FastAPI setup
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, WebSocket
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 
 # Vertex AI
 import vertexai
-from vertexai import agent_engines, rag
+from vertexai import agent_engines
+
+from admission import (
+    MAX_IN_FLIGHT,
+    MAX_QUEUE,
+    MAX_QUEUE_TIME,
+    AdmissionController,
+    AdmissionRejected,
+)
+from conversation_log import ConversationLog
+from conversation_store import DEFAULT_PAGE_SIZE, ConversationStore, estimate_tokens
+from fast_json import FastJSONResponse
+from gcp_setup import app_target
+from rate_limit import RateLimiter, client_identity
+from retrieval import corpus_names, corpus_names_from_env, federated_search, format_chunks
+from retrieval import cache as retrieval_cache
+from retrieval import stats as retrieval_stats
+from rerank import RERANK_CANDIDATES, RERANK_TOP_N, rerank
+from rerank import stats as rerank_stats
+import agent_pool
+import chat_jobs
+import checkpoint
+import output_budget
+import corpus_version
+import eventlog
+import prefetch
+import scheduler
+import profiler
+from traffic import TrafficRecorder
+from ws_session import ChatSession
+from ws_session import stats as ws_stats
+from usage import CHAT_INCLUDE_USAGE, UsageCallbackHandler, UsageLedger, fit_history
+from deadline import (
+    Deadline,
+    DeadlineCallbackHandler,
+    DeadlineExceeded,
+    RequestCancelled,
+    deadline_from_request,
+    deadline_scope,
+    run_until_deadline,
+)
 
 load_dotenv()
-PROJECT_ID = os.getenv("GCP_PROJECT_ID", "marqu-443914")
-LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+# GCP_PROJECT_ID/GCP_LOCATION (a mesma resolução do eval_retrieval --backend live)
+PROJECT_ID, LOCATION = app_target()
 PORT = int(os.getenv("PORT", 8000))
 
 # Inicializa Vertex AI
@@ -30,6 +73,12 @@ vertexai.init(project=PROJECT_ID, location=LOCATION)
 CORPUS_ID = os.getenv("CORPUS_ID", "3527444408137940992")
 CORPUS_DISPLAY_NAME = "serh-novo"
 
+# Corpus consultados em paralelo pela ferramenta (CORPUS_IDS, padrão CORPUS_ID)
+CORPUS_NAMES = corpus_names_from_env(PROJECT_ID, LOCATION, CORPUS_ID)
+
+# Diretório do log de conversas (sobrevive a deploys/quedas); vazio desativa
+CONVERSATION_LOG_DIR = os.getenv("CONVERSATION_LOG_DIR")
+
 # ============================================================================
 # FERRAMENTA: Busca em RAG SERH (conforme documentação oficial)
 # ============================================================================
@@ -49,44 +98,57 @@ def search_serh_corpus(query: str) -> str:
             Retorna mensagem se nenhum documento relevante for encontrado.
     """
     try:
-        # Obtém o corpus pelo ID
-        corpus = rag.get_corpus(
-            name=f"projects/{PROJECT_ID}/locations/{LOCATION}/ragCorpora/{CORPUS_ID}"
-        )
-        
-        if not corpus:
-            return "Erro: Corpus SERH não encontrado. Verifique o ID."
+        # Usa a busca adiantada pelo /chat se a consulta for parecida com a
+        # mensagem do usuário
+        chunks = prefetch.lookup(query)
+        if chunks is None:
+            chunks = _search_chunks(query)
         
-        # Realiza retrieval query
-        response = rag.retrieval_query(
-            corpus_name=corpus.name,
-            text=query,
-            similarity_top_k=3,
-        )
-        
-        # Formata resultados
-        if response.responses:
-            all_results = []
-            for r in response.responses:
-                if r.relevant_documents:
-                    for doc in r.relevant_documents:
-                        text = doc.chunk_data.text[:500]  # Limita tamanho
-                        all_results.append(f"• {text}")
-            
-            if all_results:
-                return "\n".join(all_results)
+        if chunks:
+            return format_chunks(chunks)
         
         return "Nenhum documento relevante encontrado para sua pergunta."
     
+    except (DeadlineExceeded, RequestCancelled):
+        return "Erro: tempo limite da consulta ao corpus esgotado."
+    
+    except scheduler.SlotTimeout:
+        # Não é falta de documentos: o agente deve dizer que a busca falhou
+        return (
+            "Erro: busca indisponível no momento (serviço sobrecarregado). "
+            "Os documentos não foram consultados; informe ao usuário e peça "
+            "para tentar novamente em instantes."
+        )
+    
     except Exception as e:
         return f"Erro ao consultar corpus: {str(e)}"
 
 
+def _search_chunks(query: str) -> list:
+    """Trechos mais relevantes para a consulta (sem formatação)"""
+    # Consulta os corpus do perfil do turno em paralelo, sob a deadline da
+    # requisição; corpus atrasados são descartados
+    corpora = _profile_corpora()
+    if RERANK_CANDIDATES > RERANK_TOP_N:
+        # Busca mais candidatos e deixa só os melhores após o re-ranking
+        chunks = federated_search(query, corpora, top_k=RERANK_CANDIDATES)
+        return rerank(query, chunks, RERANK_TOP_N)
+    return federated_search(query, corpora)
+
+
+def _profile_corpora() -> list:
+    """Corpus do perfil do agente no turno atual (padrão: CORPUS_NAMES)"""
+    profile = agent_pool.current_profile()
+    if profile is None or not profile.corpus_ids:
+        return CORPUS_NAMES
+    return corpus_names(PROJECT_ID, LOCATION, profile.corpus_ids)
+
+
 # ============================================================================
 # CRIAR AGENTE LANGGRAPH (conforme documentação oficial)
 # ============================================================================
 
-def create_serh_agent():
+def create_serh_agent(profile: agent_pool.AgentProfile):
     """Cria agente SERH usando Vertex AI Agent Engine com LangGraph.
     
     Implementação exata conforme:
@@ -97,23 +159,29 @@ def create_serh_agent():
     2. Define ferramenta: search_serh_corpus (função Python com docstring)
     3. Define instruções do sistema
     4. Cria LanggraphAgent com modelo, ferramenta e instruções
+    
+    Chamado pelo pool (agent_pool.py) para cada instância de cada perfil.
     """
     
-    # Etapa 1: Configurar o modelo
-    model = "gemini-2.0-flash"
+    # Etapa 1: Configurar o modelo (do perfil; padrão gemini-2.0-flash)
+    model = profile.model
     
-    model_kwargs = {
-        "temperature": 0.7,
-        "max_output_tokens": 1024,
-    }
+    model_kwargs = profile.model_kwargs()
     
     # Etapa 3: Criar o agente
     # Para versão 1.43.0 do vertexai, remover system_instruction 
     # (será adicionado via prompt customizado se necessário)
+    # Etapa 4: checkpointer (MemorySaver ou SQLite) guarda o estado de cada
+    # thread; cada turno envia só a mensagem nova
     agent = agent_engines.LanggraphAgent(
         model=model,
         model_kwargs=model_kwargs,
         tools=[search_serh_corpus],  # Nossa ferramenta Python
+        # max_output_tokens configurável por turno e instrução de tamanho
+        # fora das mensagens guardadas (output_budget.py)
+        model_builder=output_budget.build_model,
+        runnable_kwargs={"prompt": output_budget.length_prompt},
+        **checkpoint.agent_kwargs(),
     )
     
     return agent
@@ -129,6 +197,60 @@ app = FastAPI(
     version="3.0-oficial"
 )
 
+# Rate limiting por cliente (API key ou IP) e por rota
+rate_limiter = RateLimiter.from_env()
+
+# Registrado antes do CORS para que as respostas 429 também levem os
+# headers de CORS (o último middleware adicionado é o mais externo)
+@app.middleware("http")
+async def rate_limit_middleware(request: Request, call_next):
+    """Aplica o token bucket do cliente à rota requisitada"""
+    limit = rate_limiter.limit_for(request.url.path)
+    if limit is None or request.method == "OPTIONS":
+        return await call_next(request)
+    # Consultar o andamento de um job não gasta a cota do /chat
+    if request.method == "GET" and request.url.path.startswith("/chat/jobs/"):
+        return await call_next(request)
+    
+    client = client_identity(request.headers, request.client.host if request.client else None)
+    if rate_limiter.backend.blocking:
+        decision = await run_in_threadpool(rate_limiter.check, client, limit)
+    else:
+        decision = rate_limiter.check(client, limit)
+    
+    headers = {
+        "X-RateLimit-Limit": f"{limit.burst:g}",
+        "X-RateLimit-Remaining": str(int(decision.remaining)),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(decision.retry_after)
+        return JSONResponse(
+            {"error": "Limite de requisições excedido. Tente novamente mais tarde."},
+            status_code=429,
+            headers=headers
+        )
+    
+    response = await call_next(request)
+    response.headers.update(headers)
+    return response
+
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    """Request ID (X-Request-ID do cliente ou gerado) nos logs e na resposta"""
+    request_id = request.headers.get("X-Request-ID", "")[:64] or eventlog.new_request_id()
+    started = time.perf_counter()
+    with eventlog.bind(request_id=request_id):
+        response = await call_next(request)
+        eventlog.log(
+            "http.request",
+            method=request.method,
+            path=request.url.path,
+            status=response.status_code,
+            latency_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -139,11 +261,36 @@ app.add_middleware(
 
 # Estado: armazena conversas em memória
 # Chave: conversation_id
-# Valor: lista de tuplas (role, content)
-conversations: dict = {}
+# Valor: Conversation com lista de tuplas (role, content) e contadores
+conversations = ConversationStore()
+
+# Tokens gastos por conversa e por cliente
+usage_ledger = UsageLedger()
+
+# Gravador de tráfego do /chat (None se TRAFFIC_RECORD_PATH não definido)
+traffic_recorder = TrafficRecorder.from_env()
+
+# Thread do checkpointer de cada conversa (None com CHECKPOINTER=none)
+threads = checkpoint.ThreadTracker() if checkpoint.CHECKPOINTER != "none" else None
+
+# Instâncias do agente por perfil - construídas na startup
+agent_pools = agent_pool.PoolRegistry()
 
-# Agente global - inicializado na startup
-agent: Optional[object] = None
+# Fila de turnos assíncronos (POST /chat/jobs) - iniciada na startup
+job_manager: Optional[chat_jobs.JobManager] = None
+
+# Verificação de versão dos corpus (invalida os caches) - iniciada na startup
+corpus_tracker: Optional[corpus_version.CorpusVersionTracker] = None
+
+# Log append-only das conversas - aberto na startup (opcional)
+conversation_log: Optional[ConversationLog] = None
+
+# Controle de admissão na frente do agente
+admission = AdmissionController(
+    max_in_flight=MAX_IN_FLIGHT,
+    max_queue=MAX_QUEUE,
+    max_queue_time=MAX_QUEUE_TIME,
+)
 
 # ============================================================================
 # MODELOS PYDANTIC
@@ -153,12 +300,22 @@ class Message(BaseModel):
     """Mensagem do usuário para o chat"""
     text: str
     conversation_id: Optional[str] = None
+    timeout: Optional[float] = None  # segundos que o cliente aceita esperar
+    include_usage: Optional[bool] = None  # padrão: CHAT_INCLUDE_USAGE
+    profile: Optional[str] = None  # perfil do agente (header X-Agent-Profile)
+    answer_length: Optional[Literal["short", "normal", "long"]] = None  # dica de tamanho
+    max_words: Optional[int] = None  # meta de palavras da resposta
+
+class ChatJobRequest(Message):
+    """Turno enfileirado em POST /chat/jobs"""
+    callback_url: Optional[str] = None  # recebe um POST com o resultado
 
 class ChatResponse(BaseModel):
     """Resposta do agente"""
     response: str
     conversation_id: str
     turn_count: int
+    usage: Optional[dict] = None  # só com include_usage
 
 # ============================================================================
 # INICIALIZAÇÃO
@@ -167,18 +324,46 @@ class ChatResponse(BaseModel):
 @app.on_event("startup")
 def startup():
     """Inicializa o agente na startup da aplicação"""
-    global agent
+    global conversation_log, corpus_tracker, job_manager
+    if traffic_recorder:
+        traffic_recorder.start()
+        print(f"✓ Gravando tráfego do /chat em {traffic_recorder.path} "
+              f"(amostra {traffic_recorder.sample_rate:.0%})")
+    
+    if CONVERSATION_LOG_DIR:
+        conversation_log = ConversationLog(CONVERSATION_LOG_DIR, snapshot_provider=conversations.snapshot)
+        conversations.load(conversation_log.recover())
+        conversation_log.start()
+        conversations.log = conversation_log
+        print(f"✓ Conversas recuperadas: {len(conversations)} "
+              f"({conversation_log.last_recovery_ms:.0f} ms)")
+    
     try:
         print(f"Iniciando agente...")
         print(f"  Project: {PROJECT_ID}")
         print(f"  Location: {LOCATION}")
         print(f"  Corpus ID: {CORPUS_ID}")
+        print(f"  Corpus consultados: {len(CORPUS_NAMES)}")
         
-        agent = create_serh_agent()
+        agent_pools.start(agent_pool.load_profiles(), create_serh_agent)
         print("✓ Agente SERH LangGraph inicializado com sucesso")
-        print(f"  Modelo: gemini-2.0-flash")
+        for name, pool in agent_pools.pools.items():
+            print(f"  Perfil {name}: {pool.profile.model}, {pool.stats()['live']} instâncias")
         print(f"  Ferramentas: search_serh_corpus")
         print(f"  Corpus: {CORPUS_DISPLAY_NAME} ({CORPUS_ID})")
+        
+        # Acompanha todos os corpus consultados (padrão e dos perfis)
+        tracked = set(CORPUS_NAMES)
+        for pool in agent_pools.pools.values():
+            tracked.update(corpus_names(PROJECT_ID, LOCATION, pool.profile.corpus_ids))
+        corpus_tracker = corpus_version.CorpusVersionTracker(sorted(tracked))
+        corpus_tracker.start()
+        
+        if chat_jobs.CHAT_JOB_WORKERS > 0:
+            job_manager = chat_jobs.JobManager.from_env(_run_job)
+            job_manager.start()
+            print(f"✓ Jobs do chat: {job_manager.workers} workers "
+                  f"({type(job_manager.store).__name__})")
     except Exception as e:
         print(f"✗ Erro ao inicializar agente: {e}")
         import traceback
@@ -189,6 +374,20 @@ def startup():
         print(f"  - CORPUS_ID={CORPUS_ID}")
         print(f"  - Google Cloud credentials configuradas")
 
+@app.on_event("shutdown")
+def shutdown():
+    """Grava o que estiver pendente nos logs de conversas, tráfego e eventos"""
+    if conversation_log:
+        conversation_log.close()
+    if traffic_recorder:
+        traffic_recorder.close()
+    if job_manager:
+        job_manager.close()
+    agent_pools.close()
+    if corpus_tracker:
+        corpus_tracker.close()
+    eventlog.logger.close()
+
 # ============================================================================
 # ENDPOINTS
 # ============================================================================
@@ -199,13 +398,16 @@ def root():
     return {
         "name": "SERH RAG Chatbot",
         "version": "3.0-oficial",
-        "status": "ok" if agent else "initializing",
+        "status": "ok" if agent_pools else "initializing",
         "endpoints": {
             "health": "/health",
             "docs": "/docs",
             "chat": "/chat",
             "conversation": "/conversation/{id}",
-            "conversations": "/conversations"
+            "conversations": "/conversations",
+            "chat_ws": "/ws/chat",
+            "chat_jobs": "/chat/jobs",
+            "metrics": "/metrics"
         }
     }
 
@@ -213,121 +415,566 @@ def root():
 def health():
     """Health check do serviço"""
     return {
-        "status": "ok" if agent else "initializing",
+        "status": "ok" if agent_pools else "initializing",
         "version": "3.0-oficial",
-        "model": "gemini-2.0-flash",
+        "model": agent_pools.get().profile.model if agent_pools else None,
+        "profiles": list(agent_pools.pools),
         "framework": "Vertex AI Agent Engine + LangGraph",
         "corpus": CORPUS_DISPLAY_NAME,
     }
 
-@app.post("/chat")
-def chat(msg: Message) -> ChatResponse:
+@app.get("/metrics")
+def metrics():
+    """Métricas internas do serviço"""
+    return {
+        "admission": admission.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "conversation_log": conversation_log.stats() if conversation_log else None,
+        "retrieval": retrieval_stats.snapshot(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "corpus_version": corpus_tracker.stats() if corpus_tracker else None,
+        "rerank": rerank_stats.snapshot(),
+        "usage": usage_ledger.stats(),
+        "output_budget": output_budget.stats.snapshot(),
+        "websocket": ws_stats.snapshot(),
+        "prefetch": prefetch.stats.snapshot(),
+        "checkpoint": threads.stats() if threads else None,
+        "traffic_recorder": traffic_recorder.stats() if traffic_recorder else None,
+        "agent_pool": agent_pools.stats(),
+        "scheduler": scheduler.stats(),
+        "chat_jobs": job_manager.stats() if job_manager else None,
+        "log": eventlog.logger.stats(),
+    }
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10, interval_ms: float = 10,
+                        format: str = "collapsed", include_idle: bool = False):
+    """Profile por amostragem de todas as threads durante `seconds` segundos.
+    
+    Exige o header X-Debug-Token igual a PROFILER_TOKEN (sem token configurado
+    o endpoint não existe). Só um profile roda por vez (409 se houver outro).
+    
+    Params:
+        seconds: Duração da amostragem (máx. PROFILER_MAX_SECONDS)
+        interval_ms: Intervalo entre amostras
+        format: "collapsed" (arquivo para flamegraph.pl/speedscope) ou "json"
+        include_idle: Inclui threads ociosas
+    """
+    if not profiler.PROFILER_TOKEN:
+        return JSONResponse({"error": "Not Found"}, status_code=404)
+    if not profiler.authorized(request.headers.get("X-Debug-Token")):
+        return JSONResponse({"error": "Não autorizado"}, status_code=401)
+    if profiler.is_running():
+        return JSONResponse({"error": "Já existe um profile em andamento"}, status_code=409)
+    
+    # Amostra numa thread do pool: o event loop continua servindo (e aparece
+    # no profile)
+    try:
+        result = await run_in_threadpool(profiler.sample, seconds, interval_ms / 1000, include_idle)
+    except profiler.ProfilerBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    
+    if format == "json":
+        return {**result.summary(), "collapsed": result.collapsed().splitlines()}
+    
+    filename = f"serh-profile-{int(time.time())}.folded"
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(result.samples),
+        }
+    )
+
+@app.post("/chat", response_model_exclude_none=True)
+async def chat(msg: Message, request: Request) -> ChatResponse:
     """Chat com o agente SERH com suporte a multi-turn conversations.
     
     Segue padrão oficial de agent.query():
     - input: {"messages": [(role, content), ...]}
     - config: {"configurable": {"thread_id": conversation_id}}
     
+    Cada requisição tem uma deadline (header X-Request-Timeout, campo
+    `timeout` ou CHAT_DEADLINE_SECONDS). O tempo restante é propagado para a
+    busca no corpus e para cada rodada do modelo; se o prazo acabar ou o
+    cliente desconectar, o turno é abandonado e não entra no histórico.
+    
+    O controle de admissão limita os turnos simultâneos: com a fila cheia
+    responde 429, e se a espera na fila estourar responde 503 (ambos com
+    Retry-After). Sem instância livre no pool do perfil (ou sem vaga no
+    escalonador de prioridade), também 503.
+    
     Params:
         msg.text: Mensagem do usuário
         msg.conversation_id: ID da conversa (gerado se não fornecido)
+        msg.timeout: Tempo máximo de espera em segundos (opcional)
+        msg.include_usage: Inclui os tokens gastos no turno (opcional)
+        msg.profile: Perfil do agente (opcional; ou header X-Agent-Profile)
+        msg.answer_length: "short", "normal" ou "long" (opcional)
+        msg.max_words: Meta de palavras da resposta (opcional)
     
     Returns:
-        ChatResponse com resposta, conversation_id e turn_count
+        ChatResponse com resposta, conversation_id, turn_count e, se pedido,
+        usage
     """
+    arrived = time.time()
+    result = await _handle_chat(msg, request)
     
-    if not agent:
+    # Gravação amostrada do tráfego (opt-in, só enfileira)
+    if traffic_recorder:
+        if isinstance(result, ChatResponse):
+            conversation_id, status = result.conversation_id, 200
+        else:
+            conversation_id, status = msg.conversation_id, result.status_code
+        traffic_recorder.record(
+            arrived, conversation_id, msg.conversation_id is None, msg.text,
+            msg.timeout, status, time.time() - arrived
+        )
+    return result
+
+
+async def _handle_chat(msg: Message, request: Request):
+    """Admissão, deadline e execução de um turno do /chat"""
+    if not agent_pools:
         return JSONResponse(
             {"error": "Agente não inicializado. Aguarde startup..."},
             status_code=503
         )
     
+    msg.profile = msg.profile or request.headers.get("X-Agent-Profile")
+    if msg.profile and msg.profile not in agent_pools.pools:
+        return JSONResponse({"error": f"Perfil desconhecido: {msg.profile}"}, status_code=400)
+    
+    deadline = deadline_from_request(
+        request.headers.get("X-Request-Timeout"), msg.timeout
+    )
+    client = client_identity(request.headers, request.client.host if request.client else None)
+    eventlog.set_context(conversation_id=msg.conversation_id)
+    
     try:
+        # A vaga segue ocupada até a thread do turno terminar, mesmo se a
+        # resposta sair antes por deadline ou desconexão
+        async with admission.slot(max_wait=deadline.remaining()) as slot:
+            return await run_until_deadline(
+                request, deadline, _chat_turn, msg, deadline, client, hold=slot.hold
+            )
+    
+    except AdmissionRejected as e:
+        eventlog.log("chat.rejected", level="warning", status=e.status_code, reason=e.reason)
+        return JSONResponse(
+            {"error": e.reason},
+            status_code=e.status_code,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    except DeadlineExceeded:
+        eventlog.log("chat.deadline_exceeded", level="warning", timeout=deadline.timeout)
+        return JSONResponse(
+            {"error": f"Tempo limite de {deadline.timeout:.0f}s esgotado"},
+            status_code=504
+        )
+    
+    except (agent_pool.PoolTimeout, scheduler.SlotTimeout) as e:
+        eventlog.log("chat.pool_timeout", level="warning", profile=msg.profile)
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    
+    except RequestCancelled:
+        # Cliente já desconectou; status apenas para os logs de acesso
+        eventlog.log("chat.cancelled")
+        return JSONResponse({"error": "Requisição cancelada"}, status_code=499)
+    
+    except Exception as e:
+        # Só enfileira: traceback formatado e escrito pela thread do log
+        eventlog.log("chat.error", level="error", exc=e)
+        return JSONResponse(
+            {"error": str(e)},
+            status_code=500
+        )
+
+
+def _chat_turn(msg: Message, deadline, client: Optional[str] = None,
+               on_event=None) -> ChatResponse:
+    """Executa um turno da conversa (bloqueante, roda em thread).
+    
+    Com `on_event`, o agente roda em modo streaming e cada trecho da resposta
+    é repassado a on_event antes do fim do turno (usado pelo WebSocket).
+    """
+    
+    with deadline_scope(deadline):
         # Gera ou reutiliza conversation_id
         conversation_id = msg.conversation_id or str(uuid.uuid4())
+        eventlog.set_context(conversation_id=conversation_id)
         
-        # Obtém ou cria histórico de conversa
-        if conversation_id not in conversations:
-            conversations[conversation_id] = []
+        # Obtém a janela ativa do histórico (a conversa só é criada ao fim do
+        # turno; mensagens antigas ficam comprimidas e não vão para o agente)
+        conversation = conversations.get(conversation_id)
+        history = list(conversation.active) if conversation else []
         
-        messages_list = conversations[conversation_id]
+        # Orçamento da conversa: compacta o histórico em vez de deixar o
+        # prompt crescer sem limite
+        spent = usage_ledger.conversation(conversation_id)
+        spent_tokens = spent.total_tokens if spent else 0
+        if threads is not None:
+            # O checkpointer já tem o estado da thread: o input leva só a
+            # mensagem nova (e o histórico compactado quando a thread é nova)
+            thread_id, history, compacted = threads.plan(conversation_id, history, spent_tokens)
+        else:
+            history, compacted = fit_history(history, spent_tokens)
+            thread_id = conversation_id
+        if compacted:
+            usage_ledger.record_compaction()
         
-        # Adiciona mensagem do usuário
-        messages_list.append(("user", msg.text))
+        # Instância do pool do perfil, reservada só durante a chamada ao agente
+        pool = agent_pools.get(msg.profile)
+        
+        # Orçamento de geração: classe da pergunta, dica do cliente e o que
+        # resta do orçamento da conversa
+        budget = output_budget.plan(
+            msg.text, pool.profile.max_output_tokens, msg.answer_length,
+            msg.max_words, spent_tokens,
+        )
         
         # Prepara input para o agente conforme documentação oficial
-        # Format: lista de tuplas (role, content)
+        # Format: lista de tuplas (role, content). A mensagem do usuário só
+        # entra no histórico quando o turno termina dentro do prazo.
         agent_input = {
-            "messages": messages_list
+            "messages": [turn.as_tuple() for turn in history] + [("user", msg.text)]
         }
         
         # Configura thread_id para persistência de conversa (Etapa 3 da doc)
+        # e o teto de geração e a instrução de tamanho do turno (ficam fora do
+        # estado da thread); interrompe o agente entre rodadas
+        # quando a deadline acaba; o UsageCallbackHandler conta os tokens de
+        # cada rodada
+        usage_handler = UsageCallbackHandler()
         config = {
-            "configurable": {
-                "thread_id": conversation_id
-            }
+            "configurable": {"thread_id": thread_id, **budget.configurable()},
+            "callbacks": [DeadlineCallbackHandler(deadline), usage_handler],
         }
         
-        # Chama agente.query() - padrão oficial
-        response = agent.query(
-            input=agent_input,
-            config=config
-        )
+        try:
+            # Busca especulativa: a primeira rodada do modelo quase sempre chama
+            # search_serh_corpus com algo parecido com a mensagem do usuário
+            # (o perfil entra antes para que a busca adiantada use os corpus dele).
+            # A vaga do agente segue a prioridade do turno (scheduler.py)
+            with scheduler.agent.slot(timeout=deadline.remaining()), \
+                    pool.checkout(timeout=deadline.remaining()) as agent, \
+                    agent_pool.profile_scope(pool.profile), \
+                    prefetch.prefetch_scope(msg.text, _search_chunks):
+                if on_event is None:
+                    # Chama agente.query() - padrão oficial
+                    response = agent.query(
+                        input=agent_input,
+                        config=config
+                    )
+                    
+                    # Extrai resposta do dicionário retornado
+                    assistant_message = _extract_response(response)
+                else:
+                    assistant_message = _stream_turn(agent, agent_input, config, on_event)
+            
+            # Tokens são cobrados mesmo se o turno for descartado
+            usage_ledger.record(conversation_id, client, usage_handler.usage)
+            output_budget.stats.record(
+                budget, usage_handler.usage.completion_tokens, usage_handler.usage.rounds
+            )
+            
+            # Cliente desistiu ou prazo acabou: descarta o turno
+            deadline.check()
+        except BaseException:
+            # A thread pode ter guardado parte do turno descartado
+            if threads is not None:
+                threads.invalidate(conversation_id)
+            raise
         
-        # Extrai resposta do dicionário retornado
-        assistant_message = _extract_response(response)
+        if threads is not None:
+            usage = usage_handler.usage
+            threads.record(
+                conversation_id,
+                estimate_tokens(msg.text) + estimate_tokens(assistant_message) + usage.tool_tokens,
+                messages=2 + 2 * max(usage.rounds - 1, 0),
+            )
         
-        # Adiciona resposta ao histórico
-        messages_list.append(("assistant", assistant_message))
+        # Adiciona mensagem e resposta ao histórico (e ao log de conversas,
+        # com os índices atribuídos sob o lock do store)
+        conversation, _ = conversations.append_turn(conversation_id, msg.text, assistant_message)
+        
+        include_usage = CHAT_INCLUDE_USAGE if msg.include_usage is None else msg.include_usage
         
         return ChatResponse(
             response=assistant_message,
             conversation_id=conversation_id,
-            turn_count=len([m for m in messages_list if m[0] == "user"])
+            turn_count=conversation.user_turns,
+            usage={**usage_handler.usage.as_dict(), "rounds_detail": usage_handler.rounds,
+                   "history_compacted": compacted, "output_budget": budget.as_dict()}
+                  if include_usage else None
         )
+
+def _stream_turn(agent, agent_input: dict, config: dict, on_event) -> str:
+    """Roda o agente com stream_query e repassa os trechos da resposta.
     
-    except Exception as e:
-        print(f"✗ Erro no chat: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(
-            {"error": str(e)},
-            status_code=500
+    Com stream_mode="messages" o LangGraph emite (mensagem, metadata) a cada
+    pedaço gerado pelo modelo. Trechos de texto do modelo viram eventos
+    "chunk"; resultados de ferramenta viram eventos "tool".
+    
+    Returns:
+        Texto completo da resposta (concatenação dos trechos)
+    """
+    parts = []
+    for event in agent.stream_query(input=agent_input, config=config, stream_mode="messages"):
+        message = event[0] if isinstance(event, (list, tuple)) and event else event
+        kind, content, name = _message_fields(message)
+        
+        if kind.startswith("Tool"):
+            on_event({"type": "tool", "name": name})
+        elif kind.startswith("AI") and content:
+            parts.append(content)
+            on_event({"type": "chunk", "text": content})
+    
+    return "".join(parts)
+
+
+def _message_fields(message) -> tuple:
+    """(tipo, texto, nome) de uma mensagem do stream.
+    
+    Aceita o objeto do LangChain ou o dict serializado (dumpd) devolvido
+    pelo stream_query.
+    """
+    if isinstance(message, dict):
+        kind = (message.get("id") or [""])[-1] or message.get("type", "")
+        fields = message.get("kwargs", message)
+    else:
+        kind = type(message).__name__
+        fields = {"content": getattr(message, "content", ""), "name": getattr(message, "name", None)}
+    
+    if kind in ("ai", "tool"):
+        kind = kind.capitalize() + "Message"
+    
+    content = fields.get("content") or ""
+    if isinstance(content, list):
+        # Gemini pode devolver partes; só o texto interessa
+        content = "".join(
+            p.get("text", "") if isinstance(p, dict) else str(p) for p in content
         )
+    return kind, content, fields.get("name")
+
+@app.websocket("/ws/chat")
+async def chat_ws(websocket: WebSocket, conversation_id: Optional[str] = None):
+    """Chat por WebSocket: uma conexão ligada a uma conversa.
+    
+    O cliente envia {"text": "...", "id": "opcional", "timeout": s,
+    "include_usage": bool, "profile": "opcional", "answer_length": "short",
+    "max_words": N} e pode enviar várias mensagens sem esperar as
+    respostas; os turnos são processados em ordem. Para cada mensagem o
+    servidor envia:
+        {"type": "start", "id"}
+        {"type": "tool", "id", "name"}          (a cada busca no corpus)
+        {"type": "chunk", "id", "text"}         (trechos da resposta)
+        {"type": "end", "id", "turn_count", "usage"?}
+        {"type": "error", "id", "status", "error", "retry_after"?}
+    
+    Rate limiting (o mesmo do /chat), admissão e deadline valem por mensagem.
+    """
+    await websocket.accept()
+    session = ChatSession(websocket, conversation_id or str(uuid.uuid4()))
+    client = client_identity(websocket.headers, websocket.client.host if websocket.client else None)
+    await session.send({"type": "ready", "conversation_id": session.conversation_id})
+    
+    async def error(msg_id, status: int, text: str, retry_after: Optional[int] = None):
+        event = {"type": "error", "id": msg_id, "status": status, "error": text}
+        if retry_after is not None:
+            event["retry_after"] = retry_after
+        await session.send(event)
+    
+    async def handle(data):
+        # Cada mensagem é uma requisição nos logs
+        eventlog.set_context(request_id=eventlog.new_request_id())
+        msg_id = data.get("id") if isinstance(data, dict) else None
+        text = data.get("text") if isinstance(data, dict) else None
+        if not text or not isinstance(text, str):
+            return await error(msg_id, 400, "Campo 'text' obrigatório")
+        if not agent_pools:
+            return await error(msg_id, 503, "Agente não inicializado. Aguarde startup...")
+        profile = data.get("profile")
+        if profile and profile not in agent_pools.pools:
+            return await error(msg_id, 400, f"Perfil desconhecido: {profile}")
+        
+        limit = rate_limiter.limit_for("/chat")
+        if limit is not None:
+            if rate_limiter.backend.blocking:
+                decision = await run_in_threadpool(rate_limiter.check, client, limit)
+            else:
+                decision = rate_limiter.check(client, limit)
+            if not decision.allowed:
+                return await error(msg_id, 429, "Limite de requisições excedido. Tente novamente mais tarde.",
+                                   decision.retry_after)
+        
+        try:
+            msg = Message(
+                text=text,
+                conversation_id=session.conversation_id,
+                timeout=data.get("timeout"),
+                include_usage=data.get("include_usage"),
+                profile=profile,
+                answer_length=data.get("answer_length"),
+                max_words=data.get("max_words"),
+            )
+        except ValueError as e:
+            return await error(msg_id, 400, str(e))
+        deadline = deadline_from_request(None, msg.timeout)
+        
+        def on_event(event: dict):
+            session.send_threadsafe({**event, "id": msg_id}, deadline)
+        
+        try:
+            async with admission.slot(max_wait=deadline.remaining()) as slot:
+                await session.send({"type": "start", "id": msg_id})
+                result = await run_until_deadline(
+                    session, deadline, _chat_turn, msg, deadline, client, on_event,
+                    hold=slot.hold
+                )
+            end = {"type": "end", "id": msg_id, "turn_count": result.turn_count}
+            if result.usage is not None:
+                end["usage"] = result.usage
+            await session.send(end)
+        
+        except AdmissionRejected as e:
+            await error(msg_id, e.status_code, e.reason, e.retry_after)
+        
+        except DeadlineExceeded:
+            await error(msg_id, 504, f"Tempo limite de {deadline.timeout:.0f}s esgotado")
+        
+        except (agent_pool.PoolTimeout, scheduler.SlotTimeout) as e:
+            await error(msg_id, 503, str(e), 1)
+        
+        except RequestCancelled:
+            pass  # cliente desconectou
+        
+        except Exception as e:
+            eventlog.log("ws.error", level="error", exc=e, message_id=msg_id)
+            await error(msg_id, 500, str(e))
+    
+    # As tarefas da sessão herdam o contexto (conversation_id nos logs)
+    eventlog.set_context(conversation_id=session.conversation_id)
+    await session.run(handle)
+
+@app.post("/chat/jobs", status_code=202)
+def submit_chat_job(msg: ChatJobRequest, request: Request):
+    """Enfileira um turno e responde na hora com o job_id (202).
+    
+    Para turnos que podem passar do timeout de proxies/portais. O turno roda
+    num worker com deadline de até CHAT_JOB_TIMEOUT (ou `timeout`, se
+    menor); o resultado sai em GET /chat/jobs/{id} e, com callback_url, num
+    POST para essa URL.
+    """
+    if job_manager is None or not agent_pools:
+        return JSONResponse({"error": "Jobs indisponíveis. Aguarde startup..."}, status_code=503)
+    
+    msg.profile = msg.profile or request.headers.get("X-Agent-Profile")
+    if msg.profile and msg.profile not in agent_pools.pools:
+        return JSONResponse({"error": f"Perfil desconhecido: {msg.profile}"}, status_code=400)
+    if msg.callback_url:
+        error = chat_jobs.callback_error(msg.callback_url)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+    
+    # O conversation_id é definido já na criação para o cliente poder
+    # continuar a conversa (ou consultar o histórico) sem esperar o job
+    request_body = jsonable_encoder(msg, exclude={"callback_url"})
+    request_body["conversation_id"] = msg.conversation_id or str(uuid.uuid4())
+    client = client_identity(request.headers, request.client.host if request.client else None)
+    
+    try:
+        job = job_manager.submit(request_body, client, msg.callback_url)
+    except chat_jobs.QueueFull as e:
+        return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
+    
+    status_url = f"/chat/jobs/{job.id}"
+    return JSONResponse(
+        {"job_id": job.id, "status": job.status,
+         "conversation_id": request_body["conversation_id"], "status_url": status_url},
+        status_code=202,
+        headers={"Location": status_url},
+    )
+
+@app.get("/chat/jobs/{job_id}")
+def get_chat_job(job_id: str):
+    """Situação de um job: queued, running, done (com result) ou failed
+    (com error)"""
+    job = job_manager.get(job_id) if job_manager else None
+    if job is None:
+        return JSONResponse({"error": "Job não encontrado"}, status_code=404)
+    return job.public()
+
+def _run_job(job: chat_jobs.Job) -> tuple:
+    """Executa o turno de um job (thread do JobManager); (status, corpo)"""
+    msg = Message(**job.request)
+    timeout = min(msg.timeout or chat_jobs.CHAT_JOB_TIMEOUT, chat_jobs.CHAT_JOB_TIMEOUT)
+    deadline = Deadline(timeout)
+    
+    # Jobs são trabalho em lote: cedem a vez ao chat ao vivo no agente e na
+    # busca, com teto próprio de execuções simultâneas
+    with eventlog.bind(request_id=job.id, conversation_id=msg.conversation_id), \
+            scheduler.priority_scope(scheduler.BATCH):
+        try:
+            result = _chat_turn(msg, deadline, job.client)
+        except DeadlineExceeded:
+            return 504, {"error": f"Tempo limite de {timeout:.0f}s esgotado"}
+        except (agent_pool.PoolTimeout, scheduler.SlotTimeout) as e:
+            return 503, {"error": str(e)}
+        except Exception as e:
+            eventlog.log("chat_job.error", level="error", exc=e)
+            return 500, {"error": str(e)}
+    return 200, jsonable_encoder(result, exclude_none=True)
 
 @app.get("/conversation/{conversation_id}")
-def get_conversation(conversation_id: str):
-    """Retorna o histórico completo de uma conversa"""
+def get_conversation(conversation_id: str, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Retorna o histórico de uma conversa.
+    
+    Sem `limit`, devolve o histórico completo. Com `limit`, devolve uma página
+    de mensagens a partir de `cursor` (o next_cursor da página anterior).
+    """
     
-    if conversation_id not in conversations:
+    conversation = conversations.get(conversation_id)
+    if conversation is None:
         return JSONResponse(
             {"error": "Conversa não encontrada"},
             status_code=404
         )
     
-    messages = conversations[conversation_id]
+    total = conversation.message_count
+    try:
+        start = int(cursor) if cursor else 0
+    except ValueError:
+        return JSONResponse({"error": "Cursor inválido"}, status_code=400)
+    if not 0 <= start <= total:
+        return JSONResponse({"error": "Cursor fora do histórico"}, status_code=400)
+    end = total if limit is None else min(total, start + max(1, limit))
+    usage = usage_ledger.conversation(conversation_id)
     
-    return {
+    # Mensagens antigas são descompactadas só aqui, e só os blocos da página
+    return FastJSONResponse({
         "conversation_id": conversation_id,
-        "messages": [
-            {"role": role, "content": content}
-            for role, content in messages
-        ],
-        "message_count": len(messages),
-        "user_turns": len([m for m in messages if m[0] == "user"]),
-    }
+        "messages": [turn.as_dict() for turn in conversation.turns(start, end)],
+        "message_count": total,
+        "user_turns": conversation.user_turns,
+        "usage": usage.as_dict() if usage else None,
+        "next_cursor": str(end) if end < total else None,
+    })
 
 @app.delete("/conversation/{conversation_id}")
 def delete_conversation(conversation_id: str):
     """Deleta uma conversa do histórico"""
     
-    if conversation_id not in conversations:
+    if not conversations.delete(conversation_id):
         return JSONResponse(
             {"error": "Conversa não encontrada"},
             status_code=404
         )
     
-    del conversations[conversation_id]
+    usage_ledger.forget(conversation_id)
+    if threads is not None:
+        threads.forget(conversation_id)
     
     return {
         "status": "deleted",
@@ -335,20 +982,25 @@ def delete_conversation(conversation_id: str):
     }
 
 @app.get("/conversations")
-def list_conversations():
-    """Lista todas as conversas ativas"""
+def list_conversations(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, order: str = "desc"):
+    """Lista as conversas ativas por última atividade, paginadas por cursor.
     
-    return {
+    Params:
+        limit: Conversas por página (máx. 500)
+        cursor: next_cursor da página anterior
+        order: "desc" (mais recentes primeiro) ou "asc"
+    """
+    
+    try:
+        page, next_cursor = conversations.page(limit=limit, cursor=cursor, order=order)
+    except ValueError:
+        return JSONResponse({"error": "Cursor inválido"}, status_code=400)
+    
+    return FastJSONResponse({
         "total_conversations": len(conversations),
-        "conversations": [
-            {
-                "id": cid,
-                "message_count": len(msgs),
-                "user_turns": len([m for m in msgs if m[0] == "user"]),
-            }
-            for cid, msgs in conversations.items()
-        ]
-    }
+        "conversations": [c.summary() for c in page],
+        "next_cursor": next_cursor,
+    })
 
 # ============================================================================
 # HELPERS
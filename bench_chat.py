@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Microbenchmarks dos caminhos quentes do /chat (sem rede)
+
+Troca o agente por um stub (que chama a ferramenta com trechos sintéticos e
+devolve uma resposta fixa) e mede, cada etapa isolada e o /chat inteiro
+chamado direto pela interface ASGI do app, sem servidor nem socket:
+
+    message_validation      Message a partir do JSON da requisição
+    history_build           janela ativa + orçamento -> input do agente
+    extract_response        _extract_response sobre a saída do agente
+    turn_append             append_turn no ConversationStore (contadores)
+    tool_format             rerank + format_chunks de 20 candidatos
+    response_serialization  ChatResponse -> JSON
+    chat_end_to_end         POST /chat pelo ASGI (middlewares, admissão,
+                            thread de trabalho, stub do agente)
+
+A saída é JSON (tempos em µs). Com --save-baseline grava a referência; com
+--baseline compara e marca como regressão a etapa cujo p50 piorou mais que
+--threshold (padrão 20%), saindo com código 1.
+
+Uso:
+    python bench_chat.py --save-baseline bench_baseline.json
+    python bench_chat.py --baseline bench_baseline.json [--threshold 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Sem gravação de tráfego nem log em disco durante o benchmark
+os.environ.pop("TRAFFIC_RECORD_PATH", None)
+os.environ.pop("CONVERSATION_LOG_DIR", None)
+os.environ.setdefault("PREFETCH_ENABLED", "false")
+# Log de acesso fora do stdout do relatório (erros continuam)
+os.environ.setdefault("LOG_SAMPLE_DEFAULT", "0")
+
+import app as chat_app  # noqa: E402
+from agent_pool import DEFAULT_PROFILE, AgentProfile  # noqa: E402
+from retrieval import RetrievedChunk, format_chunks  # noqa: E402
+from rerank import rerank  # noqa: E402
+from usage import fit_history  # noqa: E402
+
+QUESTION = "Como solicito férias no SERH? Preciso parcelar em três períodos."
+ANSWER = (
+    "Para solicitar férias no SERH acesse o módulo Férias > Solicitação, informe "
+    "os períodos desejados e envie para aprovação da chefia imediata. "
+) * 4
+CHUNK_TEXT = (
+    "O servidor acessa o SERH com sua matrícula. No módulo Férias, a solicitação "
+    "pode ser parcelada em até três períodos, respeitado o saldo disponível. "
+) * 5
+
+
+def synthetic_chunks(n: int = 20) -> list:
+    return [
+        RetrievedChunk(text=CHUNK_TEXT, corpus="bench", distance=0.2 + i * 0.02)
+        for i in range(n)
+    ]
+
+
+class StubAgent:
+    """Imita o LanggraphAgent: chama a ferramenta e devolve mensagens"""
+
+    def query(self, input, config=None):
+        context = chat_app.search_serh_corpus(input["messages"][-1][1])
+        return {"messages": [
+            *({"type": role, "content": content} for role, content in input["messages"]),
+            {"type": "tool", "content": context},
+            {"type": "ai", "content": ANSWER},
+        ]}
+
+    def stream_query(self, input, config=None, **kwargs):
+        yield [{"id": ["AIMessageChunk"], "kwargs": {"content": ANSWER}}, {}]
+
+
+def measure(fn, iterations: int, warmup: int = 50) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - started)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": round(statistics.mean(samples) / 1000, 2),
+        "p50_us": round(samples[len(samples) // 2] / 1000, 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000, 2),
+    }
+
+
+# ============================================================================
+# ASGI
+# ============================================================================
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"") -> tuple:
+    """Chama o app ASGI diretamente; devolve (status, corpo)"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    never = asyncio.Event()
+    response = {"status": None, "body": []}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        # Cliente continua conectado até o fim da resposta
+        await never.wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def bench_end_to_end(iterations: int) -> dict:
+    body = json.dumps({"text": QUESTION, "conversation_id": "bench-e2e"}).encode()
+
+    async def run():
+        samples = []
+        for i in range(iterations + 20):
+            started = time.perf_counter_ns()
+            status, payload = await asgi_request(chat_app.app, "POST", "/chat", body)
+            elapsed = time.perf_counter_ns() - started
+            if status != 200:
+                raise RuntimeError(f"/chat respondeu {status}: {payload[:200]!r}")
+            if i >= 20:
+                samples.append(elapsed)
+        return samples
+
+    samples = sorted(asyncio.run(run()))
+    return {
+        "iterations": iterations,
+        "mean_us": round(statistics.mean(samples) / 1000, 2),
+        "p50_us": round(samples[len(samples) // 2] / 1000, 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000, 2),
+    }
+
+
+# ============================================================================
+# SUITE
+# ============================================================================
+
+def run_suite(iterations: int) -> dict:
+    chat_app.agent_pools.start({DEFAULT_PROFILE: AgentProfile(DEFAULT_PROFILE)}, lambda p: StubAgent())
+    chat_app._search_chunks = lambda query: rerank(query, synthetic_chunks(), 3)
+    chat_app.rate_limiter.limits = []
+
+    payload = {"text": QUESTION, "conversation_id": "bench", "timeout": 10}
+    validate = getattr(chat_app.Message, "model_validate", None) or chat_app.Message.parse_obj
+
+    store = chat_app.ConversationStore()
+    for _ in range(20):
+        store.append_turn("bench", QUESTION, ANSWER)
+    conversation = store.get("bench")
+
+    def history_build():
+        history, _ = fit_history(list(conversation.active), 0)
+        return [t.as_tuple() for t in history] + [("user", QUESTION)]
+
+    agent_output = StubAgent().query({"messages": history_build()})
+    response = chat_app.ChatResponse(response=ANSWER, conversation_id="bench", turn_count=21)
+    to_json = getattr(response, "model_dump_json", None) or response.json
+
+    append_store = chat_app.ConversationStore()
+
+    stages = {
+        "message_validation": lambda: validate(payload),
+        "history_build": history_build,
+        "extract_response": lambda: chat_app._extract_response(agent_output),
+        "turn_append": lambda: append_store.append_turn("bench", QUESTION, ANSWER),
+        "tool_format": lambda: format_chunks(rerank(QUESTION, synthetic_chunks(), 3)),
+        "response_serialization": to_json,
+    }
+    results = {name: measure(fn, iterations) for name, fn in stages.items()}
+    results["chat_end_to_end"] = bench_end_to_end(max(50, iterations // 20))
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Etapas cujo p50 piorou mais que `threshold` em relação à baseline"""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get("stages", {}).get(name)
+        if not reference or not reference.get("p50_us"):
+            continue
+        change = current["p50_us"] / reference["p50_us"] - 1
+        current["vs_baseline"] = round(change, 3)
+        if change > threshold:
+            regressions.append({
+                "stage": name,
+                "baseline_p50_us": reference["p50_us"],
+                "p50_us": current["p50_us"],
+                "change": round(change, 3),
+            })
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--baseline", help="JSON de referência para comparar")
+    parser.add_argument("--save-baseline", help="Grava o resultado como referência")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "iterations": args.iterations,
+        },
+        "stages": run_suite(args.iterations),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["stages"], baseline, args.threshold)
+        report["regressions"] = regressions
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Benchmark do custo por turno com e sem checkpointer (checkpoint.py)
+
+Monta um grafo LangGraph com MessagesState e um "modelo" falso (devolve uma
+resposta fixa, sem rede), para isolar o que o serviço paga fora do modelo:
+montar o input, converter as mensagens e gravar o estado. Compara o turno 1
+com o turno 50 de cada conversa:
+
+- "full_history": sem checkpointer, o input leva todo o histórico (como o
+  /chat fazia antes);
+- "checkpointer": MemorySaver por thread_id, o input leva só a mensagem nova.
+
+Uso:
+    python bench_checkpointer.py [--conversations 20] [--turns 50]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+USER_TEXT = "Como solicito férias no SERH? Preciso parcelar em três períodos."
+ASSISTANT_TEXT = (
+    "Para solicitar férias no SERH acesse o módulo Férias > Solicitação, "
+    "informe os períodos desejados e envie para aprovação da chefia. "
+) * 4
+
+
+def fake_model(state: MessagesState) -> dict:
+    return {"messages": [AIMessage(content=ASSISTANT_TEXT)]}
+
+
+def build_graph(checkpointer=None):
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", fake_model)
+    graph.add_edge(START, "agent")
+    graph.add_edge("agent", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def run(mode: str, conversations: int, turns: int) -> dict:
+    graph = build_graph(MemorySaver() if mode == "checkpointer" else None)
+    samples = {1: [], turns: []}
+    payload = {1: [], turns: []}
+
+    for c in range(conversations):
+        history = []
+        config = {"configurable": {"thread_id": f"conv-{c}"}}
+        for turn in range(1, turns + 1):
+            if mode == "checkpointer":
+                messages = [("user", USER_TEXT)]
+            else:
+                messages = history + [("user", USER_TEXT)]
+            started = time.perf_counter()
+            graph.invoke({"messages": messages}, config=config)
+            elapsed = time.perf_counter() - started
+            if turn in samples:
+                samples[turn].append(elapsed)
+                payload[turn].append(len(json.dumps(messages, ensure_ascii=False)))
+            history += [("user", USER_TEXT), ("assistant", ASSISTANT_TEXT)]
+
+    return {
+        f"turn_{t}": {
+            "mean_ms": round(statistics.mean(samples[t]) * 1000, 3),
+            "input_bytes": round(statistics.mean(payload[t])),
+        }
+        for t in samples
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    results = {
+        "conversations": args.conversations,
+        "turns": args.turns,
+        "full_history": run("full_history", args.conversations, args.turns),
+        "checkpointer": run("checkpointer", args.conversations, args.turns),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark do log de conversas (conversation_log.py)
+
+Mede:
+1. O custo por turno do /chat para registrar usuário + assistente no log
+   (o que a requisição paga; o fsync acontece na thread de fundo).
+2. O tempo de recuperação de um log com 100 mil turnos, só com o log e com
+   snapshot + cauda.
+
+Uso:
+    python bench_conversation_log.py [--turns 100000] [--conversations 2000]
+"""
+
+import argparse
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from conversation_log import ConversationLog
+
+USER_TEXT = "Como solicito férias no SERH? Preciso parcelar em três períodos."
+ASSISTANT_TEXT = (
+    "Para solicitar férias no SERH acesse o módulo Férias > Solicitação, "
+    "informe os períodos desejados e envie para aprovação da chefia. "
+) * 4
+
+
+def populate(log: ConversationLog, conversations: dict, turns: int, n_conversations: int,
+             measure: bool = False) -> list:
+    """Registra `turns` turnos distribuídos entre as conversas"""
+    ids = [f"conv-{i:06d}" for i in range(n_conversations)]
+    samples = []
+    rng = random.Random(42)
+    for _ in range(turns):
+        cid = rng.choice(ids)
+        messages = conversations.setdefault(cid, [])
+        started = time.perf_counter()
+        messages.append(("user", USER_TEXT))
+        log.append(cid, len(messages) - 1, "user", USER_TEXT)
+        messages.append(("assistant", ASSISTANT_TEXT))
+        log.append(cid, len(messages) - 1, "assistant", ASSISTANT_TEXT)
+        if measure:
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=100_000)
+    parser.add_argument("--conversations", type=int, default=2_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="serh-convlog-")
+    results = {"turns": args.turns, "conversations": args.conversations}
+    try:
+        # 1. Custo por turno com a thread de gravação ativa
+        conversations = {}
+        log = ConversationLog(directory, snapshot_provider=lambda: dict(conversations),
+                              compact_every=10 ** 9)
+        log.start()
+        started = time.perf_counter()
+        samples = populate(log, conversations, args.turns, args.conversations, measure=True)
+        log.close()
+        elapsed = time.perf_counter() - started
+        results["append_per_turn_us"] = {
+            "mean": round(statistics.mean(samples) * 1e6, 2),
+            "p50": round(percentile(samples, 0.50) * 1e6, 2),
+            "p99": round(percentile(samples, 0.99) * 1e6, 2),
+        }
+        results["write_throughput_turns_s"] = round(args.turns / elapsed)
+        results["fsyncs"] = log.fsyncs
+
+        # 2a. Recuperação apenas do log
+        started = time.perf_counter()
+        recovered = ConversationLog(directory).recover()
+        results["recovery_log_only_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        assert sum(len(m) for m in recovered.values()) == 2 * args.turns
+
+        # 2b. Recuperação de snapshot + cauda de 1% dos turnos
+        log = ConversationLog(directory, snapshot_provider=lambda: recovered)
+        log.start()
+        log.compact()
+        populate(log, recovered, args.turns // 100, args.conversations)
+        log.close()
+        started = time.perf_counter()
+        ConversationLog(directory).recover()
+        results["recovery_snapshot_plus_tail_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
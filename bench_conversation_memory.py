@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Benchmark de memória do histórico de conversas (conversation_store.py)
+
+Compara, para 10 mil conversas sintéticas, a memória ocupada pelo formato
+antigo (lista de tuplas (role, content) por conversa) e pelo ConversationStore
+(Turns com __slots__, janela ativa e blocos frios comprimidos com zlib).
+Algumas mensagens simulam textos longos colados pelos usuários.
+
+Uso:
+    python bench_conversation_memory.py [--conversations 10000] [--turns 40]
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from conversation_store import ConversationStore
+
+QUESTIONS = [
+    "Como cadastro auxílio-transporte no SERH?",
+    "Qual é o documento que preciso anexar?",
+    "Como solicito férias no SERH?",
+    "Posso parcelar as férias?",
+    "Como lançar frequência no SERH?",
+    "Qual é o impacto no contracheque?",
+]
+ANSWER = (
+    "No SERH, acesse o módulo correspondente, preencha os campos obrigatórios "
+    "e anexe o comprovante. A solicitação segue para aprovação da chefia imediata. "
+)
+PASTED = "Matrícula;Nome;Lotação;Situação;Data\n" + "".join(
+    f"{100000 + i};Servidor {i};SEC-{i % 40:02d};ATIVO;2024-0{i % 9 + 1}-15\n" for i in range(120)
+)
+
+
+def _copy(text: str) -> str:
+    """Cópia distinta da string, como chegaria de requisições diferentes"""
+    return text.encode("utf-8").decode("utf-8")
+
+
+def synthetic_turns(rng: random.Random, turns: int):
+    for _ in range(turns):
+        question = PASTED if rng.random() < 0.05 else rng.choice(QUESTIONS)
+        yield question, ANSWER * rng.randint(1, 4)
+
+
+def measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    state = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return state, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=40)
+    args = parser.parse_args()
+
+    def build_tuples():
+        rng = random.Random(7)
+        state = {}
+        for i in range(args.conversations):
+            messages = state.setdefault(f"conv-{i:06d}", [])
+            for question, answer in synthetic_turns(rng, args.turns):
+                messages.append(("user", _copy(question)))
+                messages.append(("assistant", _copy(answer)))
+        return state
+
+    def build_store():
+        rng = random.Random(7)
+        store = ConversationStore()
+        for i in range(args.conversations):
+            cid = f"conv-{i:06d}"
+            for question, answer in synthetic_turns(rng, args.turns):
+                store.append_turn(cid, _copy(question), _copy(answer))
+        return store
+
+    tuples, tuples_bytes, tuples_s = measure(build_tuples)
+    del tuples
+    store, store_bytes, store_s = measure(build_store)
+
+    # Custo de servir um /conversation/{id} com histórico comprimido
+    conversation = store.get("conv-000000")
+    started = time.perf_counter()
+    for _ in range(100):
+        [t.as_dict() for t in conversation.turns()]
+    full_history_us = (time.perf_counter() - started) / 100 * 1e6
+
+    print(json.dumps({
+        "conversations": args.conversations,
+        "turns_per_conversation": args.turns,
+        "tuples_mb": round(tuples_bytes / 2 ** 20, 1),
+        "store_mb": round(store_bytes / 2 ** 20, 1),
+        "reduction": round(1 - store_bytes / tuples_bytes, 3),
+        "build_tuples_s": round(tuples_s, 2),
+        "build_store_s": round(store_s, 2),
+        "full_history_decompress_us": round(full_history_us, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
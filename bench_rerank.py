@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Benchmark e avaliação offline do re-ranking local (rerank.py)
+
+Mede:
+1. O custo do re-ranking por requisição (20 candidatos de ~500 caracteres).
+2. A relevância do contexto enviado ao agente, comparando:
+   - "vector_top3": os 3 primeiros da busca vetorial (comportamento antigo);
+   - "vector_all": todos os candidatos (máximo de contexto);
+   - "rerank_top3": os 3 melhores após o re-ranking.
+   Para cada um: recall (algum trecho relevante no contexto), MRR e tokens.
+
+Sem --golden, usa um conjunto sintético de trechos do SERH em que a ordem da
+busca vetorial é simulada com ruído (o trecho relevante nem sempre está entre
+os primeiros). Com --golden, lê candidatos reais gravados em JSONL, uma linha
+por pergunta:
+
+    {"question": "...", "candidates": [{"text": "...", "relevant": true}, ...]}
+
+com os candidatos na ordem devolvida pela busca.
+
+Uso:
+    python bench_rerank.py [--iterations 2000] [--golden candidatos.jsonl]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from dataclasses import dataclass
+
+from conversation_store import estimate_tokens
+from rerank import RERANK_TOP_N, np, rerank
+
+TOPICS = {
+    "Como cadastro auxílio-transporte no SERH?": (
+        "auxílio-transporte", "cadastro do auxílio-transporte", "itinerário", "vale-transporte",
+    ),
+    "Como solicito férias no SERH?": (
+        "férias", "solicitação de férias", "período aquisitivo", "parcelamento das férias",
+    ),
+    "Como lançar frequência no SERH?": (
+        "frequência", "lançamento da frequência", "ponto", "faltas e atrasos",
+    ),
+    "Estamos com problemas na importação de dados, como resolver?": (
+        "importação de dados", "arquivo de importação", "layout do arquivo", "inconsistências",
+    ),
+    "Como consultar o contracheque?": (
+        "contracheque", "consulta do contracheque", "rubricas", "descontos em folha",
+    ),
+    "Como registrar licença médica?": (
+        "licença médica", "atestado", "perícia", "afastamento por saúde",
+    ),
+}
+
+FILLER = (
+    "O servidor acessa o SERH com sua matrícula e senha. No menu principal, o "
+    "sistema apresenta os módulos disponíveis conforme o perfil. Após salvar, a "
+    "solicitação segue para análise da chefia imediata e do setor de recursos humanos. "
+)
+
+
+@dataclass
+class Candidate:
+    text: str
+    relevant: bool
+    score: float = 0.0
+
+
+def _chunk(rng: random.Random, terms: tuple) -> str:
+    picked = rng.sample(terms, k=min(2, len(terms)))
+    body = (
+        f"Para {picked[0]}, o servidor deve abrir a tela de {picked[-1]} e "
+        f"preencher os campos obrigatórios referentes a {picked[0]}. "
+    )
+    return (FILLER[: rng.randint(120, 300)] + body + FILLER)[:500]
+
+
+def synthetic_set(n_candidates: int, seed: int = 11) -> list:
+    """(pergunta, candidatos na ordem simulada da busca vetorial)"""
+    rng = random.Random(seed)
+    questions = list(TOPICS)
+    cases = []
+    for _ in range(40):
+        question = rng.choice(questions)
+        relevant = [Candidate(_chunk(rng, TOPICS[question]), True) for _ in range(2)]
+        others = [q for q in questions if q != question]
+        distractors = [
+            Candidate(_chunk(rng, TOPICS[rng.choice(others)]), False)
+            for _ in range(n_candidates - len(relevant))
+        ]
+        # A busca vetorial acerta "mais ou menos": posição com cauda longa
+        order = distractors[:]
+        for cand in relevant:
+            order.insert(min(len(order), int(rng.expovariate(0.25))), cand)
+        cases.append((question, order[:n_candidates]))
+    return cases
+
+
+def load_golden(path: str) -> list:
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                cases.append((item["question"], [
+                    Candidate(c["text"], bool(c.get("relevant"))) for c in item["candidates"]
+                ]))
+    return cases
+
+
+def evaluate(contexts: list) -> dict:
+    recall = [any(c.relevant for c in ctx) for ctx in contexts]
+    rr = []
+    for ctx in contexts:
+        rank = next((i for i, c in enumerate(ctx, 1) if c.relevant), None)
+        rr.append(1.0 / rank if rank else 0.0)
+    tokens = [sum(estimate_tokens(c.text) for c in ctx) for ctx in contexts]
+    return {
+        "recall": round(statistics.mean(recall), 3),
+        "mrr": round(statistics.mean(rr), 3),
+        "avg_context_tokens": round(statistics.mean(tokens), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-n", type=int, default=RERANK_TOP_N)
+    parser.add_argument("--golden", help="JSONL com candidatos reais rotulados")
+    args = parser.parse_args()
+
+    cases = load_golden(args.golden) if args.golden else synthetic_set(args.candidates)
+
+    # 1. Custo por requisição
+    samples = []
+    for i in range(args.iterations):
+        question, candidates = cases[i % len(cases)]
+        fresh = [Candidate(c.text, c.relevant) for c in candidates]
+        started = time.perf_counter()
+        rerank(question, fresh, args.top_n)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+
+    # 2. Relevância do contexto enviado ao agente
+    reranked = [
+        rerank(q, [Candidate(c.text, c.relevant) for c in cands], args.top_n)
+        for q, cands in cases
+    ]
+
+    print(json.dumps({
+        "backend": "numpy" if np is not None else "python",
+        "cases": len(cases),
+        "candidates": args.candidates if not args.golden else "golden",
+        "rerank_us": {
+            "mean": round(statistics.mean(samples) * 1e6, 1),
+            "p50": round(samples[len(samples) // 2] * 1e6, 1),
+            "p99": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 1),
+        },
+        "vector_top3": evaluate([cands[:3] for _, cands in cases]),
+        "vector_all": evaluate([cands for _, cands in cases]),
+        f"rerank_top{args.top_n}": evaluate(reranked),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""Turnos do chat como jobs assíncronos.
+
+Integrações atrás de proxies com timeout curto (30 s) não conseguem esperar
+perguntas que rodam várias ferramentas. Com POST /chat/jobs o turno entra
+numa fila e a resposta (202) sai na hora com o job_id; um pool de threads
+(CHAT_JOB_WORKERS) processa os jobs com deadline própria (CHAT_JOB_TIMEOUT)
+e o cliente consulta GET /chat/jobs/{id} ou recebe um POST no callback_url
+ao terminar.
+
+Fila:
+- Memória (padrão): jobs perdidos se o processo cair.
+- SQLite (CHAT_JOB_DB): sobrevive a reinícios e pode ser compartilhada por
+  vários workers do servidor. Um job em execução tem um prazo de posse
+  (lease); se o processo morrer no meio, outro worker o retoma depois que o
+  prazo vence.
+
+Jobs terminados ficam disponíveis por CHAT_JOB_TTL segundos.
+
+Callback: POST JSON com o mesmo corpo do GET; com CHAT_JOB_CALLBACK_SECRET,
+o header X-Signature leva "sha256=<HMAC do corpo>". Com
+CHAT_JOB_CALLBACK_HOSTS, só esses hosts são aceitos como destino. Sem a
+lista, o destino precisa ser um endereço público: o host é resolvido no
+envio do job e o endereço conectado é conferido de novo em cada POST (contra
+DNS que muda entre a validação e o envio); loopback, redes privadas,
+link-local (metadados da nuvem), reservados e multicast são recusados.
+Nesse modo o POST não passa por proxy. Redirecionamentos nunca são seguidos.
+"""
+
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import eventlog
+
+CHAT_JOB_WORKERS = int(os.getenv("CHAT_JOB_WORKERS", 4))  # 0 desativa
+CHAT_JOB_DB = os.getenv("CHAT_JOB_DB")
+CHAT_JOB_TIMEOUT = float(os.getenv("CHAT_JOB_TIMEOUT", 300))
+CHAT_JOB_MAX_QUEUED = int(os.getenv("CHAT_JOB_MAX_QUEUED", 1000))
+CHAT_JOB_TTL = float(os.getenv("CHAT_JOB_TTL", 3600))
+CALLBACK_HOSTS = {
+    h.strip().lower() for h in os.getenv("CHAT_JOB_CALLBACK_HOSTS", "").split(",") if h.strip()
+}
+CALLBACK_SECRET = os.getenv("CHAT_JOB_CALLBACK_SECRET")
+CALLBACK_TIMEOUT = 10
+CALLBACK_ATTEMPTS = 3
+
+POLL_INTERVAL = 1.0
+PURGE_INTERVAL = 60.0
+# Folga do prazo de posse além do tempo máximo do turno
+LEASE_MARGIN = 60.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    """Fila de jobs no limite (CHAT_JOB_MAX_QUEUED)"""
+
+
+class CallbackBlocked(OSError):
+    """Destino do callback resolveu para um endereço não público"""
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def callback_error(url: str) -> Optional[str]:
+    """Motivo para recusar o callback_url (None se for aceito)"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url deve ser uma URL http(s)"
+    host = parsed.hostname.lower()
+    if CALLBACK_HOSTS:
+        # Hosts da lista são escolha do operador (podem ser internos)
+        if host not in CALLBACK_HOSTS:
+            return f"Host do callback não permitido: {parsed.hostname}"
+        return None
+    try:
+        port = parsed.port
+        infos = socket.getaddrinfo(host, port or 0, proto=socket.IPPROTO_TCP)
+    except ValueError:
+        return "Porta do callback inválida"
+    except OSError:
+        return f"Host do callback não resolvido: {parsed.hostname}"
+    if not all(is_public_address(info[4][0]) for info in infos):
+        return f"Host do callback não é um endereço público: {parsed.hostname}"
+    return None
+
+
+def _check_peer(sock):
+    address = sock.getpeername()[0]
+    if not is_public_address(address):
+        sock.close()
+        raise CallbackBlocked(f"destino não público: {address}")
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self.sock)
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self.sock)
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None  # urlopen levanta HTTPError com o 3xx
+
+
+def _callback_opener() -> urllib.request.OpenerDirector:
+    handlers = [_NoRedirect()]
+    if not CALLBACK_HOSTS:
+        # Sem proxy: o endereço conferido é o do destino, não o do proxy
+        handlers += [_PublicHTTPHandler(), _PublicHTTPSHandler(), urllib.request.ProxyHandler({})]
+    return urllib.request.build_opener(*handlers)
+
+
+@dataclass
+class Job:
+    """Um turno enfileirado"""
+    id: str
+    request: dict
+    client: Optional[str] = None
+    callback_url: Optional[str] = None
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    http_status: Optional[int] = None
+    result: Optional[dict] = None
+    callback_status: Optional[str] = None
+
+    def public(self) -> dict:
+        """Corpo do GET /chat/jobs/{id} e do callback"""
+        body = {
+            "job_id": self.id,
+            "status": self.status,
+            "conversation_id": self.request.get("conversation_id"),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.status == DONE:
+            body["result"] = self.result
+        elif self.status == FAILED:
+            body["error"] = {"status": self.http_status, **(self.result or {})}
+        if self.callback_url:
+            body["callback_status"] = self.callback_status
+        return body
+
+
+class MemoryJobStore:
+    """Jobs em memória do processo (fila FIFO)"""
+
+    def __init__(self):
+        self._jobs: OrderedDict = OrderedDict()
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+
+    def add(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append(job.id)
+
+    def claim(self) -> Optional[Job]:
+        with self._lock:
+            while self._queue:
+                job = self._jobs.get(self._queue.popleft())
+                if job is not None and job.status == QUEUED:
+                    job.status, job.started = RUNNING, time.time()
+                    return job
+            return None
+
+    def update(self, job: Job):
+        pass  # os objetos já são os do store
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def counts(self) -> dict:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def purge(self, before: float) -> int:
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished is not None and job.finished < before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+
+class SQLiteJobStore:
+    """Jobs num arquivo SQLite, com posse por prazo para retomar jobs de
+    processos que caíram"""
+
+    def __init__(self, path: str, lease: float = CHAT_JOB_TIMEOUT + LEASE_MARGIN):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL,"
+            " started REAL, finished REAL, lease_until REAL, job TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_jobs_status ON chat_jobs (status, created)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _dump(job: Job) -> str:
+        return json.dumps(job.__dict__, ensure_ascii=False)
+
+    def add(self, job: Job):
+        self._conn().execute(
+            "INSERT INTO chat_jobs (id, status, created, job) VALUES (?, ?, ?, ?)",
+            (job.id, job.status, job.created, self._dump(job)),
+        )
+
+    def claim(self) -> Optional[Job]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT job FROM chat_jobs WHERE status = ?"
+                " OR (status = ? AND lease_until < ?) ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job = Job(**json.loads(row[0]))
+            job.status, job.started = RUNNING, now
+            conn.execute(
+                "UPDATE chat_jobs SET status = ?, started = ?, lease_until = ?, job = ? WHERE id = ?",
+                (RUNNING, now, now + self.lease, self._dump(job), job.id),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job
+
+    def update(self, job: Job):
+        self._conn().execute(
+            "UPDATE chat_jobs SET status = ?, finished = ?, job = ? WHERE id = ?",
+            (job.status, job.finished, self._dump(job), job.id),
+        )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute("SELECT job FROM chat_jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def counts(self) -> dict:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, n in self._conn().execute(
+            "SELECT status, COUNT(*) FROM chat_jobs GROUP BY status"
+        ):
+            counts[status] = n
+        return counts
+
+    def queued(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM chat_jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()[0]
+
+    def purge(self, before: float) -> int:
+        return self._conn().execute(
+            "DELETE FROM chat_jobs WHERE finished IS NOT NULL AND finished < ?", (before,)
+        ).rowcount
+
+
+class JobManager:
+    """Fila de jobs + threads que executam os turnos.
+
+    Args:
+        store: MemoryJobStore ou SQLiteJobStore.
+        run: Executa o turno de um job; devolve (status HTTP, corpo).
+        workers: Threads de execução.
+        max_queued: Jobs esperando no máximo (acima disso, QueueFull).
+    """
+
+    def __init__(self, store, run: Callable, workers: int = CHAT_JOB_WORKERS,
+                 max_queued: int = CHAT_JOB_MAX_QUEUED):
+        self.store = store
+        self.run = run
+        self.workers = workers
+        self.max_queued = max_queued
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._purge_lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+        # Métricas
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.callbacks_ok = 0
+        self.callbacks_failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, run: Callable) -> "JobManager":
+        store = SQLiteJobStore(CHAT_JOB_DB) if CHAT_JOB_DB else MemoryJobStore()
+        return cls(store, run)
+
+    def submit(self, request: dict, client: Optional[str] = None,
+               callback_url: Optional[str] = None) -> Job:
+        if self.store.queued() >= self.max_queued:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull("Fila de jobs cheia. Tente novamente mais tarde.")
+        job = Job(uuid.uuid4().hex, request, client, callback_url)
+        self.store.add(job)
+        with self._lock:
+            self.submitted += 1
+        with self._wake:
+            self._wake.notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"chat-job-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            self._maybe_purge()
+            try:
+                job = self.store.claim()
+            except sqlite3.Error as e:
+                eventlog.log("chat_job.queue_error", level="error", exc=e)
+                job = None
+            if job is None:
+                # Com SQLite, jobs de outros processos só aparecem no polling
+                with self._wake:
+                    self._wake.wait(POLL_INTERVAL)
+                continue
+            self._execute(job)
+
+    def _execute(self, job: Job):
+        started = time.monotonic()
+        try:
+            status, body = self.run(job)
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+
+        job.status = DONE if status == 200 else FAILED
+        job.http_status = status
+        job.result = body
+        job.finished = time.time()
+        self.store.update(job)
+        with self._lock:
+            self.wait_seconds += max(0.0, (job.started or job.created) - job.created)
+            self.run_seconds += time.monotonic() - started
+            if job.status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+        if job.callback_url:
+            job.callback_status = self._notify(job)
+            self.store.update(job)
+
+    def _notify(self, job: Job) -> str:
+        """POST do resultado no callback_url, com novas tentativas"""
+        body = json.dumps(job.public(), ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if CALLBACK_SECRET:
+            digest = hmac.new(CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={digest}"
+
+        error = None
+        opener = _callback_opener()
+        for attempt in range(CALLBACK_ATTEMPTS):
+            if attempt:
+                if self._stop.wait(2 ** attempt):
+                    break
+            request = urllib.request.Request(job.callback_url, data=body, headers=headers, method="POST")
+            try:
+                with opener.open(request, timeout=CALLBACK_TIMEOUT) as response:
+                    response.read()
+                with self._lock:
+                    self.callbacks_ok += 1
+                return "ok"
+            except urllib.error.HTTPError as e:
+                error = f"HTTP {e.code}"
+                if e.code < 500 and e.code != 429:
+                    break  # erro ou redirecionamento do destino: não adianta repetir
+            except urllib.error.URLError as e:
+                error = str(e.reason)
+                if isinstance(e.reason, CallbackBlocked):
+                    break
+            except (TimeoutError, OSError) as e:
+                error = str(getattr(e, "reason", e))
+        with self._lock:
+            self.callbacks_failed += 1
+        return f"failed: {error}"
+
+    def _maybe_purge(self):
+        if time.monotonic() - self._last_purge < PURGE_INTERVAL:
+            return
+        if not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_purge = time.monotonic()
+            self.store.purge(time.time() - CHAT_JOB_TTL)
+        except sqlite3.Error as e:
+            eventlog.log("chat_job.purge_error", level="error", exc=e)
+        finally:
+            self._purge_lock.release()
+
+    def close(self):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "store": type(self.store).__name__,
+                "workers": self.workers,
+                **self.store.counts(),
+                "submitted": self.submitted,
+                "rejected_queue_full": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.wait_seconds / finished * 1000, 1) if finished else None,
+                "avg_run_ms": round(self.run_seconds / finished * 1000, 1) if finished else None,
+                "callbacks_ok": self.callbacks_ok,
+                "callbacks_failed": self.callbacks_failed,
+            }
@@ -24,19 +24,22 @@ from vertexai.generative_models import GenerativeModel, Tool
 
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
-# Buscar corpus com arquivos
-corpora = list(rag.list_corpora())
+# Buscar corpus com arquivos (listagem paralela com cache local)
+from corpus_admin import DEFAULT_CACHE_PATH, DEFAULT_CACHE_TTL, ListingCache, corpora_with_files
+
 corpus_with_files = None
+cache = ListingCache(DEFAULT_CACHE_PATH, DEFAULT_CACHE_TTL)
 
-for corpus in corpora:
-    files = list(rag.list_files(corpus_name=corpus.name))
+for corpus, files in corpora_with_files(rag, cache):
     if files:
         corpus_with_files = corpus
-        print(f"Corpus encontrado: {corpus.display_name}")
-        print(f"ID: {corpus.name}")
-        print(f"Arquivos: {[f.display_name for f in files]}")
+        print(f"Corpus encontrado: {corpus['display_name']}")
+        print(f"ID: {corpus['name']}")
+        print(f"Arquivos: {[f['display_name'] for f in files]}")
         break
 
+cache.save()
+
 if not corpus_with_files:
     print("Nenhum corpus com arquivos encontrado")
     exit(1)
@@ -45,7 +48,7 @@ if not corpus_with_files:
 retrieval_tool = Tool.from_retrieval(
     retrieval=rag.Retrieval(
         source=rag.VertexRagStore(
-            rag_resources=[rag.RagResource(rag_corpus=corpus_with_files.name)],
+            rag_resources=[rag.RagResource(rag_corpus=corpus_with_files["name"])],
             rag_retrieval_config=rag.RagRetrievalConfig(
                 top_k=10,
             ),
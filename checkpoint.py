@@ -0,0 +1,195 @@
+"""Estado das conversas no checkpointer do LangGraph.
+
+Sem checkpointer, cada turno reenviava a janela ativa inteira como input do
+agent.query(), e o LangGraph convertia todas as mensagens de novo: custo
+O(turnos) por turno. Com checkpointer, o estado do grafo fica guardado por
+thread_id e o turno só envia a mensagem nova.
+
+- CHECKPOINTER=memory (padrão): MemorySaver, em memória do processo.
+- CHECKPOINTER=sqlite: SqliteSaver em CHECKPOINT_DB (requer o pacote
+  langgraph-checkpoint-sqlite); tira o estado das threads da memória.
+- CHECKPOINTER=none: comportamento antigo (histórico no input).
+
+O ConversationStore continua recebendo os turnos e serve os endpoints de
+histórico; para o agente, ele só é usado para semear uma thread.
+
+Cada conversa usa a thread "<conversation_id>#<geração>". A primeira
+geração de cada processo parte do relógio, então uma thread gravada antes de
+um reinício nunca é reaproveitada por engano (o histórico recuperado do log
+semeia uma thread nova). Quando a thread
+passa do orçamento de histórico (CONVERSATION_PROMPT_BUDGET ou o dobro de
+CONVERSATION_ACTIVE_WINDOW mensagens), ou quando um turno é descartado no
+meio e a thread pode ter divergido do histórico, a conversa passa para a
+geração seguinte, semeada com o histórico compactado do store.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from conversation_store import ACTIVE_WINDOW
+from usage import (
+    BUDGET_MIN_MESSAGES,
+    CONVERSATION_PROMPT_BUDGET,
+    CONVERSATION_TOKEN_BUDGET,
+    fit_history,
+)
+
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory").lower()
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "serh_checkpoints.db")
+
+# Checkpointer criado pelo agente (via build_checkpointer) em set_up();
+# único no processo, compartilhado por todas as instâncias do pool
+_checkpointer = None
+_build_lock = threading.Lock()
+
+
+def build_checkpointer(**kwargs):
+    """checkpointer_builder do LanggraphAgent"""
+    global _checkpointer
+    with _build_lock:
+        if _checkpointer is None:
+            _checkpointer = _new_checkpointer(**kwargs)
+        return _checkpointer
+
+
+def _new_checkpointer(**kwargs):
+    if CHECKPOINTER == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+        except ImportError as e:
+            raise RuntimeError(
+                "CHECKPOINTER=sqlite requer o pacote langgraph-checkpoint-sqlite"
+            ) from e
+        conn = sqlite3.connect(kwargs.get("path", CHECKPOINT_DB), check_same_thread=False)
+        return SqliteSaver(conn)
+    from langgraph.checkpoint.memory import MemorySaver
+    return MemorySaver()
+
+
+def agent_kwargs() -> dict:
+    """Argumentos extras do LanggraphAgent para o checkpointer configurado"""
+    if CHECKPOINTER == "none":
+        return {}
+    kwargs = {"path": CHECKPOINT_DB} if CHECKPOINTER == "sqlite" else {}
+    return {"checkpointer_builder": build_checkpointer, "checkpointer_kwargs": kwargs}
+
+
+def delete_thread(thread_id: str):
+    if _checkpointer is not None and hasattr(_checkpointer, "delete_thread"):
+        _checkpointer.delete_thread(thread_id)
+
+
+class _ThreadState:
+    __slots__ = ("generation", "tokens", "messages", "seeded", "dirty")
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.tokens = 0
+        self.messages = 0
+        self.seeded = False
+        self.dirty = False
+
+
+class ThreadTracker:
+    """Qual thread guarda cada conversa e quanto histórico ela já acumula"""
+
+    def __init__(self, prompt_budget: int = CONVERSATION_PROMPT_BUDGET,
+                 token_budget: int = CONVERSATION_TOKEN_BUDGET,
+                 max_messages: int = 2 * ACTIVE_WINDOW):
+        self.prompt_budget = prompt_budget
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.rotations = 0
+        self.seeds = 0
+        self.incremental_turns = 0
+        self._threads = {}
+        self._base_generation = int(time.time())
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def thread_id(conversation_id: str, generation: int) -> str:
+        return f"{conversation_id}#{generation}"
+
+    def plan(self, conversation_id: str, history: list, spent_tokens: int = 0) -> tuple:
+        """Thread e mensagens a enviar no próximo turno.
+
+        Args:
+            conversation_id: Conversa.
+            history: Turns da janela ativa do store (mais antigos primeiro).
+            spent_tokens: Tokens já gastos pela conversa (orçamento total).
+
+        Returns:
+            (thread_id, turns para semear a thread, True se compactou)
+        """
+        with self._lock:
+            state = self._threads.get(conversation_id)
+            if state is None:
+                state = self._threads[conversation_id] = _ThreadState(self._base_generation)
+
+            # Orçamento total da conversa estourado: threads mínimas
+            exhausted = self.token_budget and spent_tokens >= self.token_budget
+            max_messages = BUDGET_MIN_MESSAGES + 2 if exhausted else self.max_messages
+            over_budget = (
+                state.messages > max_messages
+                or (self.prompt_budget and state.tokens > self.prompt_budget)
+            )
+            if state.seeded and not over_budget and not state.dirty:
+                self.incremental_turns += 1
+                return self.thread_id(conversation_id, state.generation), [], False
+
+            # Semeia com metade do orçamento para não girar a cada turno
+            seed, _ = fit_history(
+                history, spent_tokens,
+                prompt_budget=self.prompt_budget // 2, token_budget=self.token_budget,
+            )
+            seed = seed[-ACTIVE_WINDOW:]
+
+            old = None
+            if state.seeded:
+                old = self.thread_id(conversation_id, state.generation)
+                state.generation += 1
+                self.rotations += 1
+            state.seeded = True
+            state.dirty = False
+            state.messages = len(seed)
+            state.tokens = sum(t.tokens for t in seed)
+            self.seeds += 1
+            thread_id = self.thread_id(conversation_id, state.generation)
+
+        if old is not None:
+            delete_thread(old)
+        return thread_id, seed, old is not None or len(seed) < len(history)
+
+    def record(self, conversation_id: str, tokens: int, messages: int = 2):
+        """Contabiliza o que o turno acrescentou à thread"""
+        with self._lock:
+            state = self._threads.get(conversation_id)
+            if state is not None:
+                state.tokens += tokens
+                state.messages += messages
+
+    def invalidate(self, conversation_id: str):
+        """O turno falhou depois de chamar o agente: a thread pode ter
+        mensagens que o store não tem, então a próxima geração é semeada"""
+        with self._lock:
+            state = self._threads.get(conversation_id)
+            if state is not None:
+                state.dirty = True
+
+    def forget(self, conversation_id: str):
+        with self._lock:
+            state = self._threads.pop(conversation_id, None)
+        if state is not None and state.seeded:
+            delete_thread(self.thread_id(conversation_id, state.generation))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checkpointer": CHECKPOINTER,
+                "threads": len(self._threads),
+                "incremental_turns": self.incremental_turns,
+                "seeded_threads": self.seeds,
+                "rotations": self.rotations,
+            }
@@ -0,0 +1,267 @@
+"""Log append-only das conversas com compactação periódica.
+
+Cada mensagem adicionada ao histórico vira uma linha JSON no segmento de log
+corrente. As linhas ficam num buffer em memória e uma thread de fundo as grava
+em lote com um único fsync a cada FLUSH_INTERVAL (ou quando o lote enche), de
+modo que o /chat paga só o custo de enfileirar o registro.
+
+De tempos em tempos o estado completo é gravado num snapshot e os segmentos
+antigos são apagados. Na inicialização, recover() carrega o snapshot e
+reaplica apenas a cauda do log.
+
+Layout do diretório:
+    snapshot.json        {"segment": N, "conversations": {id: [[role, content, ts], ...]}}
+    log-000000N.jsonl    registros posteriores ao snapshot
+
+Registros:
+    {"c": id, "i": índice, "r": role, "t": conteúdo, "ts": epoch}   mensagem
+    {"c": id, "op": "del"}                               conversa apagada
+
+O índice da mensagem torna o replay idempotente: um registro que já está no
+snapshot (gravado durante a compactação) é ignorado. Por isso os registros de
+uma conversa precisam chegar ao log na ordem dos índices (o ConversationStore
+os enfileira sob o próprio lock).
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import eventlog
+
+SNAPSHOT_FILE = "snapshot.json"
+SEGMENT_PREFIX = "log-"
+SEGMENT_SUFFIX = ".jsonl"
+
+FLUSH_INTERVAL = float(os.getenv("CONVERSATION_LOG_FLUSH_INTERVAL", 0.05))
+BATCH_SIZE = 512
+COMPACT_EVERY = int(os.getenv("CONVERSATION_LOG_COMPACT_EVERY", 50_000))
+
+
+def _segment_name(number: int) -> str:
+    return f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+
+def _segment_number(filename: str) -> Optional[int]:
+    if filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX):
+        try:
+            return int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+        except ValueError:
+            return None
+    return None
+
+
+def apply_record(conversations: dict, record: dict):
+    """Aplica um registro do log ao estado (idempotente)"""
+    cid = record["c"]
+    if record.get("op") == "del":
+        conversations.pop(cid, None)
+        return
+    messages = conversations.setdefault(cid, [])
+    if record["i"] == len(messages):
+        messages.append((record["r"], record["t"], record.get("ts")))
+
+
+class ConversationLog:
+    """Write-ahead log das conversas com fsync em lote.
+
+    Args:
+        directory: Diretório do log e dos snapshots.
+        snapshot_provider: Função que devolve uma cópia do estado atual
+            ({id: [(role, content, ts), ...]}) para a compactação automática.
+        flush_interval: Intervalo máximo (s) entre gravações em disco.
+        compact_every: Registros gravados entre duas compactações.
+    """
+
+    def __init__(self, directory: str, snapshot_provider: Optional[Callable[[], dict]] = None,
+                 flush_interval: float = FLUSH_INTERVAL, compact_every: int = COMPACT_EVERY):
+        self.directory = directory
+        self.snapshot_provider = snapshot_provider
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        self._segment = segments[-1] + 1 if segments else 1
+        self._file = None
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._since_compaction = 0
+
+        # Métricas
+        self.records_written = 0
+        self.fsyncs = 0
+        self.compactions = 0
+        self.last_recovery_ms = None
+
+        self._thread = None
+
+    # ------------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------------
+
+    def start(self):
+        """Abre um novo segmento e inicia a thread de gravação"""
+        self._file = open(os.path.join(self.directory, _segment_name(self._segment)), "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+
+    def append(self, conversation_id: str, index: int, role: str, content: str,
+               ts: Optional[float] = None):
+        """Enfileira uma mensagem (não bloqueia em I/O)"""
+        line = json.dumps(
+            {"c": conversation_id, "i": index, "r": role, "t": content,
+             "ts": time.time() if ts is None else ts},
+            ensure_ascii=False,
+        )
+        self._enqueue(line)
+
+    def delete(self, conversation_id: str):
+        """Enfileira a remoção de uma conversa"""
+        self._enqueue(json.dumps({"c": conversation_id, "op": "del"}, ensure_ascii=False))
+
+    def _enqueue(self, line: str):
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= BATCH_SIZE
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if self.snapshot_provider and self._since_compaction >= self.compact_every:
+                    self.compact()
+            except Exception as e:
+                eventlog.log("conversation_log.error", level="error", exc=e)
+
+    def flush(self):
+        """Grava o buffer pendente com um único fsync"""
+        with self._io_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines or self._file is None:
+                return
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.records_written += len(lines)
+            self._since_compaction += len(lines)
+            self.fsyncs += 1
+
+    def compact(self):
+        """Grava um snapshot do estado e descarta os segmentos anteriores.
+
+        O segmento corrente é fechado antes de pedir o estado ao
+        snapshot_provider: tudo o que está nos segmentos antigos já está no
+        estado copiado, e registros gravados a partir daí vão para um segmento
+        novo, reaplicado sobre o snapshot na recuperação (o índice evita
+        duplicatas). Por isso o estado em memória deve ser alterado antes de
+        chamar append().
+        """
+        with self._io_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+                self.records_written += len(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+            old_segment = self._segment
+            self._segment += 1
+            self._file = open(os.path.join(self.directory, _segment_name(self._segment)), "a", encoding="utf-8")
+            self._since_compaction = 0
+
+        conversations = self.snapshot_provider()
+        snapshot = {
+            "segment": self._segment,
+            "conversations": {cid: [list(m) for m in msgs] for cid, msgs in conversations.items()},
+        }
+        tmp_path = os.path.join(self.directory, SNAPSHOT_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, SNAPSHOT_FILE))
+
+        for number in self._segments():
+            if number <= old_segment:
+                os.remove(os.path.join(self.directory, _segment_name(number)))
+        self.compactions += 1
+
+    def close(self):
+        """Para a thread e grava o que estiver pendente"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ------------------------------------------------------------------------
+    # Recuperação
+    # ------------------------------------------------------------------------
+
+    def _segments(self) -> list:
+        numbers = (_segment_number(name) for name in os.listdir(self.directory))
+        return sorted(n for n in numbers if n is not None)
+
+    def recover(self) -> dict:
+        """Reconstrói o estado: snapshot + cauda do log.
+
+        Deve ser chamado antes de start(). Uma última linha incompleta (queda
+        no meio de uma gravação) é ignorada.
+        """
+        started = time.perf_counter()
+        conversations = {}
+        first_segment = 0
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            first_segment = snapshot["segment"]
+            conversations = {
+                cid: [tuple(m) for m in msgs]
+                for cid, msgs in snapshot["conversations"].items()
+            }
+
+        loads = json.loads
+        for number in self._segments():
+            if number < first_segment:
+                continue
+            with open(os.path.join(self.directory, _segment_name(number)), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        continue
+                    apply_record(conversations, record)
+
+        self.last_recovery_ms = (time.perf_counter() - started) * 1000
+        return conversations
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._buffer)
+        return {
+            "segment": self._segment,
+            "pending": pending,
+            "records_written": self.records_written,
+            "fsyncs": self.fsyncs,
+            "compactions": self.compactions,
+            "last_recovery_ms": round(self.last_recovery_ms, 1) if self.last_recovery_ms is not None else None,
+        }
@@ -0,0 +1,301 @@
+"""Armazenamento das conversas em memória com contadores incrementais.
+
+Cada conversa mantém message_count, user_turns e last_activity atualizados a
+cada mensagem, então /chat e /conversations não precisam percorrer o
+histórico para contar turnos.
+
+A listagem é paginada por cursor em ordem de última atividade. Cada atividade
+recebe um número de sequência crescente; o índice é uma lista desses números
+(já ordenada, pois só cresce no fim) e uma página custa O(log n + página) com
+bisect. Sequências antigas de conversas que voltaram a ter atividade ficam na
+lista como entradas obsoletas e são descartadas quando passam da metade.
+
+Cada mensagem é um Turn (__slots__, role internado, timestamp e tokens). Só a
+janela ativa (as últimas CONVERSATION_ACTIVE_WINDOW mensagens, que vão para o
+agente) fica descompactada; mensagens mais antigas são agrupadas em blocos de
+COLD_BLOCK_SIZE e comprimidas com zlib, e só são descompactadas quando o
+histórico completo é pedido (/conversation/{id}, snapshot do log).
+
+Com um ConversationLog em `log`, cada mensagem é registrada no log ainda sob
+o lock do store, com o índice atribuído na inserção: turnos simultâneos na
+mesma conversa entram no log na ordem dos índices. Cada conversa tem também
+o próprio lock, para que a leitura do histórico completo (snapshot da
+compactação, /conversation/{id}) não veja um bloco no meio da compressão.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Mensagens mantidas descompactadas (e enviadas ao agente)
+ACTIVE_WINDOW = int(os.getenv("CONVERSATION_ACTIVE_WINDOW", 40))
+# Mensagens por bloco comprimido
+COLD_BLOCK_SIZE = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local de tokens (~4 caracteres por token em português)"""
+    return max(1, len(text) // 4)
+
+
+class Turn:
+    """Uma mensagem do histórico"""
+
+    __slots__ = ("role", "content", "ts", "tokens")
+
+    def __init__(self, role: str, content: str, ts: Optional[float] = None,
+                 tokens: Optional[int] = None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.ts = time.time() if ts is None else ts
+        self.tokens = estimate_tokens(content) if tokens is None else tokens
+
+    def as_tuple(self) -> tuple:
+        return (self.role, self.content)
+
+    def as_dict(self) -> dict:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.ts,
+            "tokens": self.tokens,
+        }
+
+
+def _compress(turns: list) -> bytes:
+    payload = [[t.role, t.content, t.ts, t.tokens] for t in turns]
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def _decompress(block: bytes) -> list:
+    return [Turn(*item) for item in json.loads(zlib.decompress(block))]
+
+
+class Conversation:
+    """Histórico de uma conversa com contadores mantidos a cada mensagem.
+
+    `active` guarda os Turns recentes; `cold` guarda blocos zlib com os
+    anteriores, na ordem, cada um com COLD_BLOCK_SIZE mensagens.
+    """
+
+    __slots__ = ("id", "active", "cold", "message_count", "user_turns",
+                 "total_tokens", "created_at", "last_activity", "seq", "lock")
+
+    def __init__(self, conversation_id: str):
+        self.id = conversation_id
+        self.active = []
+        self.cold = []
+        self.message_count = 0
+        self.user_turns = 0
+        self.total_tokens = 0
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def append(self, role: str, content: str, ts: Optional[float] = None,
+               tokens: Optional[int] = None) -> Turn:
+        with self.lock:
+            return self._append(role, content, ts, tokens)
+
+    def _append(self, role: str, content: str, ts: Optional[float] = None,
+                tokens: Optional[int] = None) -> Turn:
+        turn = Turn(role, content, ts, tokens)
+        if self.message_count == 0:
+            self.created_at = turn.ts
+        self.active.append(turn)
+        self.message_count += 1
+        self.total_tokens += turn.tokens
+        if turn.role == "user":
+            self.user_turns += 1
+        self.last_activity = turn.ts
+
+        # Comprime o bloco mais antigo quando a janela ativa transborda
+        if len(self.active) >= ACTIVE_WINDOW + COLD_BLOCK_SIZE:
+            self.cold.append(_compress(self.active[:COLD_BLOCK_SIZE]))
+            del self.active[:COLD_BLOCK_SIZE]
+        return turn
+
+    @property
+    def cold_count(self) -> int:
+        return len(self.cold) * COLD_BLOCK_SIZE
+
+    def recent(self, limit: Optional[int] = None) -> list:
+        """Últimas mensagens (janela ativa) como tuplas (role, content)"""
+        turns = self.active if limit is None else self.active[-limit:]
+        return [t.as_tuple() for t in turns]
+
+    def turns(self, start: int = 0, end: Optional[int] = None) -> list:
+        """Turns no intervalo [start, end) do histórico completo.
+
+        Descompacta apenas os blocos frios que cobrem o intervalo.
+        """
+        with self.lock:
+            return self._turns(start, end)
+
+    def _turns(self, start: int, end: Optional[int]) -> list:
+        start = max(start, 0)
+        end = self.message_count if end is None else min(end, self.message_count)
+        cold_count = self.cold_count
+        result = []
+        if start < cold_count:
+            first_block = start // COLD_BLOCK_SIZE
+            last_block = (min(end, cold_count) - 1) // COLD_BLOCK_SIZE
+            for b in range(first_block, last_block + 1):
+                block = _decompress(self.cold[b])
+                base = b * COLD_BLOCK_SIZE
+                result.extend(block[max(start - base, 0):max(0, min(end - base, COLD_BLOCK_SIZE))])
+        if end > cold_count:
+            result.extend(self.active[max(start - cold_count, 0):end - cold_count])
+        return result
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "message_count": self.message_count,
+            "user_turns": self.user_turns,
+            "last_activity": self.last_activity,
+        }
+
+
+class ConversationStore:
+    """Conversas indexadas por ID e por última atividade.
+
+    Args:
+        log: ConversationLog que recebe cada mensagem e remoção (opcional).
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self._conversations = {}
+        self._by_seq = {}   # seq -> conversation_id (apenas sequências vigentes)
+        self._order = []    # seqs em ordem crescente, incluindo obsoletas
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._conversations
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def get(self, conversation_id: str) -> Optional[Conversation]:
+        return self._conversations.get(conversation_id)
+
+    def append(self, conversation_id: str, role: str, content: str,
+               ts: Optional[float] = None) -> Conversation:
+        """Adiciona uma mensagem e move a conversa para o topo da atividade"""
+        conversation, _ = self._append(conversation_id, [(role, content)], ts)
+        return conversation
+
+    def append_turn(self, conversation_id: str, user_text: str, assistant_text: str) -> tuple:
+        """Adiciona pergunta e resposta de um turno de forma atômica.
+
+        Returns:
+            (Conversation, índice da pergunta no histórico)
+        """
+        return self._append(conversation_id, [("user", user_text), ("assistant", assistant_text)])
+
+    def _append(self, conversation_id: str, messages: list, ts: Optional[float] = None) -> tuple:
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = Conversation(conversation_id)
+                self._conversations[conversation_id] = conversation
+            with conversation.lock:
+                index = conversation.message_count
+                turns = [conversation._append(role, content, ts) for role, content in messages]
+            if self.log is not None:
+                for i, turn in enumerate(turns, index):
+                    self.log.append(conversation_id, i, turn.role, turn.content, turn.ts)
+            self._touch(conversation)
+            return conversation, index
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            conversation = self._conversations.pop(conversation_id, None)
+            if conversation is None:
+                return False
+            self._by_seq.pop(conversation.seq, None)
+            if self.log is not None:
+                self.log.delete(conversation_id)
+            return True
+
+    def _touch(self, conversation: Conversation):
+        self._by_seq.pop(conversation.seq, None)
+        conversation.seq = self._next_seq
+        self._next_seq += 1
+        self._by_seq[conversation.seq] = conversation.id
+        self._order.append(conversation.seq)
+        if len(self._order) > 2 * len(self._by_seq) + 64:
+            self._order = [s for s in self._order if s in self._by_seq]
+
+    def page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+             order: str = "desc") -> tuple:
+        """Uma página de conversas ordenadas por última atividade.
+
+        Args:
+            limit: Tamanho da página (limitado a MAX_PAGE_SIZE).
+            cursor: Valor de next_cursor da página anterior.
+            order: "desc" (mais recentes primeiro) ou "asc".
+
+        Returns:
+            (lista de Conversation, next_cursor ou None)
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = int(cursor) if cursor else None
+        items = []
+        with self._lock:
+            order_list = self._order
+            if order == "asc":
+                i = 0 if after is None else bisect_right(order_list, after)
+                step, stop = 1, len(order_list)
+            else:
+                i = len(order_list) - 1 if after is None else bisect_left(order_list, after) - 1
+                step, stop = -1, -1
+
+            last_seq = None
+            while i != stop and len(items) < limit:
+                seq = order_list[i]
+                cid = self._by_seq.get(seq)
+                if cid is not None:
+                    items.append(self._conversations[cid])
+                    last_seq = seq
+                i += step
+
+            has_more = any(order_list[j] in self._by_seq for j in range(i, stop, step)) if i != stop else False
+
+        next_cursor = str(last_seq) if has_more and last_seq is not None else None
+        return items, next_cursor
+
+    def snapshot(self) -> dict:
+        """Cópia do estado ({id: [(role, content, ts), ...]}) para o log de conversas"""
+        with self._lock:
+            conversations = list(self._conversations.values())
+        return {c.id: [(t.role, t.content, t.ts) for t in c.turns()] for c in conversations}
+
+    def load(self, state: dict):
+        """Carrega o estado recuperado do log de conversas (sem registrar no log).
+
+        Mensagens de logs antigos, sem timestamp, recebem o horário da carga.
+        """
+        def last_ts(item):
+            messages = item[1]
+            return messages[-1][2] if messages and len(messages[-1]) > 2 else 0.0
+
+        log, self.log = self.log, None
+        try:
+            # Em ordem de última atividade, para a listagem sair igual
+            for cid, messages in sorted(state.items(), key=last_ts):
+                for role, content, *ts in messages:
+                    self.append(cid, role, content, ts[0] if ts else None)
+        finally:
+            self.log = log
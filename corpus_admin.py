@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""CLI de administração dos corpus RAG.
+
+Substitui os scripts list_corpus.py / check_corpus_content.py, que percorriam
+rag.list_corpora() chamando rag.list_files() corpus por corpus. Aqui a listagem
+por corpus roda em paralelo (pool limitado), o resultado fica em cache local
+com TTL e a saída é NDJSON (um objeto JSON por linha), emitida à medida que
+cada corpus responde.
+
+Uso:
+    python corpus_admin.py list
+    python corpus_admin.py inspect <CORPUS_ID> [<CORPUS_ID> ...]
+    python corpus_admin.py inspect --all
+    python corpus_admin.py search "como solicitar férias?" [--corpus <ID>] [--top-k 5]
+    python corpus_admin.py delete <CORPUS_ID> --yes
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_CACHE_PATH = ".corpus_cache.json"
+DEFAULT_CACHE_TTL = 300
+DEFAULT_WORKERS = 8
+
+# ============================================================================
+# CACHE LOCAL COM TTL
+# ============================================================================
+
+class ListingCache:
+    """Cache em arquivo JSON das listagens de corpus e arquivos.
+
+    Cada entrada guarda o instante em que foi obtida; entradas mais velhas que
+    o TTL são ignoradas. Com ttl=0 o cache é desativado.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        if ttl > 0 and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, key: str):
+        if self.ttl <= 0:
+            return None
+        entry = self._entries.get(key)
+        if entry and time.time() - entry["fetched_at"] < self.ttl:
+            return entry["value"]
+        return None
+
+    def put(self, key: str, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = {"fetched_at": time.time(), "value": value}
+
+    def invalidate(self, prefix: str = ""):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def save(self):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+# ============================================================================
+# OPERAÇÕES
+# ============================================================================
+
+def list_corpora(rag, cache: ListingCache) -> list:
+    """Lista os corpus do projeto como dicts (name, display_name)"""
+    cached = cache.get("corpora")
+    if cached is not None:
+        return cached
+    corpora = [
+        {"name": c.name, "display_name": c.display_name}
+        for c in rag.list_corpora()
+    ]
+    cache.put("corpora", corpora)
+    return corpora
+
+
+def list_files(rag, cache: ListingCache, corpus_name: str) -> list:
+    """Lista os arquivos de um corpus como dicts"""
+    key = f"files:{corpus_name}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    files = [
+        {
+            "name": f.name,
+            "display_name": f.display_name,
+            "size_bytes": getattr(f, "size_bytes", None),
+        }
+        for f in rag.list_files(corpus_name=corpus_name)
+    ]
+    cache.put(key, files)
+    return files
+
+
+def fan_out(fn, items: list, workers: int):
+    """Executa fn(item) em paralelo, produzindo (item, resultado, erro) na
+    ordem de conclusão"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def corpora_with_files(rag, cache: ListingCache, workers: int = DEFAULT_WORKERS):
+    """Produz (corpus, arquivos) para cada corpus, listando em paralelo"""
+    corpora = list_corpora(rag, cache)
+    for corpus, files, error in fan_out(
+        lambda c: list_files(rag, cache, c["name"]), corpora, workers
+    ):
+        if error is None:
+            yield corpus, files
+
+
+def retrieval_contexts(response) -> list:
+    """Extrai (texto, source_uri, distância) de uma resposta de retrieval_query"""
+    contexts = getattr(getattr(response, "contexts", None), "contexts", None) or []
+    return [
+        {
+            "text": c.text,
+            "source_uri": getattr(c, "source_uri", None),
+            "distance": getattr(c, "distance", None),
+        }
+        for c in contexts
+    ]
+
+
+# ============================================================================
+# SUBCOMANDOS (saída NDJSON)
+# ============================================================================
+
+def emit(record: dict):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def cmd_list(rag, cache, args):
+    corpora = list_corpora(rag, cache)
+    for corpus, files, error in fan_out(
+        lambda c: list_files(rag, cache, c["name"]), corpora, args.workers
+    ):
+        record = dict(corpus)
+        if error is None:
+            record["file_count"] = len(files)
+        else:
+            record["error"] = str(error)
+        emit(record)
+
+
+def cmd_inspect(rag, cache, args):
+    from gcp_setup import corpus_resource_name
+
+    if args.all:
+        names = [c["name"] for c in list_corpora(rag, cache)]
+    else:
+        names = [corpus_resource_name(c) for c in args.corpus]
+
+    for corpus_name, files, error in fan_out(
+        lambda name: list_files(rag, cache, name), names, args.workers
+    ):
+        if error is not None:
+            emit({"corpus": corpus_name, "error": str(error)})
+            continue
+        for f in files:
+            emit({"corpus": corpus_name, **f})
+
+
+def cmd_search(rag, cache, args):
+    from gcp_setup import corpus_resource_name
+
+    if args.corpus:
+        names = [corpus_resource_name(c) for c in args.corpus]
+    else:
+        names = [c["name"] for c, files in corpora_with_files(rag, cache, args.workers) if files]
+
+    def search(corpus_name):
+        response = rag.retrieval_query(
+            rag_resources=[rag.RagResource(rag_corpus=corpus_name)],
+            text=args.query,
+            rag_retrieval_config=rag.RagRetrievalConfig(top_k=args.top_k),
+        )
+        return retrieval_contexts(response)
+
+    for corpus_name, contexts, error in fan_out(search, names, args.workers):
+        if error is not None:
+            emit({"corpus": corpus_name, "error": str(error)})
+            continue
+        for rank, context in enumerate(contexts, 1):
+            emit({"corpus": corpus_name, "rank": rank, **context})
+
+
+def cmd_delete(rag, cache, args):
+    from gcp_setup import corpus_resource_name
+
+    if not args.yes:
+        print("Recusado: confirme a exclusão com --yes", file=sys.stderr)
+        return 2
+
+    for corpus_name, _, error in fan_out(
+        lambda name: rag.delete_corpus(name=name),
+        [corpus_resource_name(c) for c in args.corpus],
+        args.workers,
+    ):
+        record = {"corpus": corpus_name, "deleted": error is None}
+        if error is not None:
+            record["error"] = str(error)
+        emit(record)
+        cache.invalidate(f"files:{corpus_name}")
+    cache.invalidate("corpora")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _add_global_options(parser, defaults: bool = True):
+    """--workers, --cache e --cache-ttl. Nos subcomandos ficam sem padrão
+    (SUPPRESS) para não sobrescrever o valor dado antes do subcomando."""
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser.add_argument("--workers", type=int, default=default(DEFAULT_WORKERS),
+                        help="Chamadas simultâneas ao Vertex AI")
+    parser.add_argument("--cache", default=default(DEFAULT_CACHE_PATH), help="Arquivo de cache local")
+    parser.add_argument("--cache-ttl", type=float, default=default(DEFAULT_CACHE_TTL),
+                        help="Validade do cache em segundos (0 desativa)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Administração dos corpus RAG (saída NDJSON)")
+    _add_global_options(parser)
+    # As opções globais valem antes ou depois do subcomando
+    # (list_corpus.py e check_corpus_content.py as recebem depois)
+    common = argparse.ArgumentParser(add_help=False)
+    _add_global_options(common, defaults=False)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", parents=[common], help="Lista os corpus com a contagem de arquivos")
+
+    p = sub.add_parser("inspect", parents=[common], help="Lista os arquivos de um ou mais corpus")
+    p.add_argument("corpus", nargs="*", help="ID ou nome completo do corpus")
+    p.add_argument("--all", action="store_true", help="Todos os corpus do projeto")
+
+    p = sub.add_parser("search", parents=[common], help="Retrieval query nos corpus")
+    p.add_argument("query")
+    p.add_argument("--corpus", action="append", help="Limita a busca a este corpus (repetível)")
+    p.add_argument("--top-k", type=int, default=5)
+
+    p = sub.add_parser("delete", parents=[common], help="Exclui um ou mais corpus")
+    p.add_argument("corpus", nargs="+")
+    p.add_argument("--yes", action="store_true", help="Confirma a exclusão")
+
+    return parser
+
+
+COMMANDS = {
+    "list": cmd_list,
+    "inspect": cmd_inspect,
+    "search": cmd_search,
+    "delete": cmd_delete,
+}
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "inspect" and not (args.all or args.corpus):
+        print("Informe um ou mais corpus ou --all", file=sys.stderr)
+        return 2
+
+    from gcp_setup import init_vertex_ai
+    from vertexai import rag
+
+    init_vertex_ai(verbose=False)
+    cache = ListingCache(args.cache, args.cache_ttl)
+    try:
+        return COMMANDS[args.command](rag, cache, args) or 0
+    finally:
+        cache.save()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Snapshot binário do corpus (texto, IDs, arquivos de origem e embeddings).
+
+Formato colunar, little-endian, lido via mmap sem cópia: vários workers podem
+abrir o mesmo arquivo na inicialização e compartilhar as páginas do cache do
+sistema operacional.
+
+    Cabeçalho   <8sIIII   magic, versão, n_chunks, n_sources, dim
+    Tabela      9 x <QQ   (offset, nbytes) de cada coluna
+    Colunas     alinhadas a 8 bytes:
+        0 id_offsets     uint64[n_chunks + 1]
+        1 id_blob        utf-8
+        2 text_offsets   uint64[n_chunks + 1]
+        3 text_blob      utf-8
+        4 source_index   uint32[n_chunks]
+        5 source_offsets uint64[n_sources + 1]
+        6 source_blob    utf-8
+        7 embeddings     float32[n_chunks * dim]
+        8 meta           JSON utf-8
+
+O Vertex AI RAG não expõe listagem de chunks nem os embeddings do corpus. O
+comando `export` coleta os chunks por retrieval queries (perguntas SERH e
+nomes dos arquivos do corpus) e, com --embed, calcula os embeddings com o
+modelo de embeddings do Vertex AI.
+
+É uma ferramenta offline: o app não lê o snapshot; ele alimenta o backend
+local do eval_retrieval.py (avaliação da busca sem chamar o Vertex AI).
+
+Uso:
+    python corpus_snapshot.py export --corpus <CORPUS_ID> --out serh.snap [--embed]
+    python corpus_snapshot.py info serh.snap
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+MAGIC = b"SERHSNP1"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sIIII")
+_COLUMN = struct.Struct("<QQ")
+_N_COLUMNS = 9
+_ALIGN = 8
+
+(COL_ID_OFFSETS, COL_ID_BLOB, COL_TEXT_OFFSETS, COL_TEXT_BLOB, COL_SOURCE_INDEX,
+ COL_SOURCE_OFFSETS, COL_SOURCE_BLOB, COL_EMBEDDINGS, COL_META) = range(_N_COLUMNS)
+
+# Perguntas usadas para coletar chunks quando nenhuma lista é informada
+DEFAULT_QUERIES = [
+    "Como cadastro auxílio-transporte no SERH?",
+    "Como solicito férias no SERH?",
+    "Posso parcelar as férias?",
+    "Como lançar frequência no SERH?",
+    "Estamos com problemas na importação de dados, dados errados e inconsistentes",
+    "Qual é o impacto no contracheque?",
+    "Como funciona o processo de admissão?",
+    "Como cancelar um benefício?",
+]
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Um chunk do corpus"""
+    chunk_id: str
+    text: str
+    source: str
+
+
+def chunk_id_for(source: str, text: str) -> str:
+    """ID estável de um chunk (hash da origem + texto)"""
+    return hashlib.sha1(f"{source}\0{text}".encode("utf-8")).hexdigest()[:20]
+
+
+# ============================================================================
+# ESCRITA
+# ============================================================================
+
+def _offsets_and_blob(values: list):
+    offsets = array("Q", [0])
+    parts = []
+    total = 0
+    for value in values:
+        encoded = value.encode("utf-8")
+        parts.append(encoded)
+        total += len(encoded)
+        offsets.append(total)
+    return offsets.tobytes(), b"".join(parts)
+
+
+def write_snapshot(path: str, chunks: list, embeddings: Optional[list] = None,
+                   meta: Optional[dict] = None):
+    """Grava o snapshot de forma atômica.
+
+    Args:
+        path: Arquivo de destino.
+        chunks: Lista de Chunk.
+        embeddings: Um vetor por chunk (mesma dimensão), ou None.
+        meta: Metadados livres (JSON), ex.: corpus e modelo de embeddings.
+    """
+    if sys.byteorder != "little":
+        raise RuntimeError("Snapshot suportado apenas em máquinas little-endian")
+
+    sources = sorted({c.source for c in chunks})
+    source_pos = {s: i for i, s in enumerate(sources)}
+
+    dim = len(embeddings[0]) if embeddings else 0
+    vectors = array("f")
+    if embeddings:
+        if len(embeddings) != len(chunks):
+            raise ValueError("É preciso um embedding por chunk")
+        for vector in embeddings:
+            if len(vector) != dim:
+                raise ValueError("Embeddings com dimensões diferentes")
+            vectors.extend(vector)
+
+    id_offsets, id_blob = _offsets_and_blob([c.chunk_id for c in chunks])
+    text_offsets, text_blob = _offsets_and_blob([c.text for c in chunks])
+    source_offsets, source_blob = _offsets_and_blob(sources)
+    columns = [
+        id_offsets,
+        id_blob,
+        text_offsets,
+        text_blob,
+        array("I", [source_pos[c.source] for c in chunks]).tobytes(),
+        source_offsets,
+        source_blob,
+        vectors.tobytes(),
+        json.dumps({"created_at": time.time(), **(meta or {})}, ensure_ascii=False).encode("utf-8"),
+    ]
+
+    position = _HEADER.size + _COLUMN.size * _N_COLUMNS
+    table = []
+    for data in columns:
+        position += -position % _ALIGN
+        table.append((position, len(data)))
+        position += len(data)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(chunks), len(sources), dim))
+        for offset, nbytes in table:
+            f.write(_COLUMN.pack(offset, nbytes))
+        for (offset, _), data in zip(table, columns):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ============================================================================
+# LEITURA (mmap, sem cópia)
+# ============================================================================
+
+class CorpusSnapshot:
+    """Snapshot aberto via mmap.
+
+    As colunas são memoryviews sobre o mapeamento; nada é copiado na abertura,
+    então abrir o arquivo custa o mesmo para 10 ou 100 mil chunks. Os textos só
+    são decodificados quando acessados.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise RuntimeError("Snapshot suportado apenas em máquinas little-endian")
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, self.n_chunks, self.n_sources, self.dim = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} não é um snapshot SERH v{VERSION}")
+
+        cols = []
+        for i in range(_N_COLUMNS):
+            offset, nbytes = _COLUMN.unpack_from(self._mmap, _HEADER.size + i * _COLUMN.size)
+            cols.append(self._view[offset:offset + nbytes])
+
+        self._id_offsets = cols[COL_ID_OFFSETS].cast("Q")
+        self._id_blob = cols[COL_ID_BLOB]
+        self._text_offsets = cols[COL_TEXT_OFFSETS].cast("Q")
+        self._text_blob = cols[COL_TEXT_BLOB]
+        self._source_index = cols[COL_SOURCE_INDEX].cast("I")
+        self._source_offsets = cols[COL_SOURCE_OFFSETS].cast("Q")
+        self._source_blob = cols[COL_SOURCE_BLOB]
+        self._embeddings = cols[COL_EMBEDDINGS].cast("f")
+        self.meta = json.loads(bytes(cols[COL_META]).decode("utf-8"))
+
+    @classmethod
+    def open(cls, path: str) -> "CorpusSnapshot":
+        return cls(path)
+
+    def __len__(self):
+        return self.n_chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # As memoryviews derivadas precisam ser liberadas antes do mmap
+        for name in ("_id_offsets", "_id_blob", "_text_offsets", "_text_blob",
+                     "_source_index", "_source_offsets", "_source_blob", "_embeddings"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    @staticmethod
+    def _string(offsets, blob, i: int) -> str:
+        return str(blob[offsets[i]:offsets[i + 1]], "utf-8")
+
+    def chunk_id(self, i: int) -> str:
+        return self._string(self._id_offsets, self._id_blob, i)
+
+    def text(self, i: int) -> str:
+        return self._string(self._text_offsets, self._text_blob, i)
+
+    def source(self, i: int) -> str:
+        return self._string(self._source_offsets, self._source_blob, self._source_index[i])
+
+    def sources(self) -> list:
+        return [self._string(self._source_offsets, self._source_blob, i) for i in range(self.n_sources)]
+
+    def chunk(self, i: int) -> Chunk:
+        return Chunk(self.chunk_id(i), self.text(i), self.source(i))
+
+    def __iter__(self):
+        return (self.chunk(i) for i in range(self.n_chunks))
+
+    def embedding(self, i: int) -> memoryview:
+        """Vetor do chunk i (memoryview float32 sobre o mmap)"""
+        return self._embeddings[i * self.dim:(i + 1) * self.dim]
+
+    def embeddings_matrix(self):
+        """Matriz n_chunks x dim como numpy.ndarray sem cópia (requer numpy)"""
+        import numpy as np
+        return np.frombuffer(self._embeddings, dtype=np.float32).reshape(self.n_chunks, self.dim)
+
+
+def open_snapshot(path: Optional[str]) -> Optional[CorpusSnapshot]:
+    """Abre o snapshot se o caminho existir (None caso contrário)"""
+    if not path or not os.path.exists(path):
+        return None
+    return CorpusSnapshot(path)
+
+
+# ============================================================================
+# EXPORTAÇÃO A PARTIR DO VERTEX AI
+# ============================================================================
+
+def harvest_chunks(rag, corpus_name: str, queries: list, top_k: int, workers: int) -> list:
+    """Coleta chunks do corpus via retrieval queries em paralelo (sem duplicatas)"""
+    from corpus_admin import fan_out, retrieval_contexts
+
+    def search(query):
+        response = rag.retrieval_query(
+            rag_resources=[rag.RagResource(rag_corpus=corpus_name)],
+            text=query,
+            rag_retrieval_config=rag.RagRetrievalConfig(top_k=top_k),
+        )
+        return retrieval_contexts(response)
+
+    seen = {}
+    for query, contexts, error in fan_out(search, queries, workers):
+        if error is not None:
+            print(f"  ✗ Erro na busca {query!r}: {error}", file=sys.stderr)
+            continue
+        for context in contexts:
+            source = context["source_uri"] or ""
+            cid = chunk_id_for(source, context["text"])
+            seen.setdefault(cid, Chunk(cid, context["text"], source))
+    return sorted(seen.values(), key=lambda c: (c.source, c.chunk_id))
+
+
+def embed_texts(texts: list, model_name: str, batch_size: int = 50) -> list:
+    """Calcula embeddings com o modelo de embeddings do Vertex AI"""
+    from vertexai.language_models import TextEmbeddingInput, TextEmbeddingModel
+
+    model = TextEmbeddingModel.from_pretrained(model_name)
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        batch = [TextEmbeddingInput(t, "RETRIEVAL_DOCUMENT") for t in texts[i:i + batch_size]]
+        vectors.extend(e.values for e in model.get_embeddings(batch))
+    return vectors
+
+
+def cmd_export(args) -> int:
+    from gcp_setup import corpus_resource_name, init_vertex_ai
+    from vertexai import rag
+
+    init_vertex_ai()
+    corpus_name = corpus_resource_name(args.corpus)
+
+    queries = list(DEFAULT_QUERIES)
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    # Os nomes dos arquivos puxam chunks de documentos que as perguntas não cobrem
+    queries += [f.display_name for f in rag.list_files(corpus_name=corpus_name)]
+
+    print(f"📥 Coletando chunks de {corpus_name} com {len(queries)} consultas...")
+    chunks = harvest_chunks(rag, corpus_name, queries, args.top_k, args.workers)
+    print(f"   {len(chunks)} chunk(s) únicos")
+
+    embeddings = None
+    if args.embed:
+        print(f"🧮 Calculando embeddings com {args.embedding_model}...")
+        embeddings = embed_texts([c.text for c in chunks], args.embedding_model)
+
+    meta = {"corpus_name": corpus_name}
+    if embeddings:
+        meta["embedding_model"] = args.embedding_model
+    write_snapshot(args.out, chunks, embeddings, meta)
+    print(f"✅ Snapshot gravado em {args.out} ({os.path.getsize(args.out)} bytes)")
+    return 0
+
+
+def cmd_info(args) -> int:
+    started = time.perf_counter()
+    with CorpusSnapshot(args.path) as snap:
+        opened_ms = (time.perf_counter() - started) * 1000
+        print(json.dumps({
+            "path": args.path,
+            "chunks": len(snap),
+            "sources": snap.n_sources,
+            "dim": snap.dim,
+            "bytes": os.path.getsize(args.path),
+            "open_ms": round(opened_ms, 3),
+            "meta": snap.meta,
+        }, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Snapshot binário do corpus RAG")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Exporta o corpus para um snapshot")
+    # Sem padrão em CORPUS_ID: o ID do app é de outro projeto (GCP_PROJECT_ID)
+    p.add_argument("--corpus", required=True,
+                   help="ID (no projeto PROJECT_ID/LOCATION) ou nome completo do corpus")
+    p.add_argument("--out", default="serh_corpus.snap")
+    p.add_argument("--queries", help="Arquivo com uma consulta por linha")
+    p.add_argument("--top-k", type=int, default=50)
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--embed", action="store_true", help="Calcula e grava embeddings")
+    p.add_argument("--embedding-model", default="text-embedding-005")
+
+    p = sub.add_parser("info", help="Mostra o resumo de um snapshot")
+    p.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        return cmd_export(args)
+    return cmd_info(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
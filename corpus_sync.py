@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""Sincronização incremental de uma pasta do Google Drive com um corpus RAG.
+
+Substitui o fluxo de create_corpus_with_gdrive.py (novo corpus + um
+import_files bloqueante da pasta inteira) por uma sincronização do corpus
+existente, mantendo o mesmo ID:
+
+1. Lista os arquivos da pasta no Drive com um hash de conteúdo.
+2. Compara com o manifesto local (ID do arquivo -> hash + RagFile).
+3. Remove do corpus os arquivos que saíram da pasta ou mudaram.
+4. Importa apenas os arquivos novos ou alterados, em lotes concorrentes.
+
+O manifesto é gravado de forma atômica a cada passo concluído, então uma
+execução interrompida continua de onde parou. Antes de cada lote o manifesto
+registra o import pendente (hash em "pending"); se o processo cair entre o
+import e a gravação, a próxima execução encontra o RagFile pelo display_name
+e o adota em vez de importar de novo (o que criaria um RagFile duplicado).
+
+Uso:
+    python corpus_sync.py --folder <ID_PASTA_DRIVE> --corpus <CORPUS_ID>
+    python corpus_sync.py --folder <ID_PASTA_DRIVE> --corpus <CORPUS_ID> --dry-run
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
+DEFAULT_FOLDER_ID = "1sdWc44QZD-3sQYdpVYJ0vY5MbmlfdAg8"
+DEFAULT_MANIFEST = "corpus_manifest.json"
+MANIFEST_VERSION = 1
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+DRIVE_FOLDER_MIME = "application/vnd.google-apps.folder"
+
+# ============================================================================
+# FONTE: arquivos da pasta do Google Drive
+# ============================================================================
+
+@dataclass(frozen=True)
+class SourceFile:
+    """Arquivo da fonte com identificador estável e hash de conteúdo"""
+    id: str
+    name: str
+    url: str
+    content_hash: str
+
+
+class DriveFolderSource:
+    """Lista os arquivos de uma pasta do Drive (recursivamente) via API REST.
+
+    Arquivos binários trazem md5Checksum. Documentos nativos do Google (Docs,
+    Sheets...) não têm checksum; para eles o hash é a `version` do arquivo,
+    que o Drive incrementa a cada alteração.
+    """
+
+    def __init__(self, folder_id: str, session=None):
+        self.folder_id = folder_id
+        self._session = session
+
+    def _get_session(self):
+        if self._session is None:
+            import google.auth
+            from google.auth.transport.requests import AuthorizedSession
+
+            credentials, _ = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/drive.readonly"]
+            )
+            self._session = AuthorizedSession(credentials)
+        return self._session
+
+    def list_files(self) -> list:
+        files = []
+        pending = [self.folder_id]
+        while pending:
+            folder = pending.pop()
+            for item in self._list_children(folder):
+                if item["mimeType"] == DRIVE_FOLDER_MIME:
+                    pending.append(item["id"])
+                    continue
+                content_hash = item.get("md5Checksum") or f"v{item.get('version', '0')}"
+                files.append(SourceFile(
+                    id=item["id"],
+                    name=item["name"],
+                    url=f"https://drive.google.com/file/d/{item['id']}",
+                    content_hash=content_hash,
+                ))
+        return files
+
+    def _list_children(self, folder_id: str):
+        session = self._get_session()
+        params = {
+            "q": f"'{folder_id}' in parents and trashed = false",
+            "fields": "nextPageToken, files(id, name, mimeType, md5Checksum, version)",
+            "pageSize": 1000,
+            "supportsAllDrives": "true",
+            "includeItemsFromAllDrives": "true",
+        }
+        while True:
+            resp = session.get(DRIVE_FILES_URL, params=params, timeout=30)
+            resp.raise_for_status()
+            data = resp.json()
+            yield from data.get("files", [])
+            if not data.get("nextPageToken"):
+                return
+            params["pageToken"] = data["nextPageToken"]
+
+
+# ============================================================================
+# CLIENTES RAG: Vertex AI e fake em memória
+# ============================================================================
+
+class VertexRagClient:
+    """Operações de arquivos do corpus usando vertexai.rag"""
+
+    # Erros em que vale esperar e tentar de novo. O Vertex recusa imports
+    # simultâneos no mesmo corpus com FailedPrecondition/Aborted.
+    RETRY_ATTEMPTS = 5
+    RETRY_BACKOFF = 5.0
+
+    def __init__(self, corpus_name: str):
+        from vertexai import rag
+        self._rag = rag
+        self.corpus_name = corpus_name
+
+    def import_files(self, urls: list):
+        from google.api_core import exceptions as google_exceptions
+
+        retryable = (
+            google_exceptions.FailedPrecondition,
+            google_exceptions.Aborted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.TooManyRequests,
+        )
+        for attempt in range(1, self.RETRY_ATTEMPTS + 1):
+            try:
+                response = self._rag.import_files(corpus_name=self.corpus_name, paths=urls)
+                return (
+                    response.imported_rag_files_count,
+                    response.skipped_rag_files_count,
+                )
+            except retryable:
+                if attempt == self.RETRY_ATTEMPTS:
+                    raise
+                time.sleep(self.RETRY_BACKOFF * attempt)
+
+    def list_files(self) -> list:
+        """Lista (name, display_name) dos RagFiles do corpus"""
+        return [
+            (f.name, f.display_name)
+            for f in self._rag.list_files(corpus_name=self.corpus_name)
+        ]
+
+    def delete_file(self, rag_file_name: str):
+        self._rag.delete_file(name=rag_file_name)
+
+
+class InMemoryRagClient:
+    """Corpus fake em memória, com a mesma interface do VertexRagClient.
+
+    Usado pelo --dry-run e para exercitar a lógica de sincronização sem
+    acesso ao Vertex AI. `names` mapeia URL -> display_name.
+    """
+
+    def __init__(self, names: Optional[dict] = None):
+        self.names = names or {}
+        self.files = {}  # rag_file_name -> display_name
+        self.calls = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def import_files(self, urls: list):
+        with self._lock:
+            self.calls.append(("import", list(urls)))
+            for url in urls:
+                self._counter += 1
+                name = f"ragFiles/{self._counter}"
+                self.files[name] = self.names.get(url, url.rsplit("/", 1)[-1])
+        return len(urls), 0
+
+    def list_files(self) -> list:
+        with self._lock:
+            return list(self.files.items())
+
+    def delete_file(self, rag_file_name: str):
+        with self._lock:
+            self.calls.append(("delete", rag_file_name))
+            self.files.pop(rag_file_name, None)
+
+
+# ============================================================================
+# MANIFESTO
+# ============================================================================
+
+class Manifest:
+    """Estado local da sincronização: ID do arquivo -> hash e RagFile.
+
+    Entradas com "rag_file": null já foram importadas mas ainda não tiveram o
+    nome do RagFile resolvido; entradas com "hash": null precisam ser
+    (re)importadas; "pending" guarda o hash de um import em andamento.
+    """
+
+    def __init__(self, path: str, corpus_name: str, files: Optional[dict] = None):
+        self.path = path
+        self.corpus_name = corpus_name
+        self.files = files or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, corpus_name: str) -> "Manifest":
+        if not os.path.exists(path):
+            return cls(path, corpus_name)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("corpus_name") != corpus_name:
+            raise ValueError(
+                f"Manifesto {path} pertence ao corpus {data.get('corpus_name')}, "
+                f"não a {corpus_name}"
+            )
+        return cls(path, corpus_name, data.get("files", {}))
+
+    def update(self, file_id: str, **fields):
+        with self._lock:
+            self.files.setdefault(file_id, {}).update(fields)
+            self._save()
+
+    def remove(self, file_id: str):
+        with self._lock:
+            self.files.pop(file_id, None)
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "corpus_name": self.corpus_name, "files": self.files},
+                f, ensure_ascii=False, indent=2,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+# ============================================================================
+# SINCRONIZAÇÃO
+# ============================================================================
+
+@dataclass
+class SyncPlan:
+    to_import: list  # SourceFile novos ou alterados
+    to_delete: list  # file_ids removidos da fonte
+    unchanged: int
+
+
+@dataclass
+class SyncResult:
+    imported: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    failed_batches: int = 0
+
+
+def plan_sync(source_files: list, manifest: Manifest) -> SyncPlan:
+    """Compara a fonte com o manifesto"""
+    current = {f.id: f for f in source_files}
+    to_import = [
+        f for f in source_files
+        if manifest.files.get(f.id, {}).get("hash") != f.content_hash
+    ]
+    to_delete = [file_id for file_id in manifest.files if file_id not in current]
+    unchanged = len(source_files) - len(to_import)
+    return SyncPlan(to_import, to_delete, unchanged)
+
+
+def resolve_rag_files(client, manifest: Manifest, current_hashes: Optional[dict] = None,
+                      log=print):
+    """Preenche o nome do RagFile das entradas importadas sem nome resolvido.
+
+    O import_files não devolve os nomes dos RagFiles criados; eles são
+    associados pelo display_name, ignorando os já atribuídos a outra entrada.
+
+    Com `current_hashes` (ID do arquivo -> hash atual na fonte), resolve
+    também os imports interrompidos ("pending"): se o RagFile existe e o hash
+    ainda é o atual, é adotado; se a fonte mudou ou o arquivo saiu, o RagFile
+    órfão é removido e o arquivo segue para (re)importação.
+    """
+    pending = {
+        file_id: entry for file_id, entry in manifest.files.items()
+        if not entry.get("rag_file")
+        and (entry.get("hash") or (current_hashes is not None and entry.get("pending")))
+    }
+    if not pending:
+        return
+
+    claimed = {e.get("rag_file") for e in manifest.files.values() if e.get("rag_file")}
+    by_name = {}
+    for rag_name, display_name in client.list_files():
+        if rag_name not in claimed:
+            by_name.setdefault(display_name, []).append(rag_name)
+
+    for file_id, entry in pending.items():
+        candidates = by_name.get(entry.get("name"))
+        if entry.get("hash"):
+            if candidates:
+                manifest.update(file_id, rag_file=candidates.pop(0))
+            continue
+
+        # Import interrompido antes de gravar o manifesto
+        if candidates and current_hashes.get(file_id) == entry["pending"]:
+            manifest.update(file_id, hash=entry["pending"], pending=None,
+                            rag_file=candidates.pop(0))
+            log(f"  ↺ {entry.get('name')}: import anterior concluído, RagFile adotado")
+            continue
+        for rag_file in candidates or []:
+            client.delete_file(rag_file)
+            log(f"  ✗ {entry.get('name')}: RagFile órfão de import interrompido removido")
+        manifest.update(file_id, pending=None)
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def sync(source, client, manifest: Manifest, batch_size: int = 10, workers: int = 2,
+         log=print) -> SyncResult:
+    """Sincroniza a fonte com o corpus, atualizando o manifesto a cada passo.
+
+    Args:
+        source: Objeto com list_files() -> list[SourceFile].
+        client: VertexRagClient ou InMemoryRagClient.
+        manifest: Manifesto carregado do disco.
+        batch_size: Arquivos por chamada de import_files.
+        workers: Lotes de import (e remoções) em paralelo.
+        log: Função de saída de progresso.
+
+    Returns:
+        SyncResult com contadores da execução.
+    """
+    result = SyncResult()
+
+    # Retoma uma execução anterior interrompida antes de resolver os nomes
+    # (ou antes de gravar o resultado de um import)
+    source_files = source.list_files()
+    resolve_rag_files(client, manifest, {f.id: f.content_hash for f in source_files}, log)
+
+    plan = plan_sync(source_files, manifest)
+    log(f"📋 {len(source_files)} arquivo(s) na fonte: {len(plan.to_import)} para importar, "
+        f"{len(plan.to_delete)} para remover, {plan.unchanged} sem alteração")
+
+    # Arquivos removidos da fonte ou alterados saem do corpus primeiro
+    removals = [(file_id, True) for file_id in plan.to_delete]
+    removals += [
+        (f.id, False) for f in plan.to_import
+        if manifest.files.get(f.id, {}).get("rag_file")
+    ]
+
+    def remove(file_id, forget):
+        rag_file = manifest.files[file_id].get("rag_file")
+        if rag_file:
+            client.delete_file(rag_file)
+        if forget:
+            manifest.remove(file_id)
+        else:
+            # Marca para reimportação caso a execução pare antes do import
+            manifest.update(file_id, rag_file=None, hash=None)
+
+    failed_removals = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(remove, file_id, forget): file_id for file_id, forget in removals}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                result.deleted += 1
+            except Exception as e:
+                failed_removals.add(futures[future])
+                log(f"  ✗ Erro ao remover {futures[future]}: {e}")
+
+    # Imports em lotes concorrentes (sem reimportar o que não pôde ser removido)
+    to_import = [f for f in plan.to_import if f.id not in failed_removals]
+    batches = list(_chunks(to_import, batch_size))
+
+    def import_batch(batch):
+        for f in batch:
+            manifest.update(f.id, name=f.name, pending=f.content_hash)
+        imported, skipped = client.import_files([f.url for f in batch])
+        for f in batch:
+            manifest.update(f.id, name=f.name, hash=f.content_hash, rag_file=None, pending=None)
+        return imported, skipped
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(import_batch, batch): batch for batch in batches}
+        for done, future in enumerate(as_completed(futures), 1):
+            batch = futures[future]
+            try:
+                imported, skipped = future.result()
+                result.imported += imported
+                result.skipped += skipped
+                log(f"  [{done}/{len(batches)}] lote com {len(batch)} arquivo(s): "
+                    f"{imported} importado(s), {skipped} pulado(s)")
+            except Exception as e:
+                result.failed_batches += 1
+                log(f"  [{done}/{len(batches)}] ✗ Erro no lote: {e}")
+
+    resolve_rag_files(client, manifest)
+    return result
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sincroniza uma pasta do Drive com o corpus RAG")
+    parser.add_argument("--folder", default=os.getenv("GOOGLE_DRIVE_FOLDER_ID", DEFAULT_FOLDER_ID),
+                        help="ID da pasta do Google Drive")
+    # Sem padrão: CORPUS_ID é do app (GCP_PROJECT_ID), e um ID curto aqui é
+    # resolvido no projeto dos scripts (PROJECT_ID/LOCATION)
+    parser.add_argument("--corpus", required=True,
+                        help="ID (no projeto PROJECT_ID/LOCATION) ou nome completo do corpus")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="Arquivo do manifesto local")
+    parser.add_argument("--batch-size", type=int, default=10, help="Arquivos por import")
+    parser.add_argument("--workers", type=int, default=2, help="Lotes em paralelo")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Simula o corpus em memória (não altera o Vertex AI nem o manifesto)")
+    args = parser.parse_args(argv)
+
+    from gcp_setup import corpus_resource_name, init_vertex_ai
+
+    init_vertex_ai()
+    corpus_name = corpus_resource_name(args.corpus)
+    source = DriveFolderSource(args.folder)
+
+    manifest_path = args.manifest
+    if args.dry_run:
+        import shutil
+        import tempfile
+        manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        if os.path.exists(args.manifest):
+            shutil.copy(args.manifest, manifest_path)
+        client = InMemoryRagClient()
+        print("🧪 Dry-run: corpus simulado em memória")
+    else:
+        client = VertexRagClient(corpus_name)
+
+    print(f"\n🔄 Sincronizando pasta {args.folder} -> {corpus_name}\n")
+    started = time.monotonic()
+    try:
+        manifest = Manifest.load(manifest_path, corpus_name)
+        result = sync(source, client, manifest, args.batch_size, args.workers)
+    except Exception as e:
+        print(f"\n❌ Erro: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+    print(f"\n✅ Sincronização concluída em {time.monotonic() - started:.1f}s")
+    print(f"   Importados: {result.imported}")
+    print(f"   Pulados: {result.skipped}")
+    print(f"   Removidos: {result.deleted}")
+    if result.failed_batches:
+        print(f"   ⚠️  Lotes com erro: {result.failed_batches} (rode novamente para retomar)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Versão dos corpus para invalidar caches sem reiniciar o serviço.
+
+Uma thread de fundo lista os arquivos de cada corpus a cada
+CORPUS_VERSION_POLL_INTERVAL segundos e calcula uma impressão digital (hash
+de nome, tamanho e datas de cada arquivo). Se algum corpus mudou (arquivos
+reimportados, adicionados ou removidos), a geração global é incrementada.
+
+As listagens usam a vaga de busca com prioridade de manutenção
+(scheduler.py), sem disputar com o chat ao vivo.
+
+Todo cache de resultados derivados do corpus inclui current_generation() na
+chave: invalidar é só mudar o número (O(1)); as entradas antigas deixam de
+ser encontradas e saem pelo LRU. A primeira listagem só registra o estado
+inicial. Com intervalo 0 a verificação fica desligada (geração fixa).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import eventlog
+import scheduler
+
+CORPUS_VERSION_POLL_INTERVAL = float(os.getenv("CORPUS_VERSION_POLL_INTERVAL", 60))
+# Espera máxima por uma vaga da busca (a verificação é manutenção)
+SLOT_TIMEOUT = 30.0
+
+_generation = 0
+_lock = threading.Lock()
+
+
+def current_generation() -> int:
+    return _generation
+
+
+def bump(reason: str = "") -> int:
+    """Invalida todos os caches derivados do corpus"""
+    global _generation
+    with _lock:
+        _generation += 1
+        generation = _generation
+    eventlog.log("corpus.changed", generation=generation, reason=reason)
+    return generation
+
+
+def _list_files(corpus_name: str) -> list:
+    from vertexai import rag
+    return list(rag.list_files(corpus_name=corpus_name))
+
+
+def fingerprint(files) -> str:
+    """Hash estável da listagem (independe da ordem)"""
+    entries = sorted(
+        "|".join(str(getattr(f, attr, None)) for attr in
+                 ("name", "display_name", "size_bytes", "create_time", "update_time"))
+        for f in files
+    )
+    return hashlib.sha256("\n".join(entries).encode("utf-8")).hexdigest()[:16]
+
+
+class CorpusVersionTracker:
+    """Verificação periódica dos corpus que incrementa a geração ao mudar.
+
+    Args:
+        corpora: Nomes completos dos corpus acompanhados.
+        interval: Segundos entre verificações (0 desliga).
+        list_files: Lista os arquivos de um corpus (padrão rag.list_files).
+    """
+
+    def __init__(self, corpora: list, interval: float = CORPUS_VERSION_POLL_INTERVAL,
+                 list_files: Optional[Callable] = None):
+        self.corpora = sorted(set(corpora))
+        self.interval = interval
+        self._list_files = list_files or _list_files
+        self._fingerprints = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Métricas
+        self.polls = 0
+        self.changes = 0
+        self.poll_errors = 0
+        self.last_poll = None
+        self.last_change = None
+        self.last_poll_ms = 0.0
+
+    def poll(self) -> bool:
+        """Verifica todos os corpus; True se algum mudou desde a última vez"""
+        started = time.monotonic()
+        changed = []
+        for corpus in self.corpora:
+            try:
+                with scheduler.retrieval.slot(scheduler.MAINTENANCE, timeout=SLOT_TIMEOUT):
+                    files = self._list_files(corpus)
+                current = fingerprint(files)
+            except Exception as e:
+                # Falha na listagem não invalida nada; tenta na próxima
+                self.poll_errors += 1
+                eventlog.log("corpus.version_poll_error", level="warning", exc=e,
+                             corpus=corpus.rsplit("/", 1)[-1])
+                continue
+            previous = self._fingerprints.get(corpus)
+            self._fingerprints[corpus] = current
+            if previous is not None and previous != current:
+                changed.append(corpus.rsplit("/", 1)[-1])
+
+        self.polls += 1
+        self.last_poll = time.time()
+        self.last_poll_ms = (time.monotonic() - started) * 1000
+        if changed:
+            self.changes += 1
+            self.last_change = self.last_poll
+            bump(", ".join(changed))
+        return bool(changed)
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="corpus-version", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self.poll()
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        return {
+            "generation": current_generation(),
+            "corpora": len(self.corpora),
+            "interval_s": self.interval,
+            "polls": self.polls,
+            "changes": self.changes,
+            "poll_errors": self.poll_errors,
+            "last_poll": self.last_poll,
+            "last_change": self.last_change,
+            "last_poll_ms": round(self.last_poll_ms, 1),
+        }
@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
-"""Script para criar novo corpus e fazer import de arquivos do Google Drive"""
+"""Script para criar novo corpus e fazer import de arquivos do Google Drive
+
+Use apenas para criar o corpus. Atualizações de conteúdo devem ser feitas com
+corpus_sync.py, que importa só o que mudou e mantém o ID do corpus.
+"""
 
 import os
 import sys
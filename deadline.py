@@ -0,0 +1,175 @@
+"""Orçamento de tempo (deadline) por requisição do /chat.
+
+O portal desiste da requisição depois de ~15s. Este módulo mantém um prazo
+absoluto por requisição e propaga o tempo restante para a busca no corpus, para
+cada rodada do modelo e para as novas tentativas da ferramenta. Quando o prazo
+estoura ou o cliente desconecta, o trabalho pendente é cancelado na próxima
+oportunidade em vez de continuar consumindo capacidade.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Prazo padrão e máximo aceitos por requisição (segundos)
+DEFAULT_CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE_SECONDS", 15))
+MAX_CHAT_DEADLINE = float(os.getenv("CHAT_MAX_DEADLINE_SECONDS", 60))
+
+# Intervalo de verificação de desconexão do cliente (segundos)
+DISCONNECT_POLL_INTERVAL = 0.25
+
+# Executor compartilhado para chamadas bloqueantes limitadas por deadline
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DEADLINE_WORKERS", 32)),
+    thread_name_prefix="deadline",
+)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("serh_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """O orçamento de tempo da requisição se esgotou"""
+
+
+class RequestCancelled(Exception):
+    """O cliente desconectou antes da resposta ficar pronta"""
+
+
+class Deadline:
+    """Prazo absoluto de uma requisição, com sinal de cancelamento.
+
+    Baseado em time.monotonic(), portanto imune a ajustes de relógio.
+    Pode ser compartilhado entre threads: o cancelamento é um threading.Event.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        """Segundos restantes (nunca negativo)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Sinaliza que o trabalho restante deve ser abandonado"""
+        self._cancelled.set()
+
+    def check(self):
+        """Levanta exceção se a requisição foi cancelada ou o prazo acabou"""
+        if self._cancelled.is_set():
+            raise RequestCancelled("Requisição cancelada")
+        if self.expired():
+            raise DeadlineExceeded(f"Prazo de {self.timeout:.1f}s esgotado")
+
+    def sleep(self, seconds: float) -> bool:
+        """Dorme até `seconds`, acordando cedo se a requisição for cancelada.
+
+        Returns:
+            bool: True se dormiu o tempo todo, False se foi cancelada.
+        """
+        return not self._cancelled.wait(min(seconds, self.remaining()))
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline da requisição corrente (ou None fora de uma requisição)"""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    """Torna `deadline` a deadline corrente dentro do bloco"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def deadline_from_request(header_value: Optional[str], body_value: Optional[float]) -> Deadline:
+    """Cria a deadline de uma requisição.
+
+    O cliente pode informar o tempo que está disposto a esperar pelo header
+    `X-Request-Timeout` ou pelo campo `timeout` do corpo (segundos). Vale o
+    menor valor informado, limitado a CHAT_MAX_DEADLINE_SECONDS. Sem nenhum
+    dos dois, usa CHAT_DEADLINE_SECONDS.
+    """
+    candidates = []
+    if header_value:
+        try:
+            candidates.append(float(header_value))
+        except ValueError:
+            pass
+    if body_value:
+        candidates.append(float(body_value))
+
+    candidates = [c for c in candidates if c > 0]
+    timeout = min(candidates) if candidates else DEFAULT_CHAT_DEADLINE
+    return Deadline(min(timeout, MAX_CHAT_DEADLINE))
+
+
+async def run_until_deadline(request, deadline: Deadline, fn, *args, hold=None):
+    """Executa `fn` em thread enquanto acompanha a deadline e a conexão.
+
+    Retorna o resultado de `fn`. Se o cliente desconectar, levanta
+    RequestCancelled; se o prazo acabar, levanta DeadlineExceeded. Em ambos os
+    casos a deadline é cancelada para que o trabalho em andamento pare na
+    próxima rodada do modelo ou da ferramenta. A thread só termina nesse
+    ponto: `hold` (ex.: Slot.hold da admissão) recebe o future da thread para
+    manter a vaga ocupada até lá.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    future = loop.run_in_executor(_executor, ctx.run, fn, *args)
+    if hold is not None:
+        hold(future)
+
+    try:
+        while True:
+            timeout = min(DISCONNECT_POLL_INTERVAL, deadline.remaining())
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+            if done:
+                return future.result()
+            if deadline.expired():
+                raise DeadlineExceeded(f"Prazo de {deadline.timeout:.1f}s esgotado")
+            if request is not None and await request.is_disconnected():
+                raise RequestCancelled("Cliente desconectou")
+    except (DeadlineExceeded, RequestCancelled, asyncio.CancelledError):
+        deadline.cancel()
+        raise
+
+
+class DeadlineCallbackHandler(BaseCallbackHandler):
+    """Interrompe o agente entre rodadas quando a deadline acaba.
+
+    Registrado em config["callbacks"] do agent.query(); o LangGraph chama estes
+    hooks antes de cada rodada do modelo e de cada chamada de ferramenta.
+    """
+
+    raise_error = True
+
+    def __init__(self, deadline: Deadline):
+        self.deadline = deadline
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.deadline.check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.deadline.check()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.deadline.check()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""Avaliação offline da busca: qualidade x custo sobre o golden set do SERH
+
+Para cada pergunta do golden set (golden/serh_golden.json, versionado),
+busca os candidatos uma vez na profundidade máxima e simula cada
+configuração da varredura:
+
+- top_k: trechos enviados ao agente;
+- truncate: corte de caracteres por trecho (o antigo [:500]);
+- max_distance: descarta trechos com distância acima do limite;
+- rerank: re-ranking local (rerank.py) antes do corte em top_k.
+
+Relatório por configuração: recall@k e MRR nas perguntas respondíveis,
+taxa de abstenção nas perguntas fora do escopo (expect_none: nenhum
+trecho dentro de max_distance), separação entre as distâncias das perguntas
+fora do escopo e das respondíveis (none_auc), tokens de contexto e latência
+(busca + processamento local).
+
+Backends:
+    --backend live       Vertex AI RAG (CORPUS_IDS/CORPUS_ID), via retrieval.py
+    --backend local      Snapshot do corpus (corpus_snapshot.py) com BM25
+    --backend recorded   Candidatos gravados antes com --record
+
+Uso:
+    python eval_retrieval.py --backend local --snapshot serh_corpus.snap
+    python eval_retrieval.py --backend live --record gravacao.json
+    python eval_retrieval.py --backend recorded --recording gravacao.json --output resultado.json
+    python eval_retrieval.py --backend local --snapshot serh_corpus.snap --top-k 3,5 --max-distance none,0.5
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from conversation_store import estimate_tokens
+from rerank import rerank, tokenize
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "serh_golden.json")
+
+# Profundidade da busca: cobre o maior top_k e os candidatos do re-ranking
+FETCH_DEPTH = 20
+
+SWEEP = {
+    "top_k": (3, 5, 10),
+    "truncate": (300, 500, 1000),
+    "max_distance": (None, 0.6),
+    "rerank": (False, True),
+}
+
+
+@dataclass
+class Candidate:
+    """Trecho candidato (mesmos campos usados de RetrievedChunk)"""
+    text: str
+    source_uri: Optional[str] = None
+    distance: Optional[float] = None
+    score: float = 0.0
+    corpus: str = ""
+
+
+@dataclass(frozen=True)
+class EvalConfig:
+    top_k: int
+    truncate: int
+    max_distance: Optional[float]
+    rerank: bool
+
+    @property
+    def name(self) -> str:
+        distance = "-" if self.max_distance is None else f"{self.max_distance:g}"
+        return f"k={self.top_k} trunc={self.truncate} dist<={distance} rerank={'on' if self.rerank else 'off'}"
+
+
+def sweep_configs(sweep: dict = SWEEP) -> list:
+    keys = list(sweep)
+    return [EvalConfig(**dict(zip(keys, values))) for values in itertools.product(*sweep.values())]
+
+
+# ============================================================================
+# GOLDEN SET
+# ============================================================================
+
+def load_golden(path: str = GOLDEN_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        golden = json.load(f)
+    if "version" not in golden or "questions" not in golden:
+        raise ValueError(f"Golden set inválido: {path}")
+    return golden
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def is_relevant(chunk: Candidate, question: dict) -> bool:
+    sources = question.get("expected_sources") or []
+    if sources:
+        uri = chunk.source_uri or ""
+        return any(s in uri for s in sources)
+    text = _fold(chunk.text)
+    if not any(_fold(term) in text for term in question.get("expected_terms") or []):
+        return False
+    topics = question.get("topic_terms") or []
+    return not topics or any(_fold(term) in text for term in topics)
+
+
+def none_auc(best_distances: dict, golden: dict) -> Optional[float]:
+    """Separação entre perguntas fora do escopo e respondíveis
+
+    Fração dos pares (expect_none, respondível) em que o melhor candidato da
+    pergunta fora do escopo está mais longe que o da respondível (empate vale
+    meio). 1.0 significa que existe um max_distance que abstém em todas as
+    perguntas fora do escopo sem perder nenhuma respondível; 0.5 é acaso.
+    Pergunta sem candidatos conta com distância infinita.
+    """
+    none, answerable = [], []
+    for question in golden["questions"]:
+        distance = best_distances.get(question["id"])
+        distance = math.inf if distance is None else distance
+        (none if question.get("expect_none") else answerable).append(distance)
+    if not none or not answerable:
+        return None
+    wins = sum(1.0 if n > a else 0.5 if n == a else 0.0 for n in none for a in answerable)
+    return wins / (len(none) * len(answerable))
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class LiveBackend:
+    """Busca federada no Vertex AI RAG (mesmo caminho da ferramenta do agente).
+
+    Projeto, região e corpus são os do app (GCP_PROJECT_ID/GCP_LOCATION e
+    CORPUS_IDS/CORPUS_ID), não os PROJECT_ID/LOCATION dos scripts.
+    """
+
+    name = "live"
+
+    def __init__(self, depth: int = FETCH_DEPTH):
+        from gcp_setup import app_corpus_names, app_target, init_vertex_ai
+
+        # Sem corpus configurado: erro antes de qualquer chamada à API
+        self.corpora = app_corpus_names()
+        init_vertex_ai(verbose=False, target=app_target())
+
+        from retrieval import cache
+
+        # Latência medida é a da busca real, não a do cache de resultados
+        cache.max_entries = 0
+        self.depth = depth
+
+    def fetch(self, question: dict) -> tuple:
+        from retrieval import federated_search
+
+        started = time.perf_counter()
+        chunks = federated_search(question["query"], self.corpora, top_k=self.depth)
+        latency = time.perf_counter() - started
+        return [
+            Candidate(c.text, c.source_uri, c.distance, c.score, c.corpus) for c in chunks
+        ], latency
+
+
+class LocalBackend:
+    """BM25 sobre os trechos de um snapshot do corpus (sem rede)"""
+
+    name = "local"
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, snapshot_path: str, depth: int = FETCH_DEPTH):
+        from corpus_snapshot import CorpusSnapshot
+
+        self.depth = depth
+        self.texts = []
+        self.sources = []
+        self.tfs = []
+        df = Counter()
+        with CorpusSnapshot(snapshot_path) as snapshot:
+            for chunk in snapshot:
+                terms = Counter(tokenize(chunk.text))
+                self.texts.append(chunk.text)
+                self.sources.append(chunk.source)
+                self.tfs.append(terms)
+                df.update(terms.keys())
+        n = max(len(self.texts), 1)
+        self.lengths = [sum(tf.values()) for tf in self.tfs]
+        self.avg_length = max(sum(self.lengths) / n, 1.0)
+        self.idf = {t: math.log1p((n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        self.max_idf = math.log1p((n + 0.5) / 0.5)
+
+    def fetch(self, question: dict) -> tuple:
+        started = time.perf_counter()
+        terms = set(tokenize(question["query"]))
+        scores = []
+        for i, tf in enumerate(self.tfs):
+            norm = self.K1 * (1 - self.B + self.B * self.lengths[i] / self.avg_length)
+            score = sum(
+                self.idf[t] * tf[t] * (self.K1 + 1) / (tf[t] + norm) for t in terms if t in tf
+            )
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        top = scores[:self.depth]
+        # Distância sintética: 1 - score / teto do BM25 para a consulta. Relativa ao
+        # teto, e não ao melhor trecho, para uma consulta fora do escopo (termos
+        # raros ou ausentes do corpus) ficar longe e max_distance poder abster.
+        ceiling = sum(self.idf.get(t, self.max_idf) for t in terms) * (self.K1 + 1) or 1.0
+        candidates = [
+            Candidate(self.texts[i], self.sources[i], 1.0 - score / ceiling, score / ceiling, "local")
+            for score, i in top
+        ]
+        return candidates, time.perf_counter() - started
+
+
+class RecordedBackend:
+    """Candidatos e latências gravados de outro backend (--record)"""
+
+    name = "recorded"
+
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            recording = json.load(f)
+        self.source_backend = recording.get("backend")
+        self.items = recording["questions"]
+
+    def fetch(self, question: dict) -> tuple:
+        item = self.items.get(question["id"])
+        if item is None:
+            raise KeyError(f"Pergunta {question['id']} não está na gravação")
+        return [Candidate(**c) for c in item["candidates"]], item["latency_ms"] / 1000
+
+
+# ============================================================================
+# AVALIAÇÃO
+# ============================================================================
+
+def build_context(question: dict, candidates: list, config: EvalConfig) -> list:
+    """Trechos que iriam para o agente com esta configuração"""
+    chunks = [replace(c) for c in candidates]
+    if config.max_distance is not None:
+        chunks = [c for c in chunks if c.distance is None or c.distance <= config.max_distance]
+    if config.rerank and len(chunks) > config.top_k:
+        chunks = rerank(question["query"], chunks, config.top_k)
+    else:
+        chunks = chunks[:config.top_k]
+    return [replace(c, text=c.text[:config.truncate]) for c in chunks]
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def evaluate(golden: dict, fetched: dict, config: EvalConfig) -> dict:
+    """Métricas de uma configuração sobre os candidatos já buscados"""
+    hits, reciprocal_ranks, abstains, tokens, latencies = [], [], [], [], []
+    best_distances = {}
+    for question in golden["questions"]:
+        candidates, fetch_latency = fetched[question["id"]]
+        started = time.perf_counter()
+        context = build_context(question, candidates, config)
+        best_distances[question["id"]] = min(
+            (c.distance for c in candidates if c.distance is not None), default=None
+        )
+        latencies.append(fetch_latency + time.perf_counter() - started)
+        tokens.append(sum(estimate_tokens(c.text) for c in context))
+
+        if question.get("expect_none"):
+            abstains.append(not context)
+            continue
+        rank = next((i for i, c in enumerate(context, 1) if is_relevant(c, question)), None)
+        hits.append(rank is not None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    auc = none_auc(best_distances, golden)
+    return {
+        "config": config.name,
+        f"recall@{config.top_k}": round(statistics.mean(hits), 3) if hits else None,
+        "mrr": round(statistics.mean(reciprocal_ranks), 3) if reciprocal_ranks else None,
+        "abstain_rate": round(statistics.mean(abstains), 3) if abstains else None,
+        "none_auc": None if auc is None else round(auc, 3),
+        "avg_context_tokens": round(statistics.mean(tokens), 1),
+        "latency_ms_p50": round(percentile(latencies, 0.5) * 1000, 1),
+        "latency_ms_p95": round(percentile(latencies, 0.95) * 1000, 1),
+    }
+
+
+def fetch_all(backend, golden: dict) -> dict:
+    fetched = {}
+    for question in golden["questions"]:
+        fetched[question["id"]] = backend.fetch(question)
+    return fetched
+
+
+def save_recording(path: str, backend, golden: dict, fetched: dict):
+    recording = {
+        "backend": backend.name,
+        "golden_version": golden["version"],
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "questions": {
+            qid: {
+                "latency_ms": round(latency * 1000, 1),
+                "candidates": [
+                    {"text": c.text, "source_uri": c.source_uri, "distance": c.distance,
+                     "score": c.score, "corpus": c.corpus}
+                    for c in candidates
+                ],
+            }
+            for qid, (candidates, latency) in fetched.items()
+        },
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(recording, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def print_table(results: list):
+    recall_key = lambda r: next(v for k, v in r.items() if k.startswith("recall@"))
+    print(f"{'configuração':<44} {'recall':>7} {'mrr':>6} {'abst':>5} {'auc':>5} {'tokens':>7} {'p50ms':>7} {'p95ms':>7}")
+    for r in results:
+        recall = recall_key(r)
+        print(
+            f"{r['config']:<44} "
+            f"{'-' if recall is None else recall:>7} "
+            f"{'-' if r['mrr'] is None else r['mrr']:>6} "
+            f"{'-' if r['abstain_rate'] is None else r['abstain_rate']:>5} "
+            f"{'-' if r['none_auc'] is None else r['none_auc']:>5} "
+            f"{r['avg_context_tokens']:>7} {r['latency_ms_p50']:>7} {r['latency_ms_p95']:>7}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--backend", choices=("live", "local", "recorded"), default="local")
+    parser.add_argument("--snapshot",
+                        help="Snapshot do corpus (corpus_snapshot.py export); obrigatório no backend local")
+    parser.add_argument("--recording", help="Gravação a reproduzir (backend recorded)")
+    parser.add_argument("--record", help="Grava os candidatos buscados neste arquivo")
+    parser.add_argument("--output", help="Grava o relatório completo em JSON")
+    parser.add_argument("--top-k", help="Valores de top_k (ex.: 3,5,10)")
+    parser.add_argument("--truncate", help="Valores de corte de caracteres (ex.: 300,500)")
+    parser.add_argument("--max-distance", help="Limites de distância (ex.: none,0.5,0.7)")
+    args = parser.parse_args(argv)
+
+    sweep = dict(SWEEP)
+    if args.top_k:
+        sweep["top_k"] = tuple(int(v) for v in args.top_k.split(","))
+    if args.truncate:
+        sweep["truncate"] = tuple(int(v) for v in args.truncate.split(","))
+    if args.max_distance:
+        sweep["max_distance"] = tuple(
+            None if v.strip().lower() == "none" else float(v) for v in args.max_distance.split(",")
+        )
+
+    golden = load_golden(args.golden)
+
+    if args.backend == "live":
+        try:
+            backend = LiveBackend()
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.backend == "local":
+        if not args.snapshot:
+            parser.error("--backend local exige --snapshot (gere com corpus_snapshot.py export)")
+        backend = LocalBackend(args.snapshot)
+    else:
+        if not args.recording:
+            parser.error("informe --recording")
+        backend = RecordedBackend(args.recording)
+
+    print(f"Golden set v{golden['version']}: {len(golden['questions'])} perguntas; backend {backend.name}")
+    fetched = fetch_all(backend, golden)
+    if args.record:
+        save_recording(args.record, backend, golden, fetched)
+        print(f"✓ Candidatos gravados em {args.record}")
+
+    results = [evaluate(golden, fetched, config) for config in sweep_configs(sweep)]
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "golden_version": golden["version"],
+                "backend": backend.name,
+                "fetch_depth": FETCH_DEPTH,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"✓ Relatório em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
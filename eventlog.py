@@ -0,0 +1,210 @@
+"""Log estruturado (JSON por linha) sem I/O no caminho da requisição.
+
+Quem loga só monta um dict e faz put_nowait numa fila limitada; uma thread de
+fundo serializa e escreve em lote (stdout ou LOG_PATH). Com a fila cheia o
+registro é descartado e contado por tipo de evento, nunca bloqueia.
+
+Cada registro leva o request_id e o conversation_id do contexto atual
+(contextvars, que seguem para as threads do turno e da busca):
+
+    {"ts": ..., "level": "error", "event": "chat.error",
+     "request_id": "...", "conversation_id": "...", ...campos}
+
+Amostragem por tipo de evento em LOG_SAMPLE_RATES, ex.:
+    LOG_SAMPLE_RATES=http.request=0.1,retrieval.corpus_error=0.5
+Eventos não listados usam LOG_SAMPLE_DEFAULT (1.0). Registros com
+level=error nunca são amostrados, a não ser que o evento esteja listado.
+Tracebacks são formatados na thread de fundo.
+"""
+
+import contextvars
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+LOG_PATH = os.getenv("LOG_PATH")  # vazio: stdout
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", 1.0))
+FLUSH_INTERVAL = 0.2
+BATCH_SIZE = 500
+
+_request_id = contextvars.ContextVar("log_request_id", default=None)
+_conversation_id = contextvars.ContextVar("log_conversation_id", default=None)
+
+
+def parse_sample_rates(spec: str) -> dict:
+    """"evento=taxa,evento=taxa" -> {evento: taxa}"""
+    rates = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            raise ValueError(f"LOG_SAMPLE_RATES inválido: {item!r}")
+    return rates
+
+
+@contextmanager
+def bind(request_id: Optional[str] = None, conversation_id: Optional[str] = None):
+    """Define os IDs do contexto durante o bloco"""
+    tokens = []
+    if request_id is not None:
+        tokens.append((_request_id, _request_id.set(request_id)))
+    if conversation_id is not None:
+        tokens.append((_conversation_id, _conversation_id.set(conversation_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def set_context(request_id: Optional[str] = None, conversation_id: Optional[str] = None):
+    """Define os IDs no contexto atual (ex.: conversation_id gerado no turno)"""
+    if request_id is not None:
+        _request_id.set(request_id)
+    if conversation_id is not None:
+        _conversation_id.set(conversation_id)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class EventLogger:
+    """Fila limitada + thread de escrita para registros JSON"""
+
+    def __init__(self, path: Optional[str] = LOG_PATH, queue_size: int = LOG_QUEUE_SIZE,
+                 sample_rates: Optional[dict] = None, default_rate: float = LOG_SAMPLE_DEFAULT):
+        self.path = path
+        self.sample_rates = sample_rates or {}
+        self.default_rate = default_rate
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.write_errors = 0
+        self.dropped = Counter()
+        self.sampled_out = Counter()
+
+    @classmethod
+    def from_env(cls) -> "EventLogger":
+        return cls(sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "")))
+
+    def _keep(self, event: str, level: str) -> bool:
+        rate = self.sample_rates.get(event)
+        if rate is None:
+            rate = 1.0 if level == "error" else self.default_rate
+        return rate >= 1.0 or random.random() < rate
+
+    def log(self, event: str, level: str = "info", exc: Optional[BaseException] = None, **fields):
+        """Enfileira um registro (descarta se amostrado fora ou fila cheia)"""
+        if not self._keep(event, level):
+            self.sampled_out[event] += 1
+            return
+        if self._thread is None:
+            self.start()
+        record = {
+            "ts": time.time(),
+            "level": level,
+            "event": event,
+            "request_id": _request_id.get(),
+            "conversation_id": _conversation_id.get(),
+            **fields,
+        }
+        if exc is not None:
+            record["_exc"] = exc
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[event] += 1
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._thread.start()
+
+    @staticmethod
+    def _format(record: dict) -> str:
+        exc = record.pop("_exc", None)
+        if exc is not None:
+            record["error"] = f"{type(exc).__name__}: {exc}"
+            record["traceback"] = "".join(
+                traceback.format_exception(type(exc), exc, exc.__traceback__)
+            )
+        record["ts"] = round(record["ts"], 3)
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+    def _drain(self) -> list:
+        batch = []
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        lines = "".join(self._format(r) + "\n" for r in batch)
+        try:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            else:
+                sys.stdout.write(lines)
+                sys.stdout.flush()
+            self.written += len(batch)
+        except (OSError, ValueError):
+            self.write_errors += len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+            else:
+                self._stop.wait(FLUSH_INTERVAL)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+
+    def stats(self) -> dict:
+        return {
+            "output": self.path or "stdout",
+            "written": self.written,
+            "queued": self._queue.qsize(),
+            "write_errors": self.write_errors,
+            "dropped_queue_full": dict(self.dropped),
+            "sampled_out": dict(self.sampled_out),
+        }
+
+
+logger = EventLogger.from_env()
+log = logger.log
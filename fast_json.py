@@ -0,0 +1,29 @@
+"""Serialização JSON rápida para respostas grandes da API.
+
+Usa orjson quando instalado (várias vezes mais rápido que o json da
+biblioteca padrão em listas grandes de dicts) e cai para json compacto caso
+contrário.
+"""
+
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """Serializa para bytes UTF-8, sem espaços"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada com orjson (ou json compacto)"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
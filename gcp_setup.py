@@ -0,0 +1,91 @@
+"""Configuração de credenciais e inicialização do Vertex AI para os scripts.
+
+Concentra o bloco que cada script de administração repetia: credenciais via
+GOOGLE_APPLICATION_CREDENTIALS_JSON (Railway/Cloud) ou arquivo local
+serhrag*.json (desenvolvimento), seguido de vertexai.init().
+
+Os scripts continuam usando PROJECT_ID/LOCATION (padrão serhrag,
+europe-west4), como antes; o app usa GCP_PROJECT_ID/GCP_LOCATION. Se os dois
+estiverem definidos com valores diferentes, init_vertex_ai avisa, para que
+ninguém administre o projeto errado sem perceber. Ferramentas que precisam
+consultar o mesmo corpus do app (eval_retrieval.py --backend live) usam
+app_target() e app_corpus_names().
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_ID = os.getenv("PROJECT_ID", "serhrag")
+LOCATION = os.getenv("LOCATION", "europe-west4")
+
+
+def setup_credentials(verbose: bool = True):
+    """Aponta GOOGLE_APPLICATION_CREDENTIALS para as credenciais disponíveis"""
+    credentials_json = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    if credentials_json:
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            f.write(credentials_json)
+            creds_file = f.name
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = creds_file
+        if verbose:
+            print("✓ Usando credenciais do ambiente")
+        return
+
+    local_creds = list(Path(".").glob("serhrag*.json"))
+    if local_creds:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(local_creds[0])
+        if verbose:
+            print(f"✓ Usando credenciais locais: {local_creds[0]}")
+
+
+def app_target() -> tuple:
+    """Projeto e região do app: GCP_PROJECT_ID/GCP_LOCATION com os padrões de app.py"""
+    return os.getenv("GCP_PROJECT_ID", "marqu-443914"), os.getenv("GCP_LOCATION", "us-central1")
+
+
+def app_corpus_names() -> list:
+    """Nomes completos dos corpus do app (CORPUS_IDS ou CORPUS_ID) no projeto do app"""
+    ids = [c.strip() for c in os.getenv("CORPUS_IDS", "").split(",") if c.strip()]
+    if not ids and os.getenv("CORPUS_ID", "").strip():
+        ids = [os.getenv("CORPUS_ID").strip()]
+    if not ids:
+        raise ValueError("Nenhum corpus configurado: defina CORPUS_IDS ou CORPUS_ID")
+    project, location = app_target()
+    return [
+        cid if cid.startswith("projects/") else
+        f"projects/{project}/locations/{location}/ragCorpora/{cid}"
+        for cid in ids
+    ]
+
+
+def init_vertex_ai(verbose: bool = True, target: Optional[tuple] = None):
+    """Configura credenciais e inicializa o SDK do Vertex AI
+
+    Args:
+        verbose: Mostra de onde vieram as credenciais.
+        target: (projeto, região); padrão PROJECT_ID/LOCATION dos scripts.
+    """
+    import vertexai
+
+    setup_credentials(verbose)
+    if target is not None:
+        vertexai.init(project=target[0], location=target[1])
+        return
+    app = (os.getenv("GCP_PROJECT_ID", PROJECT_ID), os.getenv("GCP_LOCATION", LOCATION))
+    if app != (PROJECT_ID, LOCATION):
+        print(f"⚠️  Scripts usam {PROJECT_ID}/{LOCATION} (PROJECT_ID/LOCATION), mas o app usa "
+              f"{app[0]}/{app[1]} (GCP_PROJECT_ID/GCP_LOCATION)")
+    vertexai.init(project=PROJECT_ID, location=LOCATION)
+
+
+def corpus_resource_name(corpus_id: str) -> str:
+    """Nome completo do recurso a partir do ID numérico (ou nome completo)"""
+    if corpus_id.startswith("projects/"):
+        return corpus_id
+    return f"projects/{PROJECT_ID}/locations/{LOCATION}/ragCorpora/{corpus_id}"
@@ -0,0 +1,302 @@
+"""Orçamento de geração por turno (max_output_tokens e tamanho da resposta).
+
+Antes todo turno usava max_output_tokens=1024 do model_kwargs, e perguntas
+de sim/não ou de navegação ("onde fica o menu X?") recebiam respostas
+longas; o tempo de geração cresce com o tamanho da resposta. Agora cada
+turno recebe um orçamento:
+
+1. Classe da pergunta (heurística sobre o texto): yes_no, navigation,
+   procedure ou general, com teto de tokens em OUTPUT_BUDGETS e meta de
+   palavras em OUTPUT_WORD_TARGETS.
+2. Dica do cliente: answer_length "short" (metade do teto), "long" (teto do
+   perfil) e/ou max_words (meta de palavras explícita).
+3. Orçamento da conversa: com CONVERSATION_TOKEN_BUDGET, o teto nunca passa
+   do que resta na conversa (mínimo OUTPUT_MIN_TOKENS), então a geração
+   para mais cedo quando a conversa está no fim do orçamento.
+
+O teto vai para o modelo por config["configurable"]["max_output_tokens"]
+(o modelo do agente é criado com init_chat_model e esse campo
+configurável). A meta de palavras vira uma instrução curta em
+config["configurable"]["answer_instruction"], que length_prompt (o prompt
+do grafo) põe como mensagem de sistema só na chamada ao modelo: a mensagem
+do usuário guardada no checkpointer e no histórico fica como foi enviada.
+A meta também limita o teto (TOKENS_PER_WORD com folga).
+
+Métricas por classe: turnos, tokens concedidos, teto padrão que seria usado,
+tokens de resposta gerados e turnos que bateram no teto (orçamento apertado
+demais). O teto não concedido não é economia: uma resposta de sim/não
+gera ~80 tokens com qualquer teto. A economia é medida contra um grupo de
+controle: uma fração OUTPUT_BUDGET_HOLDOUT dos turnos roda sem orçamento
+(teto do perfil, sem meta de palavras) e a diferença entre as médias de
+tokens gerados por classe, vezes os turnos com orçamento, é a economia
+estimada (completion_tokens_saved).
+"""
+
+import math
+import os
+import random
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+
+from usage import CONVERSATION_TOKEN_BUDGET
+
+OUTPUT_BUDGET_ENABLED = os.getenv("OUTPUT_BUDGET_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTPUT_MIN_TOKENS = int(os.getenv("OUTPUT_MIN_TOKENS", 64))
+# Fração dos turnos sem orçamento (grupo de controle da economia medida)
+OUTPUT_BUDGET_HOLDOUT = float(os.getenv("OUTPUT_BUDGET_HOLDOUT", 0.05))
+
+# Tokens por palavra em português (estimate_tokens ~4 caracteres por token)
+# com folga para a resposta não ser cortada no meio
+TOKENS_PER_WORD = 2.0
+
+QUESTION_CLASSES = ("yes_no", "navigation", "procedure", "general")
+
+
+def parse_class_map(spec: str) -> dict:
+    """"classe=N,classe=N" -> {classe: N}"""
+    values = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in QUESTION_CLASSES:
+            raise ValueError(f"Classe de pergunta desconhecida: {name!r}")
+        values[name] = int(value)
+    return values
+
+
+OUTPUT_BUDGETS = {
+    "yes_no": 192, "navigation": 320, "procedure": 768, "general": 1024,
+    **parse_class_map(os.getenv("OUTPUT_BUDGETS", "")),
+}
+OUTPUT_WORD_TARGETS = {
+    "yes_no": 50, "navigation": 90,
+    **parse_class_map(os.getenv("OUTPUT_WORD_TARGETS", "")),
+}
+
+_YES_NO = re.compile(
+    r"^(posso|pode|podem|devo|preciso|consigo|existe|tenho direito|tem como|"
+    r"e possivel|e obrigatorio|e permitido|e necessario|sera que)\b"
+)
+_NAVIGATION = re.compile(
+    r"\b(onde (fica|encontro|acho|acesso|esta|vejo|consulto)|"
+    r"(qual|em que|em qual) (menu|tela|aba|opcao|link|modulo)|"
+    r"como (acesso|acessar|entro|entrar|encontro|chego)|link|caminho)\b"
+)
+_PROCEDURE = re.compile(
+    r"\b(como (solicito|solicitar|faco|fazer|peco|pedir|cadastro|cadastrar|altero|"
+    r"alterar|incluo|incluir|registro|registrar|envio|enviar|cancelo|cancelar)|"
+    r"passo a passo|procedimento|etapas|quais (os )?passos)\b"
+)
+_MAX_SHORT_WORDS = 25
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def classify(text: str) -> str:
+    """Classe da pergunta pelo texto (heurística, sem chamar o modelo)"""
+    normalized = _normalize(text)
+    short = len(normalized.split()) <= _MAX_SHORT_WORDS
+    if short and _NAVIGATION.search(normalized):
+        return "navigation"
+    if _PROCEDURE.search(normalized):
+        return "procedure"
+    if short and _YES_NO.search(normalized):
+        return "yes_no"
+    return "general"
+
+
+@dataclass
+class OutputBudget:
+    """Orçamento de geração de um turno"""
+    question_class: str
+    max_output_tokens: int
+    default_tokens: int  # teto do perfil (o que seria usado sem orçamento)
+    word_target: Optional[int] = None
+    clamped: bool = False  # limitado pelo orçamento da conversa
+    holdout: bool = False  # grupo de controle: turno sem orçamento
+
+    @property
+    def instruction(self) -> Optional[str]:
+        """Instrução de tamanho para o modelo, se houver meta"""
+        if not self.word_target:
+            return None
+        return f"Responda de forma direta, em até {self.word_target} palavras."
+
+    def configurable(self) -> dict:
+        """Campos do turno em config["configurable"]"""
+        return {"max_output_tokens": self.max_output_tokens, "answer_instruction": self.instruction}
+
+    def as_dict(self) -> dict:
+        return {
+            "question_class": self.question_class,
+            "max_output_tokens": self.max_output_tokens,
+            "word_target": self.word_target,
+            "clamped_by_conversation_budget": self.clamped,
+            "holdout": self.holdout,
+        }
+
+
+def plan(text: str, default_tokens: int, answer_length: Optional[str] = None,
+         max_words: Optional[int] = None, spent_tokens: int = 0,
+         token_budget: int = CONVERSATION_TOKEN_BUDGET,
+         holdout: Optional[bool] = None) -> OutputBudget:
+    """Orçamento do turno.
+
+    Args:
+        text: Mensagem do usuário.
+        default_tokens: max_output_tokens do perfil do agente (teto).
+        answer_length: Dica do cliente ("short", "normal" ou "long").
+        max_words: Meta de palavras pedida pelo cliente.
+        spent_tokens: Tokens já gastos pela conversa.
+        token_budget: Orçamento total da conversa (0 desativa).
+        holdout: Turno do grupo de controle (padrão: sorteio com
+            OUTPUT_BUDGET_HOLDOUT). Pedidos explícitos do cliente (max_words,
+            answer_length) nunca entram no controle.
+    """
+    question_class = classify(text)
+    if not OUTPUT_BUDGET_ENABLED:
+        return OutputBudget(question_class, default_tokens, default_tokens)
+    if holdout is None:
+        # Conversa perto do fim do orçamento também fica fora do controle
+        holdout = (not max_words and answer_length in (None, "normal")
+                   and not (token_budget and token_budget - spent_tokens < default_tokens)
+                   and random.random() < OUTPUT_BUDGET_HOLDOUT)
+    if holdout:
+        return OutputBudget(question_class, default_tokens, default_tokens, holdout=True)
+
+    if answer_length == "long":
+        tokens, words = default_tokens, None
+    else:
+        tokens = OUTPUT_BUDGETS.get(question_class, default_tokens)
+        words = OUTPUT_WORD_TARGETS.get(question_class)
+        if answer_length == "short":
+            tokens //= 2
+            words = words // 2 if words else 120
+    if max_words and max_words > 0:
+        words = max_words if words is None else min(words, max_words)
+    if words:
+        tokens = min(tokens, math.ceil(words * TOKENS_PER_WORD))
+
+    clamped = False
+    if token_budget:
+        remaining = token_budget - spent_tokens
+        if remaining < tokens:
+            tokens, clamped = remaining, True
+
+    tokens = max(OUTPUT_MIN_TOKENS, min(tokens, default_tokens))
+    return OutputBudget(question_class, tokens, default_tokens, words, clamped)
+
+
+def build_model(model_name: str, *, project: Optional[str] = None,
+                location: Optional[str] = None, model_kwargs: Optional[dict] = None, **kwargs):
+    """model_builder do LanggraphAgent: ChatVertexAI com max_output_tokens
+    configurável por chamada (config["configurable"]["max_output_tokens"]).
+
+    init_chat_model guarda o bind_tools do grafo e aplica sobre o modelo já
+    configurado, então o campo vale também nas rodadas com ferramentas.
+    """
+    from langchain.chat_models import init_chat_model
+
+    return init_chat_model(
+        model_name,
+        model_provider="google_vertexai",
+        configurable_fields=("max_output_tokens",),
+        project=project,
+        location=location,
+        **(model_kwargs or {}),
+    )
+
+
+def length_prompt(state, config) -> list:
+    """prompt do grafo (create_react_agent): mensagens da chamada ao modelo
+    com a instrução de tamanho do turno, se houver, como mensagem de sistema.
+
+    O prompt só monta a entrada do modelo; o estado da thread no
+    checkpointer não recebe a instrução.
+    """
+    messages = list(state["messages"])
+    instruction = ((config or {}).get("configurable") or {}).get("answer_instruction")
+    if not instruction:
+        return messages
+    from langchain_core.messages import SystemMessage
+
+    return [SystemMessage(instruction), *messages]
+
+
+class BudgetStats:
+    """Tokens concedidos x teto padrão x tokens gerados, por classe, com o
+    grupo de controle (holdout) separado para medir a economia"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._classes = {}
+        self.clamped = 0
+
+    def record(self, budget: OutputBudget, completion_tokens: int, rounds: int = 1):
+        with self._lock:
+            entry = self._classes.setdefault(budget.question_class, {
+                "turns": 0, "granted_tokens": 0, "default_tokens": 0,
+                "completion_tokens": 0, "hit_cap": 0,
+                "holdout_turns": 0, "holdout_completion_tokens": 0,
+            })
+            if budget.holdout:
+                entry["holdout_turns"] += 1
+                entry["holdout_completion_tokens"] += completion_tokens
+                return
+            rounds = max(rounds, 1)
+            entry["turns"] += 1
+            entry["granted_tokens"] += budget.max_output_tokens * rounds
+            entry["default_tokens"] += budget.default_tokens * rounds
+            entry["completion_tokens"] += completion_tokens
+            # Resposta do tamanho do teto: provavelmente cortada
+            if completion_tokens >= 0.95 * budget.max_output_tokens * rounds:
+                entry["hit_cap"] += 1
+            if budget.clamped:
+                self.clamped += 1
+
+    @staticmethod
+    def _class_summary(entry: dict) -> dict:
+        avg = entry["completion_tokens"] / entry["turns"] if entry["turns"] else None
+        baseline = (entry["holdout_completion_tokens"] / entry["holdout_turns"]
+                    if entry["holdout_turns"] else None)
+        saved = None
+        if avg is not None and baseline is not None:
+            saved = round((baseline - avg) * entry["turns"])
+        return {
+            **entry,
+            "avg_completion_tokens": None if avg is None else round(avg, 1),
+            "holdout_avg_completion_tokens": None if baseline is None else round(baseline, 1),
+            # Tokens de resposta a menos que o controle geraria nos mesmos turnos
+            "completion_tokens_saved": saved,
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            classes = {name: self._class_summary(entry) for name, entry in self._classes.items()}
+            granted = sum(e["granted_tokens"] for e in self._classes.values())
+            default = sum(e["default_tokens"] for e in self._classes.values())
+            measured = [c["completion_tokens_saved"] for c in classes.values()
+                        if c["completion_tokens_saved"] is not None]
+            return {
+                "enabled": OUTPUT_BUDGET_ENABLED,
+                "holdout_rate": OUTPUT_BUDGET_HOLDOUT,
+                "classes": classes,
+                # Economia medida contra o controle (só classes com as duas amostras)
+                "completion_tokens_saved": sum(measured) if measured else None,
+                # Teto de geração não concedido (não é economia de tokens gerados)
+                "cap_tokens_withheld": default - granted,
+                "cap_reduction": round(1 - granted / default, 3) if default else 0.0,
+                "clamped_by_conversation_budget": self.clamped,
+            }
+
+
+stats = BudgetStats()
@@ -0,0 +1,190 @@
+"""Busca especulativa no corpus em paralelo com o agente.
+
+Na maioria das perguntas sobre o SERH, a primeira rodada do modelo só decide
+chamar search_serh_corpus com algo muito parecido com o texto do usuário.
+O /chat dispara a busca para a mensagem crua no mesmo instante em que chama
+o agente e guarda o resultado num cache da própria requisição (contextvar).
+Quando a ferramenta é chamada com uma consulta parecida (similaridade de
+Jaccard entre os termos >= PREFETCH_MIN_SIMILARITY), recebe o resultado
+adiantado em vez de buscar de novo.
+
+Uma busca adiantada antes de uma troca de geração do corpus
+(corpus_version.py) é descartada.
+
+A busca adiantada roda com uma deadline própria (filha da deadline do
+turno). Quando ela deixa de servir (a ferramenta pediu outra consulta ou o
+turno acabou sem usá-la), a deadline é cancelada: a busca para antes de
+pegar a vaga de busca, entre tentativas e entre os corpus, em vez de rodar
+até o fim. Sem vaga livre na busca (scheduler.py), a busca adiantada nem
+começa: trabalho especulativo não entra na fila na frente de buscas reais.
+
+Métricas: taxa de acerto, consultas diferentes demais, buscas não usadas
+(canceladas antes de começar ou desperdiçadas depois de começar), puladas
+por falta de vaga e tempo economizado (quanto da busca já tinha corrido
+quando a ferramenta pediu).
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+import scheduler
+from corpus_version import current_generation
+from deadline import Deadline, current_deadline, deadline_scope
+from rerank import tokenize
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFETCH_MIN_SIMILARITY = float(os.getenv("PREFETCH_MIN_SIMILARITY", 0.5))
+
+# Prazo da busca adiantada fora de uma requisição com deadline
+_DEFAULT_TIMEOUT = 60.0
+
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", 8)),
+    thread_name_prefix="prefetch",
+)
+
+_current = contextvars.ContextVar("serh_prefetch", default=None)
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard entre os termos normalizados das duas consultas"""
+    terms_a, terms_b = set(tokenize(a)), set(tokenize(b))
+    if not terms_a or not terms_b:
+        return 1.0 if a.strip().lower() == b.strip().lower() else 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+class PrefetchStats:
+    """Acertos, erros e tempo economizado pela busca especulativa"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.unused = 0
+        self.cancelled = 0
+        self.wasted = 0
+        self.skipped_busy = 0
+        self.errors = 0
+        self.stale = 0
+        self.saved_seconds = 0.0
+
+    def incr(self, name: str, delta=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "unused": self.unused,
+                "cancelled_before_start": self.cancelled,
+                "wasted": self.wasted,
+                "skipped_busy": self.skipped_busy,
+                "errors": self.errors,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "time_saved_ms_total": round(self.saved_seconds * 1000),
+                "time_saved_ms_avg": round(self.saved_seconds * 1000 / self.hits, 1) if self.hits else None,
+            }
+
+
+stats = PrefetchStats()
+
+
+class Prefetch:
+    """Uma busca adiantada para a mensagem do usuário"""
+
+    def __init__(self, query: str, fn):
+        self.query = query
+        self.generation = current_generation()
+        self.started = time.monotonic()
+        self.finished = None
+        self.used = False
+        self.cancelled = False
+        # Deadline própria: cancelar a busca adiantada não cancela o turno
+        parent = current_deadline()
+        self.deadline = Deadline(parent.remaining() if parent else _DEFAULT_TIMEOUT)
+        ctx = contextvars.copy_context()  # leva o perfil e a prioridade do turno
+        self.future = _pool.submit(ctx.run, self._run, fn, query)
+        stats.incr("started")
+
+    def _run(self, fn, query):
+        try:
+            with deadline_scope(self.deadline):
+                return fn(query)
+        finally:
+            self.finished = time.monotonic()
+
+    def cancel(self):
+        """Abandona a busca (para no próximo ponto de verificação da deadline)"""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.deadline.cancel()
+        stats.incr("cancelled" if self.future.cancel() else "wasted")
+
+    def result(self, query: str):
+        """Resultado adiantado se `query` for parecida; None caso contrário"""
+        if similarity(query, self.query) < PREFETCH_MIN_SIMILARITY:
+            stats.incr("misses")
+            self.cancel()
+            return None
+
+        asked = time.monotonic()
+        deadline = current_deadline()
+        try:
+            value = self.future.result(timeout=deadline.remaining() if deadline else None)
+        except Exception:
+            stats.incr("errors")
+            return None
+        if self.generation != current_generation():
+            # Corpus mudou durante a requisição: busca de novo
+            stats.incr("stale")
+            return None
+
+        # Economia: quanto da busca já tinha rodado quando a ferramenta pediu
+        finished = self.finished or asked
+        stats.incr("saved_seconds", max(0.0, min(asked, finished) - self.started))
+        stats.incr("hits")
+        self.used = True
+        return value
+
+
+@contextmanager
+def prefetch_scope(query: str, fn, enabled: bool = PREFETCH_ENABLED):
+    """Dispara `fn(query)` em paralelo e deixa o resultado disponível à
+    ferramenta durante o bloco (via lookup)."""
+    if not enabled:
+        yield None
+        return
+    if not scheduler.retrieval.has_free_slot():
+        stats.incr("skipped_busy")
+        yield None
+        return
+    entry = Prefetch(query, fn)
+    token = _current.set(entry)
+    try:
+        yield entry
+    finally:
+        _current.reset(token)
+        if not entry.used:
+            stats.incr("unused")
+            entry.cancel()
+
+
+def lookup(query: str):
+    """Resultado adiantado para a consulta da ferramenta, ou None"""
+    entry: Optional[Prefetch] = _current.get()
+    if entry is None:
+        return None
+    return entry.result(query)
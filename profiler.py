@@ -0,0 +1,137 @@
+"""Profiler por amostragem para diagnóstico em produção.
+
+Uma thread lê sys._current_frames() a cada `interval` segundos durante a
+janela pedida e conta as pilhas de todas as threads (event loop, workers do
+/chat, busca no corpus, log de conversas). O resultado sai no formato
+"collapsed" do flamegraph.pl / speedscope / inferno:
+
+    thread;modulo:funcao:linha;modulo:funcao:linha <amostras>
+
+O custo fica na thread do profiler (uma cópia das pilhas por amostra); as
+threads amostradas não são instrumentadas. Só um profile roda por vez.
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# Token exigido no header X-Debug-Token; vazio desativa o endpoint
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 60))
+DEFAULT_INTERVAL = 0.01
+
+# Frames do topo de threads ociosas (descartados por padrão)
+_IDLE_FRAMES = (
+    "threading:wait:", "threading:_wait_for_tstate_lock:", "selectors:select:",
+    "queue:get:", "thread:_worker:",
+)
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Já existe um profile em andamento"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _stack(frame) -> list:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class ProfileResult:
+    """Pilhas amostradas e contagens"""
+
+    def __init__(self, stacks: Counter, samples: int, duration: float, interval: float):
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.interval = interval
+
+    def collapsed(self) -> str:
+        """Texto no formato collapsed (uma pilha por linha)"""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def top_frames(self, limit: int = 20) -> list:
+        """Funções em que as threads mais estavam (frame do topo)"""
+        leaf = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        return [{"frame": frame, "samples": count} for frame, count in leaf.most_common(limit)]
+
+    def summary(self) -> dict:
+        return {
+            "samples": self.samples,
+            "duration_s": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "distinct_stacks": len(self.stacks),
+            "top_frames": self.top_frames(),
+        }
+
+
+def sample(seconds: float, interval: float = DEFAULT_INTERVAL,
+           include_idle: bool = False) -> ProfileResult:
+    """Amostra as pilhas de todas as threads por `seconds` segundos.
+
+    Args:
+        seconds: Duração (limitada a PROFILER_MAX_SECONDS).
+        interval: Intervalo entre amostras em segundos (mínimo 1 ms).
+        include_idle: Mantém threads paradas em espera (lock, select, sleep),
+            que em geral só poluem o flamegraph.
+
+    Raises:
+        ProfilerBusy: se outro profile estiver em andamento.
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("Já existe um profile em andamento")
+    try:
+        seconds = max(0.1, min(seconds, PROFILER_MAX_SECONDS))
+        interval = max(0.001, interval)
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = _stack(frame)
+                if not include_idle and _is_idle(labels[-1]):
+                    continue
+                thread = names.get(ident, f"thread-{ident}").replace(" ", "_")
+                stacks[";".join([thread] + labels)] += 1
+            samples += 1
+            time.sleep(interval)
+        return ProfileResult(stacks, samples, time.monotonic() - started, interval)
+    finally:
+        _running.release()
+
+
+def _is_idle(leaf: str) -> bool:
+    return leaf.startswith(_IDLE_FRAMES)
+
+
+def authorized(token: Optional[str]) -> bool:
+    """Confere o token do header (comparação em tempo constante)"""
+    return bool(PROFILER_TOKEN) and token is not None and hmac.compare_digest(token, PROFILER_TOKEN)
+
+
+def is_running() -> bool:
+    return _running.locked()
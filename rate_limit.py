@@ -0,0 +1,302 @@
+"""Rate limiting por cliente (token bucket) para as rotas da API.
+
+Cada cliente (API key ou IP) tem um balde por rota, reabastecido a uma taxa
+fixa até o limite de rajada. Um balde ocupa memória constante (tokens e
+instante da última atualização) e baldes ociosos são descartados: depois de
+tempo suficiente para encher de novo, um balde equivale a um balde novo.
+
+Backends:
+- MemoryBackend: em processo, sem I/O (padrão).
+- SQLiteBackend: arquivo SQLite compartilhado entre workers/processos da
+  mesma máquina (RATE_LIMIT_DB=/caminho/arquivo.db).
+
+Configuração por rota (RATE_LIMITS), separada por vírgulas:
+    /chat=30/min:10,/conversations=120/min
+formato `prefixo=N/unidade[:rajada]`, unidade em s, min ou h. Rotas sem
+configuração não são limitadas.
+
+Identidade do cliente: a API key só vale se estiver em RATE_LIMIT_API_KEYS
+(senão um cliente trocaria de chave a cada requisição para ganhar um balde
+novo); sem chave válida, o IP. O X-Forwarded-For só é usado com
+RATE_LIMIT_TRUST_PROXY=true (atrás de um proxy que acrescenta o salto, como o
+do Railway); sem proxy o cliente poderia forjar o cabeçalho.
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+DEFAULT_RATE_LIMITS = "/chat=30/min:10"
+
+# Limite de baldes em memória (os menos usados são descartados primeiro)
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100_000))
+
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+
+_UNITS = {"s": 1.0, "sec": 1.0, "min": 60.0, "m": 60.0, "h": 3600.0}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Limite de uma rota: `rate` tokens por segundo, rajada de `burst`"""
+    route: str
+    rate: float
+    burst: float
+
+    @property
+    def idle_ttl(self) -> float:
+        """Tempo após o qual um balde ocioso já estaria cheio"""
+        return self.burst / self.rate
+
+
+@dataclass
+class Decision:
+    """Resultado de uma tentativa de consumo"""
+    allowed: bool
+    limit: RateLimit
+    remaining: float
+    retry_after: int = 0
+
+
+def parse_rate_limits(spec: str) -> list:
+    """Converte a especificação de RATE_LIMITS em lista de RateLimit.
+
+    Ordenada do prefixo mais longo para o mais curto, para que a primeira
+    correspondência seja a mais específica.
+    """
+    limits = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, rule = item.partition("=")
+        amount, _, rest = rule.partition("/")
+        unit, _, burst = rest.partition(":")
+        if unit not in _UNITS:
+            raise ValueError(f"Unidade inválida em RATE_LIMITS: {item!r}")
+        rate = float(amount) / _UNITS[unit]
+        limits.append(RateLimit(route.strip(), rate, float(burst) if burst else float(amount)))
+    return sorted(limits, key=lambda l: len(l.route), reverse=True)
+
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def parse_api_keys(spec: str) -> frozenset:
+    """RATE_LIMIT_API_KEYS (separadas por vírgula) -> hashes das chaves"""
+    return frozenset(_key_hash(k.strip()) for k in (spec or "").split(",") if k.strip())
+
+
+RATE_LIMIT_API_KEYS = parse_api_keys(os.getenv("RATE_LIMIT_API_KEYS", ""))
+
+
+def client_identity(headers, client_host: Optional[str], trust_proxy: Optional[bool] = None,
+                    api_keys: Optional[frozenset] = None) -> str:
+    """Identidade do cliente para o rate limiting (e uso/dono dos jobs).
+
+    Usa o hash da API key (header X-API-Key) se ela for uma das chaves
+    configuradas; caso contrário, o IP. Com trust_proxy o IP real é o último
+    salto do X-Forwarded-For (o que o proxy acrescentou, não o que o cliente
+    enviou).
+    """
+    trust_proxy = RATE_LIMIT_TRUST_PROXY if trust_proxy is None else trust_proxy
+    api_keys = RATE_LIMIT_API_KEYS if api_keys is None else api_keys
+
+    api_key = headers.get("x-api-key")
+    if api_key and _key_hash(api_key) in api_keys:
+        return "key:" + _key_hash(api_key)
+
+    forwarded = headers.get("x-forwarded-for")
+    if trust_proxy and forwarded:
+        return "ip:" + forwarded.split(",")[-1].strip()
+
+    return "ip:" + (client_host or "unknown")
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+def _refill(tokens: float, updated: float, now: float, limit: RateLimit) -> float:
+    return min(limit.burst, tokens + (now - updated) * limit.rate)
+
+
+def _retry_after(tokens: float, limit: RateLimit) -> int:
+    return max(1, math.ceil((1.0 - tokens) / limit.rate))
+
+
+class MemoryBackend:
+    """Baldes em memória do processo, com descarte LRU de baldes ociosos.
+
+    Um OrderedDict por tempo de ociosidade (idle_ttl, que varia por rota):
+    dentro de cada um o balde usado há mais tempo está no início e todos
+    expiram com o mesmo TTL, então basta olhar a cabeça de cada fila.
+    """
+
+    blocking = False
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}  # idle_ttl -> OrderedDict(chave -> _Bucket)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, limit: RateLimit, now: Optional[float] = None) -> Decision:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            buckets = self._buckets.setdefault(limit.idle_ttl, OrderedDict())
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = _Bucket(limit.burst, now)
+                buckets[key] = bucket
+                self._count += 1
+            else:
+                bucket.tokens = _refill(bucket.tokens, bucket.updated, now, limit)
+                bucket.updated = now
+                buckets.move_to_end(key)
+
+            self._evict(now)
+
+            if bucket.tokens >= 1.0:
+                bucket.tokens -= 1.0
+                return Decision(True, limit, bucket.tokens)
+            return Decision(False, limit, bucket.tokens, _retry_after(bucket.tokens, limit))
+
+    def __len__(self):
+        return self._count
+
+    def _evict(self, now: float):
+        for idle_ttl, buckets in self._buckets.items():
+            while buckets:
+                bucket = next(iter(buckets.values()))
+                if now - bucket.updated < idle_ttl:
+                    break
+                buckets.popitem(last=False)
+                self._count -= 1
+        # Acima do limite: sai o balde usado há mais tempo entre todas as filas
+        while self._count > self.max_buckets:
+            oldest = min(
+                (b for b in self._buckets.values() if b),
+                key=lambda b: next(iter(b.values())).updated,
+            )
+            oldest.popitem(last=False)
+            self._count -= 1
+
+
+class SQLiteBackend:
+    """Baldes num arquivo SQLite, compartilhados entre processos.
+
+    Cada consumo é uma transação BEGIN IMMEDIATE (lê, reabastece e grava o
+    balde), portanto workers diferentes enxergam o mesmo limite. Usa o relógio
+    de parede, que é comum a todos os processos da máquina.
+    """
+
+    blocking = True
+
+    # A cada quantos consumos os baldes ociosos são apagados
+    EVICT_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,"
+            " idle_ttl REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key: str, limit: RateLimit, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = limit.burst if row is None else _refill(row[0], row[1], now, limit)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, idle_ttl)"
+                " VALUES (?, ?, ?, ?)",
+                (key, tokens, now, limit.idle_ttl),
+            )
+            self._calls += 1
+            if self._calls % self.EVICT_EVERY == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated + idle_ttl < ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if allowed:
+            return Decision(True, limit, tokens)
+        return Decision(False, limit, tokens, _retry_after(tokens, limit))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+
+class RateLimiter:
+    """Aplica os limites configurados por rota sobre um backend"""
+
+    def __init__(self, limits: list, backend=None):
+        self.limits = limits
+        self.backend = backend or MemoryBackend()
+        self._allowed = {}
+        self._limited = {}
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        limits = parse_rate_limits(os.getenv("RATE_LIMITS", DEFAULT_RATE_LIMITS))
+        db_path = os.getenv("RATE_LIMIT_DB")
+        backend = SQLiteBackend(db_path) if db_path else MemoryBackend()
+        return cls(limits, backend)
+
+    def limit_for(self, path: str) -> Optional[RateLimit]:
+        for limit in self.limits:
+            if path.startswith(limit.route):
+                return limit
+        return None
+
+    def check(self, client: str, limit: RateLimit) -> Decision:
+        """Consome um token do balde (cliente, rota)"""
+        decision = self.backend.consume(f"{limit.route}|{client}", limit)
+        counter = self._allowed if decision.allowed else self._limited
+        counter[limit.route] = counter.get(limit.route, 0) + 1
+        return decision
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "buckets": len(self.backend),
+            "routes": {
+                l.route: {
+                    "rate_per_s": l.rate,
+                    "burst": l.burst,
+                    "allowed": self._allowed.get(l.route, 0),
+                    "limited": self._limited.get(l.route, 0),
+                }
+                for l in self.limits
+            },
+        }
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Replay do tráfego gravado do /chat (traffic.py) contra um alvo
+
+Modos:
+    original   respeita os intervalos gravados
+    scaled     intervalos divididos por --speed (ex.: 2 = dobro da taxa)
+    max        dispara o mais rápido possível, limitado por --concurrency
+
+Em qualquer modo, os turnos de uma mesma conversa saem em ordem: o próximo
+só é enviado depois da resposta do anterior. Conversas que começaram na
+gravação (new=true) são criadas no alvo e o ID devolvido é reaproveitado nos
+turnos seguintes; conversas que já existiam antes da gravação recebem um ID
+próprio do replay.
+
+Uso:
+    python replay_traffic.py traffic.jsonl --target http://localhost:8080
+    python replay_traffic.py traffic.jsonl --mode scaled --speed 3
+    python replay_traffic.py traffic.jsonl --mode max --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_recording(path: str) -> list:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+
+def group_by_conversation(entries: list) -> "OrderedDict[str, list]":
+    """Turnos por conversa, em ordem de chegada (sem ID: conversa própria)"""
+    lanes = OrderedDict()
+    for n, entry in enumerate(entries):
+        key = entry.get("conversation") or f"single-{n}"
+        lanes.setdefault(key, []).append(entry)
+    return lanes
+
+
+def post_chat(target: str, payload: dict, timeout: float) -> tuple:
+    """POST /chat; devolve (status, corpo JSON ou None)"""
+    request = urllib.request.Request(
+        target.rstrip("/") + "/chat",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, TimeoutError, OSError):
+        return 0, None
+
+
+class Replayer:
+    def __init__(self, target: str, mode: str, speed: float, concurrency: int, timeout: float):
+        self.target = target
+        self.mode = mode
+        self.speed = speed if mode == "scaled" else 1.0
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.limit = asyncio.Semaphore(concurrency)
+        self.statuses = Counter()
+        self.latencies = []
+        self.lags = []
+        self.recorded_latencies = []
+
+    async def _send(self, payload: dict) -> tuple:
+        loop = asyncio.get_running_loop()
+        async with self.limit:
+            started = time.perf_counter()
+            status, body = await loop.run_in_executor(
+                self.pool, post_chat, self.target, payload, self.timeout
+            )
+            self.latencies.append(time.perf_counter() - started)
+        self.statuses[status] += 1
+        return status, body
+
+    async def _lane(self, key: str, turns: list, t0: float, start: float):
+        conversation_id = None if turns[0].get("new") else f"replay-{key}"
+        for entry in turns:
+            if self.mode != "max":
+                due = start + (entry["ts"] - t0) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.lags.append(-delay)
+
+            payload = {"text": entry["text"]}
+            if conversation_id:
+                payload["conversation_id"] = conversation_id
+            if entry.get("timeout"):
+                payload["timeout"] = entry["timeout"]
+
+            status, body = await self._send(payload)
+            if entry.get("latency_ms") is not None:
+                self.recorded_latencies.append(entry["latency_ms"] / 1000)
+            if conversation_id is None and isinstance(body, dict):
+                conversation_id = body.get("conversation_id")
+
+    async def run(self, entries: list) -> dict:
+        lanes = group_by_conversation(entries)
+        t0 = entries[0]["ts"]
+        start = time.monotonic()
+        await asyncio.gather(*(self._lane(k, turns, t0, start) for k, turns in lanes.items()))
+        elapsed = time.monotonic() - start
+        self.pool.shutdown(wait=False)
+        return self.report(entries, lanes, elapsed)
+
+    def report(self, entries: list, lanes: dict, elapsed: float) -> dict:
+        def pct(values, p):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1)
+
+        recorded_span = entries[-1]["ts"] - entries[0]["ts"]
+        return {
+            "target": self.target,
+            "mode": self.mode,
+            "speed": self.speed,
+            "requests": len(entries),
+            "conversations": len(lanes),
+            "elapsed_s": round(elapsed, 2),
+            "recorded_span_s": round(recorded_span, 2),
+            "achieved_rps": round(len(entries) / elapsed, 2) if elapsed else None,
+            "recorded_rps": round(len(entries) / recorded_span, 2) if recorded_span else None,
+            "status": {str(k): v for k, v in sorted(self.statuses.items())},
+            "latency_ms": {
+                "p50": pct(self.latencies, 0.50),
+                "p95": pct(self.latencies, 0.95),
+                "p99": pct(self.latencies, 0.99),
+                "mean": round(statistics.mean(self.latencies) * 1000, 1) if self.latencies else None,
+            },
+            "recorded_latency_ms_p95": pct(self.recorded_latencies, 0.95),
+            # Quanto o replay atrasou em relação ao agendado (alvo ou cliente saturado)
+            "schedule_lag_ms_p95": pct(self.lags, 0.95),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", help="Arquivo JSONL gravado pelo TrafficRecorder")
+    parser.add_argument("--target", default="http://localhost:8080")
+    parser.add_argument("--mode", choices=("original", "scaled", "max"), default="original")
+    parser.add_argument("--speed", type=float, default=1.0, help="Fator de aceleração (modo scaled)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requisições simultâneas no máximo")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--limit", type=int, help="Usa só as primeiras N requisições")
+    args = parser.parse_args(argv)
+
+    if args.mode == "scaled" and args.speed <= 0:
+        parser.error("--speed deve ser positivo")
+
+    entries = load_recording(args.recording)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print("Gravação vazia")
+        return 1
+
+    replayer = Replayer(args.target, args.mode, args.speed, args.concurrency, args.timeout)
+    print(f"Replay de {len(entries)} requisições contra {args.target} (modo {args.mode})")
+    report = asyncio.run(replayer.run(entries))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
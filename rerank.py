@@ -0,0 +1,206 @@
+"""Re-ranking local dos trechos recuperados.
+
+A busca vetorial pede RERANK_CANDIDATES trechos (ex.: 20) e este módulo
+escolhe os RERANK_TOP_N melhores para a ferramenta do agente, com três sinais
+baratos calculados só em CPU:
+
+- BM25 dos termos da pergunta, com IDF estimado sobre os próprios candidatos;
+- sobreposição lexical (fração dos termos da pergunta presentes no trecho);
+- prior de posição (a ordem/score da busca vetorial ainda diz alguma coisa).
+
+A pontuação é vetorizada: uma matriz candidatos x termos da pergunta com as
+frequências, e BM25/sobreposição saem de operações sobre ela (numpy quando
+instalado; listas caso contrário).
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+from conversation_store import estimate_tokens
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependência opcional
+    np = None
+
+# Candidatos pedidos à busca vetorial e trechos devolvidos ao agente
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", 3))
+
+# Pesos de BM25, sobreposição lexical e prior de posição
+RERANK_WEIGHTS = tuple(
+    float(w) for w in os.getenv("RERANK_WEIGHTS", "0.5,0.3,0.2").split(",")
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em era essa esse esta este eu foi
+ha isso isto ja la mais mas me meu minha na nas no nos o os ou para pela
+pelas pelo pelos por qual quais quando que se sem ser seu sua sao tem ter
+um uma umas uns voce voces preciso posso fazer faco
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ACCENTS = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüç", "aaaaaeeeeiiiiooooouuuuc")
+
+
+def tokenize(text: str) -> list:
+    """Termos normalizados: minúsculas, sem acentos, sem stopwords.
+
+    Tira o "s" final de palavras longas como stemming mínimo de plural
+    (férias/féria, documentos/documento).
+    """
+    text = text.lower().translate(_ACCENTS)
+    terms = []
+    for word in _WORD.findall(text):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def _term_matrix(query_terms: list, docs: list) -> tuple:
+    """Frequência de cada termo da pergunta em cada candidato e tamanhos"""
+    index = {term: j for j, term in enumerate(query_terms)}
+    tf = [[0] * len(query_terms) for _ in docs]
+    lengths = []
+    for i, terms in enumerate(docs):
+        row = tf[i]
+        for term in terms:
+            j = index.get(term)
+            if j is not None:
+                row[j] += 1
+        lengths.append(len(terms))
+    return tf, lengths
+
+
+def _position_prior(chunks: list) -> list:
+    """Prior da busca: score normalizado se houver, senão 1/log2(posição+2)"""
+    if chunks and all(getattr(c, "score", 0) > 0 for c in chunks):
+        return [c.score for c in chunks]
+    return [1.0 / math.log2(rank + 2) for rank in range(len(chunks))]
+
+
+def _scores_numpy(tf, lengths, prior, weights) -> list:
+    tf = np.asarray(tf, dtype=np.float32)
+    lengths = np.asarray(lengths, dtype=np.float32)
+    n_docs = tf.shape[0]
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+    bm25 = ((tf * (BM25_K1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+    if bm25.max() > 0:
+        bm25 = bm25 / bm25.max()
+    overlap = (tf > 0).mean(axis=1)
+
+    w_bm25, w_overlap, w_prior = weights
+    return (w_bm25 * bm25 + w_overlap * overlap + w_prior * np.asarray(prior)).tolist()
+
+
+def _scores_python(tf, lengths, prior, weights) -> list:
+    n_docs = len(tf)
+    n_terms = len(tf[0])
+    avg_len = max(sum(lengths) / n_docs, 1.0)
+
+    idf = []
+    for j in range(n_terms):
+        df = sum(1 for row in tf if row[j])
+        idf.append(math.log1p((n_docs - df + 0.5) / (df + 0.5)))
+
+    bm25 = []
+    overlap = []
+    for row, length in zip(tf, lengths):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+        bm25.append(sum(idf[j] * f * (BM25_K1 + 1) / (f + norm) for j, f in enumerate(row) if f))
+        overlap.append(sum(1 for f in row if f) / n_terms)
+    top = max(bm25)
+    if top > 0:
+        bm25 = [s / top for s in bm25]
+
+    w_bm25, w_overlap, w_prior = weights
+    return [w_bm25 * b + w_overlap * o + w_prior * p for b, o, p in zip(bm25, overlap, prior)]
+
+
+def score_chunks(query: str, chunks: list, weights: tuple = RERANK_WEIGHTS) -> list:
+    """Pontuação combinada de cada candidato (mesma ordem de `chunks`)"""
+    prior = _position_prior(chunks)
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    if not query_terms:
+        return prior
+
+    tf, lengths = _term_matrix(query_terms, [tokenize(c.text) for c in chunks])
+    if np is not None:
+        return _scores_numpy(tf, lengths, prior, weights)
+    return _scores_python(tf, lengths, prior, weights)
+
+
+class RerankStats:
+    """Custo do re-ranking e tokens de contexto economizados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.candidates = 0
+        self.kept = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.total_seconds = 0.0
+
+    def record(self, candidates: list, kept: list, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self.candidates += len(candidates)
+            self.kept += len(kept)
+            self.tokens_in += sum(estimate_tokens(c.text) for c in candidates)
+            self.tokens_out += sum(estimate_tokens(c.text) for c in kept)
+            self.total_seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = max(self.requests, 1)
+            return {
+                "requests": self.requests,
+                "avg_candidates": round(self.candidates / n, 1),
+                "avg_kept": round(self.kept / n, 1),
+                "avg_us": round(self.total_seconds / n * 1e6, 1),
+                "context_tokens_in": self.tokens_in,
+                "context_tokens_out": self.tokens_out,
+                "backend": "numpy" if np is not None else "python",
+            }
+
+
+stats = RerankStats()
+
+
+def rerank(query: str, chunks: list, top_n: int = RERANK_TOP_N,
+           weights: Optional[tuple] = None) -> list:
+    """Os `top_n` melhores candidatos, com `score` atualizado.
+
+    Args:
+        query: Pergunta usada na busca.
+        chunks: Candidatos na ordem da busca (RetrievedChunk ou equivalente
+            com `text` e `score`).
+        top_n: Quantos trechos devolver.
+        weights: (bm25, sobreposição, posição); padrão RERANK_WEIGHTS.
+    """
+    if len(chunks) <= 1:
+        return list(chunks)
+
+    started = time.perf_counter()
+    scores = score_chunks(query, chunks, weights or RERANK_WEIGHTS)
+    order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:top_n]
+    kept = []
+    for i in order:
+        chunks[i].score = scores[i]
+        kept.append(chunks[i])
+    stats.record(chunks, kept, time.perf_counter() - started)
+    return kept
@@ -0,0 +1,410 @@
+"""Busca federada nos corpus SERH.
+
+A ferramenta do agente consulta um conjunto configurável de corpus em paralelo
+(CORPUS_IDS), normaliza os scores de cada corpus para a mesma escala e junta
+tudo num único top-k. Cada corpus tem um tempo máximo próprio
+(RETRIEVAL_CORPUS_TIMEOUT), limitado pela deadline da requisição: um corpus
+atrasado é descartado da resposta em vez de segurar o turno.
+
+Resultados completos (todos os corpus responderam) ficam num LRU cuja chave
+inclui a geração do corpus (corpus_version.py): quando os documentos são
+reimportados a geração muda e as entradas antigas deixam de valer.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from google.api_core import exceptions as google_exceptions
+from vertexai import rag
+
+import eventlog
+import scheduler
+from corpus_version import current_generation
+from deadline import Deadline, current_deadline
+
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 3))
+RETRIEVAL_CORPUS_TIMEOUT = float(os.getenv("RETRIEVAL_CORPUS_TIMEOUT", 5))
+RETRIEVAL_TRUNCATE_CHARS = 500
+
+# Novas tentativas da busca em erros transitórios (limitadas pela deadline)
+RETRIEVAL_MAX_ATTEMPTS = int(os.getenv("RETRIEVAL_MAX_ATTEMPTS", 3))
+RETRIEVAL_RETRY_BACKOFF = 0.5
+
+# Cache de resultados por (geração do corpus, corpus, consulta, top_k);
+# tamanho 0 desativa. O TTL é só uma rede de segurança caso a verificação
+# de versão falhe.
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 1024))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", 600))
+
+# O significado do `score` das respostas depende da métrica do banco vetorial
+# do corpus: com COSINE_DISTANCE (a do RagManagedDb) é a distância, em [0, 2]
+# e menor é melhor; com DOT_PRODUCT/COSINE_SIMILARITY (bancos externos) é a
+# similaridade. RETRIEVAL_SCORE_METRIC vale para todos os corpus e
+# RETRIEVAL_SCORE_METRICS ("id=metrica,...") sobrescreve por corpus.
+DISTANCE_METRICS = ("cosine_distance", "euclidean_distance")
+SIMILARITY_METRICS = ("dot_product", "cosine_similarity")
+
+_TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,
+)
+
+# Intervalo em que a espera pelos corpus verifica o cancelamento (segundos)
+_CANCEL_POLL_INTERVAL = 0.1
+
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RETRIEVAL_WORKERS", 16)),
+    thread_name_prefix="retrieval",
+)
+
+
+@dataclass
+class RetrievedChunk:
+    """Um trecho recuperado de um corpus"""
+    text: str
+    corpus: str
+    source_uri: Optional[str] = None
+    distance: Optional[float] = None
+    score: float = 0.0  # normalizado em [0, 1], maior é melhor
+
+
+def corpus_names(project_id: str, location: str, ids) -> list:
+    """Nomes completos dos corpus (aceita IDs curtos ou nomes completos)"""
+    return [
+        cid if cid.startswith("projects/") else
+        f"projects/{project_id}/locations/{location}/ragCorpora/{cid}"
+        for cid in ids
+    ]
+
+
+def corpus_names_from_env(project_id: str, location: str, default_id: str) -> list:
+    """Nomes completos dos corpus configurados em CORPUS_IDS (ou CORPUS_ID)"""
+    ids = [c.strip() for c in os.getenv("CORPUS_IDS", "").split(",") if c.strip()]
+    return corpus_names(project_id, location, ids or [default_id])
+
+
+def _check_metric(metric: str) -> str:
+    metric = metric.strip().lower()
+    if metric not in DISTANCE_METRICS + SIMILARITY_METRICS:
+        raise ValueError(f"Métrica de score desconhecida: {metric!r}")
+    return metric
+
+
+def parse_score_metrics(spec: str) -> dict:
+    """"id=metrica,id=metrica" -> {id do corpus: métrica}"""
+    metrics = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            corpus, _, metric = item.partition("=")
+            metrics[corpus.strip().rsplit("/", 1)[-1]] = _check_metric(metric)
+    return metrics
+
+
+DEFAULT_SCORE_METRIC = _check_metric(os.getenv("RETRIEVAL_SCORE_METRIC", "cosine_distance"))
+SCORE_METRICS = parse_score_metrics(os.getenv("RETRIEVAL_SCORE_METRICS", ""))
+
+
+def score_metric(corpus: str) -> str:
+    """Métrica configurada do corpus (nome completo ou ID)"""
+    return SCORE_METRICS.get(corpus.rsplit("/", 1)[-1], DEFAULT_SCORE_METRIC)
+
+
+def extract_chunks(response, corpus: str) -> list:
+    """Converte a resposta de rag.retrieval_query em RetrievedChunks.
+
+    Aceita o formato atual (response.contexts.contexts) e o formato com
+    response.responses[].relevant_documents usado pela versão anterior.
+    Sem `distance`, o `score` vira distância conforme a métrica do corpus.
+    """
+    chunks = []
+    contexts = getattr(getattr(response, "contexts", None), "contexts", None)
+    if contexts:
+        metric = score_metric(corpus)
+        for c in contexts:
+            distance = getattr(c, "distance", None)
+            score = getattr(c, "score", None)
+            if distance is None and score is not None:
+                distance = score if metric in DISTANCE_METRICS else 1.0 - score
+            chunks.append(RetrievedChunk(
+                text=c.text,
+                corpus=corpus,
+                source_uri=getattr(c, "source_uri", None) or None,
+                distance=distance,
+            ))
+        return chunks
+
+    for r in getattr(response, "responses", None) or []:
+        for doc in r.relevant_documents or []:
+            chunks.append(RetrievedChunk(
+                text=doc.chunk_data.text,
+                corpus=corpus,
+                distance=getattr(doc, "distance", None),
+            ))
+    return chunks
+
+
+def normalize_scores(chunks: list):
+    """Coloca os scores de um corpus na escala [0, 1] (in place).
+
+    A similaridade bruta é 1 - distância. Com pelo menos dois resultados de
+    distâncias diferentes, usa min-max dentro do corpus, combinado com a
+    similaridade bruta para que o melhor trecho de um corpus fraco não empate
+    com o melhor de um corpus forte. Sem distâncias, usa a posição.
+    """
+    if not chunks:
+        return
+    if any(c.distance is None for c in chunks):
+        for rank, c in enumerate(chunks):
+            c.score = 1.0 / (rank + 1)
+        return
+
+    sims = [min(1.0, max(0.0, 1.0 - c.distance)) for c in chunks]
+    low, high = min(sims), max(sims)
+    for c, sim in zip(chunks, sims):
+        relative = (sim - low) / (high - low) if high - low > 1e-6 else 1.0
+        c.score = 0.5 * relative + 0.5 * sim
+
+
+class RetrievalStats:
+    """Contadores por corpus: consultas, atrasos descartados, erros e latência"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._corpora = {}
+
+    def record(self, corpus: str, outcome: str, seconds: Optional[float] = None):
+        with self._lock:
+            entry = self._corpora.setdefault(
+                corpus, {"ok": 0, "timeout": 0, "error": 0, "avg_ms": 0.0}
+            )
+            entry[outcome] += 1
+            if seconds is not None:
+                entry["avg_ms"] += 0.2 * (seconds * 1000 - entry["avg_ms"])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                corpus.rsplit("/", 1)[-1]: {**entry, "avg_ms": round(entry["avg_ms"], 1)}
+                for corpus, entry in self._corpora.items()
+            }
+
+
+stats = RetrievalStats()
+
+
+class ResultCache:
+    """LRU de resultados da busca federada (guarda e devolve cópias, pois o
+    re-ranking altera o score dos trechos)"""
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(query: str, corpora: list, top_k: int) -> tuple:
+        return (current_generation(), tuple(corpora), " ".join(query.lower().split()), top_k)
+
+    def get(self, key: tuple) -> Optional[list]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [replace(c) for c in entry[1]]
+
+    def put(self, key: tuple, chunks: list):
+        if self.max_entries <= 0:
+            return
+        copies = [replace(c) for c in chunks]
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copies)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "generation": current_generation(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+cache = ResultCache()
+
+
+def query_corpus(corpus: str, query: str, top_k: int,
+                 deadline: Optional[Deadline] = None) -> list:
+    """Consulta um corpus, repetindo erros transitórios enquanto houver tempo"""
+    for attempt in range(1, RETRIEVAL_MAX_ATTEMPTS + 1):
+        if deadline is not None:
+            deadline.check()
+        try:
+            response = rag.retrieval_query(
+                rag_resources=[rag.RagResource(rag_corpus=corpus)],
+                text=query,
+                rag_retrieval_config=rag.RagRetrievalConfig(top_k=top_k),
+            )
+            return extract_chunks(response, corpus)
+        except _TRANSIENT_ERRORS:
+            backoff = RETRIEVAL_RETRY_BACKOFF * 2 ** (attempt - 1)
+            if attempt == RETRIEVAL_MAX_ATTEMPTS:
+                raise
+            if deadline is None:
+                time.sleep(backoff)
+                continue
+            # Só tenta de novo se ainda sobrar tempo depois do backoff
+            if deadline.remaining() <= backoff or not deadline.sleep(backoff):
+                raise
+            deadline.check()
+
+
+def federated_search(query: str, corpora: list, top_k: int = RETRIEVAL_TOP_K,
+                     deadline: Optional[Deadline] = None,
+                     corpus_timeout: float = RETRIEVAL_CORPUS_TIMEOUT) -> list:
+    """Consulta os corpus em paralelo e devolve o top-k combinado.
+
+    Args:
+        query: Texto da busca.
+        corpora: Nomes completos dos corpus.
+        top_k: Trechos por corpus e no resultado final.
+        deadline: Deadline da requisição (padrão: a corrente).
+        corpus_timeout: Tempo máximo de espera por corpus.
+
+    Returns:
+        Lista de RetrievedChunk ordenada por score normalizado.
+
+    Raises:
+        scheduler.SlotTimeout: Sem vaga de busca no prazo (sobrecarga); uma
+            lista vazia diria ao agente que não há documentos sobre o assunto.
+        A exceção do primeiro corpus que falhou, se nenhum corpus respondeu
+        e pelo menos um falhou (em vez de apenas atrasar).
+    """
+    deadline = deadline or current_deadline()
+    timeout = corpus_timeout
+    if deadline is not None:
+        deadline.check()
+        timeout = min(timeout, deadline.remaining())
+
+    key = cache.key(query, corpora, top_k)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Vaga da busca conforme a prioridade da chamada (scheduler.py); a
+    # espera conta no tempo da busca
+    waiting = time.monotonic()
+    try:
+        priority = scheduler.retrieval.acquire(timeout=timeout)
+    except scheduler.SlotTimeout:
+        eventlog.log("retrieval.slot_timeout", level="warning", priority=scheduler.current_class())
+        raise
+    # A vaga só volta quando todas as consultas terminarem, inclusive as que
+    # estouraram o prazo e seguem rodando na thread
+    futures = {
+        _pool.submit(query_corpus, corpus, query, top_k, deadline): corpus
+        for corpus in corpora
+    }
+    _when_all_done(futures, lambda: scheduler.retrieval.release(priority))
+    merged, complete = _collect(futures, timeout - (time.monotonic() - waiting), deadline)
+    result = merged[:top_k]
+
+    # Resultado parcial (corpus com erro ou atrasado) não vai para o cache
+    if complete:
+        cache.put(key, result)
+    return result
+
+
+def _when_all_done(futures, callback):
+    """Chama `callback` uma vez, quando todos os futures terminarem"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+
+    if not futures:
+        callback()
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def _collect(futures: dict, timeout: float, deadline: Optional[Deadline] = None) -> tuple:
+    """Junta as respostas dos corpus até o prazo; (trechos ordenados, se todos responderam).
+
+    Se a deadline for cancelada no meio (busca adiantada descartada), para de
+    esperar e levanta RequestCancelled.
+    """
+    started = time.monotonic()
+    merged = []
+    errors = []
+    pending = set(futures)
+    while pending:
+        if deadline is not None and deadline.cancelled:
+            for future in pending:
+                future.cancel()
+            deadline.check()
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=min(remaining, _CANCEL_POLL_INTERVAL),
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            corpus = futures[future]
+            elapsed = time.monotonic() - started
+            try:
+                chunks = future.result()
+            except Exception as e:
+                stats.record(corpus, "error", elapsed)
+                eventlog.log("retrieval.corpus_error", level="warning", corpus=corpus,
+                             error=f"{type(e).__name__}: {e}")
+                errors.append(e)
+                continue
+            stats.record(corpus, "ok", elapsed)
+            normalize_scores(chunks)
+            merged.extend(chunks)
+
+    # Corpus atrasados são descartados (a thread termina sozinha)
+    for future in pending:
+        future.cancel()
+        stats.record(futures[future], "timeout")
+        eventlog.log("retrieval.corpus_timeout", level="warning", corpus=futures[future],
+                     timeout=round(timeout, 2))
+
+    if not merged and errors:
+        raise errors[0]
+
+    merged.sort(key=lambda c: c.score, reverse=True)
+    return merged, not errors and not pending
+
+
+def format_chunks(chunks: list, truncate: int = RETRIEVAL_TRUNCATE_CHARS) -> str:
+    """Formata os trechos para a resposta da ferramenta"""
+    return "\n".join(f"• {c.text[:truncate]}" for c in chunks)
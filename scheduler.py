@@ -0,0 +1,237 @@
+"""Escalonamento por prioridade na frente do agente e da busca.
+
+Chat ao vivo, jobs assíncronos e tarefas de manutenção (verificação de
+versão do corpus, sincronizações) disputam a mesma cota do modelo e as
+mesmas threads. Cada recurso (agente e busca) tem um escalonador com um
+número fixo de vagas e três classes:
+
+    interactive   /chat e /ws/chat (padrão)
+    batch         /chat/jobs e pré-processamentos
+    maintenance   rotinas de fundo
+
+Com vagas livres a chamada entra na hora. Sem vagas, espera numa fila por
+classe e as vagas que liberam são distribuídas por enfileiramento justo
+ponderado (SCHEDULER_WEIGHTS, padrão 8:2:1): cada espera recebe uma marca
+de tempo virtual que avança 1/peso, e a menor marca sai primeiro. Assim um
+pedido interativo passa na frente do trabalho de fundo já enfileirado, sem
+deixá-lo parado para sempre. batch e maintenance têm ainda um teto de
+execuções simultâneas (SCHEDULER_CLASS_LIMITS) para sempre sobrar vaga
+para o interativo.
+
+A classe da chamada vem do contexto (priority_scope), que segue para as
+threads do turno, da busca adiantada e da ferramenta.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+INTERACTIVE, BATCH, MAINTENANCE = "interactive", "batch", "maintenance"
+CLASSES = (INTERACTIVE, BATCH, MAINTENANCE)
+
+
+def parse_class_values(spec: str, cast=float) -> dict:
+    """"classe=N,classe=N" -> {classe: N}"""
+    values = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in CLASSES:
+            raise ValueError(f"Classe de prioridade desconhecida: {name!r}")
+        values[name] = cast(value)
+    return values
+
+
+SCHEDULER_WEIGHTS = {
+    INTERACTIVE: 8.0, BATCH: 2.0, MAINTENANCE: 1.0,
+    **parse_class_values(os.getenv("SCHEDULER_WEIGHTS", "")),
+}
+SCHEDULER_CLASS_LIMITS = {
+    BATCH: 2, MAINTENANCE: 1,
+    **parse_class_values(os.getenv("SCHEDULER_CLASS_LIMITS", ""), int),
+}
+SCHEDULER_AGENT_SLOTS = int(os.getenv(
+    "SCHEDULER_AGENT_SLOTS", os.getenv("AGENT_POOL_SIZE", os.getenv("CHAT_MAX_IN_FLIGHT", 8))
+))
+SCHEDULER_RETRIEVAL_SLOTS = int(os.getenv("SCHEDULER_RETRIEVAL_SLOTS", 8))
+
+_current = contextvars.ContextVar("priority_class", default=INTERACTIVE)
+
+
+@contextmanager
+def priority_scope(priority: str):
+    if priority not in CLASSES:
+        raise ValueError(f"Classe de prioridade desconhecida: {priority!r}")
+    token = _current.set(priority)
+    try:
+        yield priority
+    finally:
+        _current.reset(token)
+
+
+def current_class() -> str:
+    return _current.get()
+
+
+class SlotTimeout(Exception):
+    """Nenhuma vaga do recurso dentro do prazo"""
+
+
+class _Waiter:
+    __slots__ = ("priority", "tag", "enqueued", "granted", "event")
+
+    def __init__(self, priority: str, tag: float):
+        self.priority = priority
+        self.tag = tag
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+
+
+class _ClassStats:
+    __slots__ = ("running", "admitted", "queued_total", "wait_seconds", "max_wait", "timeouts")
+
+    def __init__(self):
+        self.running = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+
+class Scheduler:
+    """Vagas de um recurso distribuídas por classe de prioridade.
+
+    Args:
+        name: Nome do recurso (métricas).
+        capacity: Chamadas simultâneas no recurso.
+        weights: Peso de cada classe no enfileiramento justo.
+        class_limits: Máximo de chamadas simultâneas por classe.
+    """
+
+    def __init__(self, name: str, capacity: int, weights: Optional[dict] = None,
+                 class_limits: Optional[dict] = None):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.weights = weights or SCHEDULER_WEIGHTS
+        self.class_limits = SCHEDULER_CLASS_LIMITS if class_limits is None else class_limits
+        self._lock = threading.Lock()
+        self._queues = {c: deque() for c in CLASSES}
+        self._stats = {c: _ClassStats() for c in CLASSES}
+        self._last_tag = {c: 0.0 for c in CLASSES}
+        self._virtual = 0.0
+        self._in_use = 0
+
+    def _limit(self, priority: str) -> int:
+        return min(self.class_limits.get(priority, self.capacity), self.capacity)
+
+    def _grant(self, priority: str):
+        self._in_use += 1
+        stats = self._stats[priority]
+        stats.running += 1
+        stats.admitted += 1
+
+    def _dispatch(self):
+        """Entrega vagas livres às esperas de menor marca (com o lock)"""
+        while self._in_use < self.capacity:
+            heads = [
+                queue[0] for c, queue in self._queues.items()
+                if queue and self._stats[c].running < self._limit(c)
+            ]
+            if not heads:
+                return
+            waiter = min(heads, key=lambda w: w.tag)
+            self._queues[waiter.priority].popleft()
+            self._virtual = waiter.tag
+            waiter.granted = True
+            self._grant(waiter.priority)
+            self._record_wait(waiter)
+            waiter.event.set()
+
+    def _record_wait(self, waiter: _Waiter):
+        waited = time.monotonic() - waiter.enqueued
+        stats = self._stats[waiter.priority]
+        stats.wait_seconds += waited
+        stats.max_wait = max(stats.max_wait, waited)
+
+    def acquire(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """Ocupa uma vaga; devolve a classe usada (para o release)"""
+        priority = priority or current_class()
+        with self._lock:
+            if self._in_use < self.capacity and self._stats[priority].running < self._limit(priority):
+                self._grant(priority)
+                return priority
+            tag = max(self._virtual, self._last_tag[priority]) + 1.0 / self.weights.get(priority, 1.0)
+            self._last_tag[priority] = tag
+            waiter = _Waiter(priority, tag)
+            self._queues[priority].append(waiter)
+            self._stats[priority].queued_total += 1
+
+        if waiter.event.wait(timeout):
+            return priority
+        with self._lock:
+            if waiter.granted:  # vaga entregue junto com o fim do prazo
+                return priority
+            self._queues[priority].remove(waiter)
+            self._stats[priority].timeouts += 1
+        raise SlotTimeout(f"Sem vaga em {self.name} para {priority} em {timeout:.1f}s")
+
+    def release(self, priority: str):
+        with self._lock:
+            self._in_use -= 1
+            self._stats[priority].running -= 1
+            self._dispatch()
+
+    def has_free_slot(self, priority: Optional[str] = None) -> bool:
+        """Se acquire() entraria agora, sem esperar na fila"""
+        priority = priority or current_class()
+        with self._lock:
+            return (self._in_use < self.capacity
+                    and self._stats[priority].running < self._limit(priority))
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, timeout: Optional[float] = None):
+        priority = self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for c in CLASSES:
+                s = self._stats[c]
+                waited = s.queued_total - len(self._queues[c]) - s.timeouts
+                classes[c] = {
+                    "weight": self.weights.get(c, 1.0),
+                    "limit": self._limit(c),
+                    "running": s.running,
+                    "queued": len(self._queues[c]),
+                    "admitted": s.admitted,
+                    "queued_total": s.queued_total,
+                    "timeouts": s.timeouts,
+                    "avg_wait_ms": round(s.wait_seconds / waited * 1000, 1) if waited > 0 else 0.0,
+                    "max_wait_ms": round(s.max_wait * 1000, 1),
+                }
+            return {
+                "capacity": self.capacity,
+                "in_use": self._in_use,
+                "classes": classes,
+            }
+
+
+agent = Scheduler("agent", SCHEDULER_AGENT_SLOTS)
+retrieval = Scheduler("retrieval", SCHEDULER_RETRIEVAL_SLOTS)
+
+
+def stats() -> dict:
+    return {"agent": agent.stats(), "retrieval": retrieval.stats()}
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_queue_full_rejects_with_429():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=0, max_queue_time=1)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await controller.acquire()
+        assert e.value.status_code == 429
+
+    run(scenario())
+
+
+def test_queue_timeout_rejects_with_503():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, max_queue_time=0.05)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await controller.acquire()
+        assert e.value.status_code == 503
+        assert controller.stats()["queue_depth"] == 0
+
+    run(scenario())
+
+
+def test_release_hands_slot_to_next_waiter():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, max_queue_time=1)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.stats()["queue_depth"] == 1
+        controller.release()
+        await waiter
+        assert controller.stats()["in_flight"] == 1
+
+    run(scenario())
+
+
+def test_abandoned_work_keeps_slot_until_it_finishes():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=0, max_queue_time=1)
+        work = asyncio.get_running_loop().create_future()
+        with pytest.raises(TimeoutError):
+            async with controller.slot() as slot:
+                slot.hold(work)
+                raise TimeoutError
+        stats = controller.stats()
+        assert stats["in_flight"] == 1
+        assert stats["abandoned_running"] == 1
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire()
+
+        work.set_result(None)
+        await asyncio.sleep(0)
+        stats = controller.stats()
+        assert stats["in_flight"] == 0
+        assert stats["abandoned_running"] == 0
+        assert stats["abandoned"] == 1
+
+    run(scenario())
+
+
+def test_finished_work_releases_on_exit():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=0, max_queue_time=1)
+        work = asyncio.get_running_loop().create_future()
+        work.set_result(None)
+        async with controller.slot() as slot:
+            slot.hold(work)
+        assert controller.stats()["in_flight"] == 0
+        assert controller.stats()["abandoned"] == 0
+
+    run(scenario())
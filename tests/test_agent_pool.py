@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+google_exceptions = pytest.importorskip("google.api_core.exceptions")
+
+import agent_pool  # noqa: E402
+from agent_pool import AgentPool, AgentProfile  # noqa: E402
+
+
+class Instance:
+    pass
+
+
+def make_pool(monkeypatch, size=1, max_failures=2):
+    monkeypatch.setattr(agent_pool, "AGENT_MAX_FAILURES", max_failures)
+    monkeypatch.setattr(agent_pool.AgentPool, "_replace_later", lambda self: None)
+    pool = AgentPool(AgentProfile("t", pool_size=size), lambda profile: Instance())
+    pool.fill()
+    return pool
+
+
+def fail(pool, error):
+    with pytest.raises(type(error)):
+        with pool.checkout(timeout=1):
+            raise error
+
+
+def test_instance_errors_discard_after_max_failures(monkeypatch):
+    pool = make_pool(monkeypatch)
+    fail(pool, RuntimeError("grafo quebrado"))
+    assert pool.stats()["live"] == 1
+    fail(pool, RuntimeError("grafo quebrado"))
+    assert pool.stats()["live"] == 0
+    assert pool.stats()["failures"] == 2
+
+
+def test_upstream_errors_do_not_discard(monkeypatch):
+    pool = make_pool(monkeypatch)
+    for _ in range(5):
+        fail(pool, google_exceptions.TooManyRequests("cota"))
+        fail(pool, google_exceptions.ServiceUnavailable("fora do ar"))
+    stats = pool.stats()
+    assert stats["live"] == 1
+    assert stats["failures"] == 0
+    assert stats["upstream_errors"] == 10
+
+
+def test_upstream_error_does_not_reset_failure_streak(monkeypatch):
+    pool = make_pool(monkeypatch)
+    fail(pool, RuntimeError("grafo quebrado"))
+    fail(pool, google_exceptions.InternalServerError("500"))
+    fail(pool, RuntimeError("grafo quebrado"))
+    assert pool.stats()["live"] == 0
+
+
+def test_replace_counts_under_lock(monkeypatch):
+    monkeypatch.setattr(agent_pool, "REPLACE_RETRY_INTERVAL", 0)
+    events = []
+    monkeypatch.setattr(agent_pool.eventlog, "log", lambda event, **fields: events.append(event))
+    attempts = []
+
+    def factory(profile):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("sem cota para construir")
+        return Instance()
+
+    pool = AgentPool(AgentProfile("t", pool_size=1), factory)
+    pool._replacing += 1
+    pool._replace()
+    stats = pool.stats()
+    assert stats["replace_errors"] == 1
+    assert stats["replaced"] == 1
+    assert stats["live"] == 1
+    assert events == ["agent_pool.replace_error"]
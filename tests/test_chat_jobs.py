@@ -0,0 +1,89 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import chat_jobs
+from chat_jobs import Job, JobManager, MemoryJobStore, callback_error, is_public_address
+
+
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.1.2.3", "172.16.0.1", "192.168.0.10", "169.254.169.254",
+    "100.64.0.1", "0.0.0.0", "224.0.0.1", "::1", "fe80::1", "fc00::1", "::ffff:127.0.0.1",
+])
+def test_non_public_addresses(address):
+    assert not is_public_address(address)
+
+
+def test_public_addresses():
+    assert is_public_address("8.8.8.8")
+    assert is_public_address("2001:4860:4860::8888")
+
+
+def test_callback_error_without_allowlist(monkeypatch):
+    monkeypatch.setattr(chat_jobs, "CALLBACK_HOSTS", set())
+    assert callback_error("ftp://example.com/x") is not None
+    assert callback_error("http://169.254.169.254/computeMetadata/v1/") is not None
+    assert callback_error("http://127.0.0.1:8080/hook") is not None
+    assert callback_error("http://localhost/hook") is not None
+    assert callback_error("http://[::1]/hook") is not None
+    assert callback_error("http://8.8.8.8/hook") is None
+
+
+def test_callback_error_with_allowlist(monkeypatch):
+    monkeypatch.setattr(chat_jobs, "CALLBACK_HOSTS", {"portal.interno"})
+    assert callback_error("https://portal.interno/hook") is None
+    assert callback_error("https://outro.exemplo/hook") is not None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        _Handler.hits.append(self.path)
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/final")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    _Handler.hits = []
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def notify(url):
+    manager = JobManager(MemoryJobStore(), run=lambda job: (200, {}), workers=0)
+    return manager, manager._notify(Job("j1", {}, callback_url=url))
+
+
+def test_notify_refuses_private_peer(monkeypatch, server):
+    # Host validado no envio, mas o DNS passou a apontar para a rede interna
+    monkeypatch.setattr(chat_jobs, "CALLBACK_HOSTS", set())
+    manager, status = notify(server + "/hook")
+    assert status.startswith("failed: destino não público")
+    assert _Handler.hits == []
+    assert manager.callbacks_failed == 1
+
+
+def test_notify_does_not_follow_redirects(monkeypatch, server):
+    monkeypatch.setattr(chat_jobs, "CALLBACK_HOSTS", {"127.0.0.1"})
+    manager, status = notify(server + "/redirect")
+    assert status == "failed: HTTP 302"
+    assert _Handler.hits == ["/redirect"]
+
+    manager, status = notify(server + "/hook")
+    assert status == "ok"
@@ -0,0 +1,60 @@
+import os
+
+from conversation_log import ConversationLog, apply_record
+
+
+def test_apply_record_is_index_idempotent():
+    state = {}
+    apply_record(state, {"c": "c1", "i": 0, "r": "user", "t": "oi", "ts": 1.0})
+    apply_record(state, {"c": "c1", "i": 0, "r": "user", "t": "oi", "ts": 1.0})
+    apply_record(state, {"c": "c1", "i": 5, "r": "user", "t": "fora de ordem"})
+    assert state == {"c1": [("user", "oi", 1.0)]}
+    apply_record(state, {"c": "c1", "op": "del"})
+    assert state == {}
+
+
+def test_recover_replays_log_tail(tmp_path):
+    log = ConversationLog(str(tmp_path))
+    log.start()
+    log.append("c1", 0, "user", "pergunta", 10.0)
+    log.append("c1", 1, "assistant", "resposta", 11.0)
+    log.close()
+
+    state = ConversationLog(str(tmp_path)).recover()
+    assert state == {"c1": [("user", "pergunta", 10.0), ("assistant", "resposta", 11.0)]}
+
+
+def test_recover_ignores_torn_last_line(tmp_path):
+    log = ConversationLog(str(tmp_path))
+    log.start()
+    log.append("c1", 0, "user", "pergunta", 10.0)
+    log.close()
+    segment = [n for n in os.listdir(tmp_path) if n.startswith("log-")][0]
+    with open(tmp_path / segment, "a", encoding="utf-8") as f:
+        f.write('{"c": "c1", "i": 1, "r": "assis')
+
+    state = ConversationLog(str(tmp_path)).recover()
+    assert state == {"c1": [("user", "pergunta", 10.0)]}
+
+
+def test_compaction_replaces_old_segments(tmp_path):
+    state = {}
+
+    def snapshot():
+        return {cid: list(msgs) for cid, msgs in state.items()}
+
+    log = ConversationLog(str(tmp_path), snapshot_provider=snapshot)
+    log.start()
+    for i in range(3):
+        record = {"c": "c1", "i": i, "r": "user", "t": f"m{i}", "ts": float(i)}
+        apply_record(state, record)
+        log.append("c1", i, "user", f"m{i}", float(i))
+    log.compact()
+    apply_record(state, {"c": "c1", "i": 3, "r": "user", "t": "m3", "ts": 3.0})
+    log.append("c1", 3, "user", "m3", 3.0)
+    log.close()
+
+    segments = sorted(n for n in os.listdir(tmp_path) if n.startswith("log-"))
+    assert len(segments) == 1
+    recovered = ConversationLog(str(tmp_path)).recover()
+    assert recovered == {"c1": [("user", f"m{i}", float(i)) for i in range(4)]}
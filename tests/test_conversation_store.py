@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+import conversation_store
+from conversation_log import ConversationLog
+from conversation_store import COLD_BLOCK_SIZE, ConversationStore
+
+
+@pytest.fixture
+def small_window(monkeypatch):
+    monkeypatch.setattr(conversation_store, "ACTIVE_WINDOW", 4)
+
+
+def test_counters_and_indices():
+    store = ConversationStore()
+    conversation, index = store.append_turn("c1", "pergunta", "resposta")
+    assert index == 0
+    _, index = store.append_turn("c1", "outra", "resposta")
+    assert index == 2
+    assert conversation.message_count == 4
+    assert conversation.user_turns == 2
+
+
+def test_cold_blocks_round_trip(small_window):
+    store = ConversationStore()
+    for i in range(30):
+        store.append_turn("c1", f"p{i}", f"r{i}")
+    conversation = store.get("c1")
+    assert conversation.cold
+    assert len(conversation.active) < 4 + COLD_BLOCK_SIZE
+
+    contents = [t.content for t in conversation.turns()]
+    assert contents == [x for i in range(30) for x in (f"p{i}", f"r{i}")]
+    assert [t.content for t in conversation.turns(15, 19)] == contents[15:19]
+
+
+def test_turns_clamps_out_of_range_bounds(small_window):
+    store = ConversationStore()
+    for i in range(30):
+        store.append_turn("c1", f"p{i}", f"r{i}")
+    conversation = store.get("c1")
+    assert [t.content for t in conversation.turns(-1, 2)] == ["p0", "r0"]
+    assert conversation.turns(60, 70) == []
+
+
+def test_page_orders_by_activity():
+    store = ConversationStore()
+    for cid in ("a", "b", "c"):
+        store.append_turn(cid, "p", "r")
+    store.append_turn("a", "p", "r")
+
+    page, cursor = store.page(limit=2)
+    assert [c.id for c in page] == ["a", "c"]
+    page, cursor = store.page(limit=2, cursor=cursor)
+    assert [c.id for c in page] == ["b"]
+    assert cursor is None
+
+
+def test_snapshot_is_consistent_during_appends(small_window):
+    store = ConversationStore()
+    stop = threading.Event()
+
+    def writer():
+        for i in range(2000):
+            if stop.is_set():
+                return
+            store.append_turn("c1", f"p{i}", f"r{i}")
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(50):
+            messages = store.snapshot().get("c1", [])
+            contents = [m[1] for m in messages]
+            expected = [x for i in range(len(contents) // 2) for x in (f"p{i}", f"r{i}")]
+            assert contents == expected
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_concurrent_turns_survive_log_replay(tmp_path):
+    log = ConversationLog(str(tmp_path), flush_interval=0.01)
+    log.start()
+    store = ConversationStore(log=log)
+
+    def worker(n):
+        for i in range(50):
+            store.append_turn("c1", f"p{n}-{i}", f"r{n}-{i}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.close()
+
+    recovered = ConversationStore()
+    recovered.load(ConversationLog(str(tmp_path)).recover())
+    original = [(t.role, t.content, t.ts) for t in store.get("c1").turns()]
+    assert [(t.role, t.content, t.ts) for t in recovered.get("c1").turns()] == original
+    assert len(original) == 400
+
+
+def test_recovery_keeps_timestamps_and_deletes(tmp_path):
+    log = ConversationLog(str(tmp_path))
+    log.start()
+    store = ConversationStore(log=log)
+    store.append("c1", "user", "pergunta", ts=1000.0)
+    store.append("c1", "assistant", "resposta", ts=1001.0)
+    store.append("c2", "user", "apagada", ts=1002.0)
+    store.delete("c2")
+    log.close()
+
+    recovered = ConversationStore()
+    recovered.load(ConversationLog(str(tmp_path)).recover())
+    assert "c2" not in recovered
+    conversation = recovered.get("c1")
+    assert [t.ts for t in conversation.turns()] == [1000.0, 1001.0]
+    assert conversation.created_at == 1000.0
+    assert conversation.last_activity == 1001.0
+
+
+def test_load_accepts_records_without_timestamp():
+    store = ConversationStore()
+    store.load({"c1": [("user", "antiga"), ("assistant", "sem ts")]})
+    assert store.get("c1").message_count == 2
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from corpus_admin import ListingCache, build_parser, fan_out, list_corpora
+
+
+@pytest.mark.parametrize("argv", [
+    ["--workers", "3", "--cache-ttl", "5", "list"],
+    ["list", "--workers", "3", "--cache-ttl", "5"],
+])
+def test_global_options_before_or_after_subcommand(argv):
+    args = build_parser().parse_args(argv)
+    assert args.command == "list"
+    assert args.workers == 3
+    assert args.cache_ttl == 5
+
+
+def test_subcommand_does_not_reset_global_options():
+    args = build_parser().parse_args(["--workers", "3", "inspect", "--all"])
+    assert args.workers == 3
+    assert args.all
+
+
+class FakeRag:
+    def __init__(self):
+        self.calls = 0
+
+    def list_corpora(self):
+        self.calls += 1
+        return [SimpleNamespace(name="projects/p/ragCorpora/1", display_name="SERH")]
+
+
+def test_listing_cache_persists_between_runs(tmp_path):
+    path = str(tmp_path / "cache.json")
+    rag = FakeRag()
+    cache = ListingCache(path, ttl=60)
+    assert list_corpora(rag, cache) == list_corpora(rag, cache)
+    cache.save()
+
+    assert list_corpora(rag, ListingCache(path, ttl=60))[0]["display_name"] == "SERH"
+    assert rag.calls == 1
+
+
+def test_listing_cache_disabled_with_zero_ttl(tmp_path):
+    rag = FakeRag()
+    cache = ListingCache(str(tmp_path / "cache.json"), ttl=0)
+    list_corpora(rag, cache)
+    list_corpora(rag, cache)
+    assert rag.calls == 2
+
+
+def test_fan_out_reports_errors_per_item():
+    def fn(item):
+        if item == 2:
+            raise ValueError("falhou")
+        return item * 10
+
+    results = {item: (result, error) for item, result, error in fan_out(fn, [1, 2, 3], 2)}
+    assert results[1] == (10, None)
+    assert isinstance(results[2][1], ValueError)
@@ -0,0 +1,55 @@
+import pytest
+
+from corpus_snapshot import Chunk, CorpusSnapshot, chunk_id_for, open_snapshot, write_snapshot
+
+
+def make_chunks():
+    rows = [
+        ("ferias.pdf", "Como solicitar férias no SERH"),
+        ("ferias.pdf", "Parcelamento de férias em até três períodos"),
+        ("auxilio.pdf", "Cadastro de auxílio-transporte"),
+    ]
+    return [Chunk(chunk_id_for(source, text), text, source) for source, text in rows]
+
+
+def test_round_trip_with_embeddings(tmp_path):
+    path = str(tmp_path / "serh.snap")
+    chunks = make_chunks()
+    embeddings = [[1.0, 0.0], [0.5, 0.5], [0.0, 1.0]]
+    write_snapshot(path, chunks, embeddings, meta={"corpus": "c1"})
+
+    with CorpusSnapshot.open(path) as snap:
+        assert len(snap) == 3
+        assert list(snap) == chunks
+        assert sorted(snap.sources()) == ["auxilio.pdf", "ferias.pdf"]
+        assert snap.dim == 2
+        assert list(snap.embedding(1)) == [0.5, 0.5]
+        assert snap.meta["corpus"] == "c1"
+
+
+def test_round_trip_without_embeddings(tmp_path):
+    path = str(tmp_path / "serh.snap")
+    write_snapshot(path, make_chunks())
+    with CorpusSnapshot.open(path) as snap:
+        assert snap.dim == 0
+        assert snap.text(2) == "Cadastro de auxílio-transporte"
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.snap"
+    path.write_bytes(b"\0" * 256)
+    with pytest.raises(ValueError):
+        CorpusSnapshot(str(path))
+
+
+def test_open_snapshot_missing_path():
+    assert open_snapshot(None) is None
+    assert open_snapshot("/nao/existe.snap") is None
+
+
+def test_export_requires_explicit_corpus(monkeypatch):
+    from corpus_snapshot import main
+
+    monkeypatch.setenv("CORPUS_ID", "3527444408137940992")
+    with pytest.raises(SystemExit):
+        main(["export", "--out", "x.snap"])
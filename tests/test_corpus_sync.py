@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from corpus_sync import InMemoryRagClient, Manifest, SourceFile, main, plan_sync, sync
+
+CORPUS = "projects/p/locations/l/ragCorpora/1"
+
+
+class FakeSource:
+    def __init__(self, files):
+        self.files = files
+
+    def list_files(self):
+        return list(self.files)
+
+
+def source_file(file_id, content_hash):
+    return SourceFile(file_id, f"{file_id}.pdf", f"https://drive/{file_id}", content_hash)
+
+
+def client_for(files):
+    return InMemoryRagClient({f.url: f.name for f in files})
+
+
+def quiet(*args):
+    pass
+
+
+def run(source, client, manifest):
+    return sync(source, client, manifest, batch_size=2, workers=2, log=quiet)
+
+
+def test_first_sync_imports_everything_and_resolves_rag_files(tmp_path):
+    files = [source_file("a", "1"), source_file("b", "1"), source_file("c", "1")]
+    client = client_for(files)
+    manifest = Manifest(str(tmp_path / "m.json"), CORPUS)
+
+    result = run(FakeSource(files), client, manifest)
+
+    assert result.imported == 3
+    assert len(client.files) == 3
+    assert {e["rag_file"] for e in manifest.files.values()} == set(client.files)
+    saved = json.loads((tmp_path / "m.json").read_text())
+    assert saved["corpus_name"] == CORPUS
+    assert set(saved["files"]) == {"a", "b", "c"}
+
+
+def test_second_sync_only_touches_changes(tmp_path):
+    files = [source_file("a", "1"), source_file("b", "1"), source_file("c", "1")]
+    client = client_for(files)
+    manifest = Manifest(str(tmp_path / "m.json"), CORPUS)
+    run(FakeSource(files), client, manifest)
+    old_b = manifest.files["b"]["rag_file"]
+    client.calls.clear()
+
+    changed = [source_file("a", "1"), source_file("b", "2"), source_file("d", "1")]
+    client.names.update({f.url: f.name for f in changed})
+    result = run(FakeSource(changed), client, manifest)
+
+    assert result.imported == 2
+    assert result.deleted == 2
+    imported = [url for kind, urls in client.calls if kind == "import" for url in urls]
+    assert sorted(imported) == ["https://drive/b", "https://drive/d"]
+    assert old_b not in client.files
+    assert set(manifest.files) == {"a", "b", "d"}
+    assert sorted(client.files.values()) == ["a.pdf", "b.pdf", "d.pdf"]
+
+
+def test_unchanged_source_makes_no_calls(tmp_path):
+    files = [source_file("a", "1")]
+    client = client_for(files)
+    manifest = Manifest(str(tmp_path / "m.json"), CORPUS)
+    run(FakeSource(files), client, manifest)
+    client.calls.clear()
+
+    assert plan_sync(files, manifest).unchanged == 1
+    run(FakeSource(files), client, manifest)
+    assert client.calls == []
+
+
+def test_crash_after_import_adopts_rag_file_instead_of_duplicating(tmp_path):
+    files = [source_file("a", "1")]
+    client = client_for(files)
+    manifest = Manifest(str(tmp_path / "m.json"), CORPUS)
+    # Execução anterior: registrou o import pendente, importou e caiu
+    manifest.update("a", name="a.pdf", pending="1")
+    client.import_files([files[0].url])
+    client.calls.clear()
+
+    manifest = Manifest.load(str(tmp_path / "m.json"), CORPUS)
+    result = run(FakeSource(files), client, manifest)
+
+    assert result.imported == 0
+    assert client.calls == []
+    assert len(client.files) == 1
+    assert manifest.files["a"]["rag_file"] in client.files
+    assert manifest.files["a"]["hash"] == "1"
+
+
+def test_crash_after_import_of_outdated_version_removes_orphan(tmp_path):
+    files = [source_file("a", "2")]
+    client = client_for(files)
+    manifest = Manifest(str(tmp_path / "m.json"), CORPUS)
+    manifest.update("a", name="a.pdf", pending="1")
+    client.import_files([files[0].url])
+    orphan = next(iter(client.files))
+
+    result = run(FakeSource(files), client, manifest)
+
+    assert result.imported == 1
+    assert orphan not in client.files
+    assert len(client.files) == 1
+    assert manifest.files["a"]["hash"] == "2"
+
+
+def test_manifest_of_other_corpus_is_rejected(tmp_path):
+    path = str(tmp_path / "m.json")
+    Manifest(path, CORPUS).update("a", hash="1")
+    with pytest.raises(ValueError):
+        Manifest.load(path, "projects/p/locations/l/ragCorpora/2")
+
+
+def test_cli_requires_explicit_corpus(monkeypatch):
+    # CORPUS_ID é do app (outro projeto): não pode virar alvo dos scripts
+    monkeypatch.setenv("CORPUS_ID", "3527444408137940992")
+    with pytest.raises(SystemExit):
+        main(["--folder", "pasta"])
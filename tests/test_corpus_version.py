@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import corpus_version
+import eventlog
+from corpus_version import CorpusVersionTracker
+
+
+def test_poll_bumps_generation_on_change(monkeypatch):
+    events = []
+    monkeypatch.setattr(eventlog, "log", lambda event, **fields: events.append((event, fields)))
+    files = {"projects/p/ragCorpora/1": [SimpleNamespace(name="a", size_bytes=1)]}
+    tracker = CorpusVersionTracker(list(files), interval=0, list_files=lambda c: files[c])
+
+    generation = corpus_version.current_generation()
+    assert tracker.poll() is False  # primeira listagem só registra o estado
+    files["projects/p/ragCorpora/1"].append(SimpleNamespace(name="b", size_bytes=2))
+    assert tracker.poll() is True
+    assert corpus_version.current_generation() == generation + 1
+    assert events == [("corpus.changed", {"generation": generation + 1, "reason": "1"})]
+
+
+def test_poll_error_is_logged_and_changes_nothing(monkeypatch):
+    events = []
+    monkeypatch.setattr(eventlog, "log", lambda event, **fields: events.append((event, fields)))
+
+    def broken(corpus):
+        raise RuntimeError("indisponível")
+
+    tracker = CorpusVersionTracker(["projects/p/ragCorpora/9"], interval=0, list_files=broken)
+    generation = corpus_version.current_generation()
+    assert tracker.poll() is False
+    assert tracker.poll_errors == 1
+    assert corpus_version.current_generation() == generation
+    assert events[0][0] == "corpus.version_poll_error"
+    assert events[0][1]["corpus"] == "9"
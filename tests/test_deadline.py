@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from admission import AdmissionController  # noqa: E402
+from deadline import (  # noqa: E402
+    Deadline,
+    DeadlineCallbackHandler,
+    DeadlineExceeded,
+    RequestCancelled,
+    current_deadline,
+    deadline_from_request,
+    deadline_scope,
+    run_until_deadline,
+)
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_deadline_from_request_takes_smallest_and_caps(monkeypatch):
+    import deadline
+
+    monkeypatch.setattr(deadline, "MAX_CHAT_DEADLINE", 60.0)
+    assert deadline_from_request("5", 10).timeout == 5
+    assert deadline_from_request("abc", 8).timeout == 8
+    assert deadline_from_request("600", None).timeout == 60
+    assert deadline_from_request(None, None).timeout == deadline.DEFAULT_CHAT_DEADLINE
+
+
+def test_remaining_time_propagates_to_worker_thread():
+    seen = {}
+
+    def work():
+        current = current_deadline()
+        seen["deadline"] = current
+        seen["remaining"] = current.remaining()
+        return "ok"
+
+    async def scenario():
+        d = Deadline(5)
+        with deadline_scope(d):
+            result = await run_until_deadline(None, d, work)
+        return d, result
+
+    d, result = asyncio.run(scenario())
+    assert result == "ok"
+    assert seen["deadline"] is d
+    assert 0 < seen["remaining"] <= 5
+
+
+def test_callback_handler_raises_when_deadline_expires():
+    d = Deadline(0.01)
+    handler = DeadlineCallbackHandler(d)
+    handler.on_chat_model_start({}, [[]])  # ainda dentro do prazo
+    time.sleep(0.02)
+    with pytest.raises(DeadlineExceeded):
+        handler.on_chat_model_start({}, [[]])
+    with pytest.raises(DeadlineExceeded):
+        handler.on_tool_start({}, "consulta")
+
+    cancelled = Deadline(10)
+    cancelled.cancel()
+    with pytest.raises(RequestCancelled):
+        DeadlineCallbackHandler(cancelled).on_llm_start({}, ["prompt"])
+
+
+def test_expired_deadline_cancels_the_work():
+    stopped = threading.Event()
+
+    def work(d):
+        # Simula rodadas do agente: cada uma verifica a deadline
+        while True:
+            if d.sleep(0.01) is False:
+                stopped.set()
+                return
+
+    async def scenario():
+        d = Deadline(0.1)
+        with pytest.raises(DeadlineExceeded):
+            await run_until_deadline(None, d, work, d)
+        return d
+
+    d = asyncio.run(scenario())
+    assert d.cancelled
+    assert stopped.wait(1)
+
+
+def test_disconnect_cancels_and_slot_waits_for_abandoned_work(monkeypatch):
+    import deadline
+
+    monkeypatch.setattr(deadline, "DISCONNECT_POLL_INTERVAL", 0.01)
+    release_work = threading.Event()
+
+    def work(d):
+        # Trabalho que só percebe o cancelamento mais tarde
+        release_work.wait(2)
+        return d.cancelled
+
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=0, max_queue_time=1)
+        request = FakeRequest()
+        d = Deadline(10)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, lambda: setattr(request, "disconnected", True))
+        with pytest.raises(RequestCancelled):
+            async with controller.slot() as slot:
+                await run_until_deadline(request, d, work, d, hold=slot.hold)
+        assert d.cancelled
+        # A thread abandonada ainda roda: a vaga segue ocupada
+        stats = controller.stats()
+        assert stats["in_flight"] == 1
+        assert stats["abandoned_running"] == 1
+
+        release_work.set()
+        for _ in range(100):
+            if controller.stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        stats = controller.stats()
+        assert stats["in_flight"] == 0
+        assert stats["abandoned_running"] == 0
+
+    asyncio.run(scenario())
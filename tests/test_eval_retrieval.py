@@ -0,0 +1,108 @@
+import pytest
+
+from eval_retrieval import (
+    Candidate, EvalConfig, LiveBackend, LocalBackend, evaluate, is_relevant, load_golden, none_auc,
+)
+from corpus_snapshot import Chunk, chunk_id_for, write_snapshot
+
+
+def test_golden_set_has_specific_criteria():
+    golden = load_golden()
+    ids = [q["id"] for q in golden["questions"]]
+    assert len(ids) == len(set(ids))
+    assert sum(1 for q in golden["questions"] if q.get("expect_none")) >= 3
+    for q in golden["questions"]:
+        if q.get("expect_none"):
+            continue
+        assert q["expected_sources"] or (q["expected_terms"] and q["topic_terms"])
+        # Palavra solta casa com qualquer procedimento
+        assert all(" " in t or "-" in t for t in q["expected_terms"]), q["id"]
+
+
+def test_relevance_needs_phrase_and_topic():
+    question = {"expected_terms": ["prazo para cancelamento"], "topic_terms": ["auxílio-transporte"]}
+    assert is_relevant(Candidate("O prazo para cancelamento do auxilio-transporte é..."), question)
+    assert not is_relevant(Candidate("O prazo para cancelamento das férias é..."), question)
+    assert not is_relevant(Candidate("Cadastro do auxílio-transporte"), question)
+
+
+def test_relevance_by_source_takes_precedence():
+    question = {"expected_sources": ["auxilio.pdf"], "expected_terms": ["cadastro"]}
+    assert is_relevant(Candidate("qualquer texto", source_uri="gs://b/auxilio.pdf"), question)
+    assert not is_relevant(Candidate("cadastro", source_uri="gs://b/ferias.pdf"), question)
+
+
+def test_none_auc():
+    golden = {"questions": [{"id": "a"}, {"id": "b"}, {"id": "x", "expect_none": True}]}
+    assert none_auc({"a": 0.1, "b": 0.2, "x": 0.9}, golden) == 1.0
+    assert none_auc({"a": 0.1, "b": 0.95, "x": 0.9}, golden) == 0.5
+    assert none_auc({"a": 0.1, "b": 0.2, "x": None}, golden) == 1.0
+    assert none_auc({"a": 0.1}, {"questions": [{"id": "a"}]}) is None
+
+
+def test_local_backend_abstains_out_of_scope(tmp_path):
+    rows = [
+        ("ferias.pdf", "Solicitação de férias no SERH: acesse o menu Férias e informe o período"),
+        ("ferias.pdf", "Parcelamento das férias em até três períodos"),
+        ("auxilio.pdf", "Cadastro do auxílio-transporte: anexe o comprovante de residência"),
+        ("auxilio.pdf", "Cancelamento do auxílio-transporte pelo próprio servidor"),
+    ]
+    path = str(tmp_path / "serh.snap")
+    write_snapshot(path, [Chunk(chunk_id_for(s, t), t, s) for s, t in rows])
+    golden = {"version": 2, "questions": [
+        {"id": "ferias", "query": "solicitação de férias SERH",
+         "expected_sources": [], "expected_terms": ["solicitação de férias"], "topic_terms": ["férias"]},
+        {"id": "fora", "query": "presidente do Brasil", "expect_none": True},
+        {"id": "fora-parcial", "query": "férias na praia do Brasil", "expect_none": True},
+    ]}
+    backend = LocalBackend(path)
+    fetched = {q["id"]: backend.fetch(q) for q in golden["questions"]}
+
+    # Distância relativa ao teto da consulta: o melhor trecho não é sempre 0
+    assert fetched["fora"][0] == []
+    assert fetched["fora-parcial"][0][0].distance > fetched["ferias"][0][0].distance
+
+    open_result = evaluate(golden, fetched, EvalConfig(5, 500, None, False))
+    assert open_result["recall@5"] == 1.0
+    assert open_result["abstain_rate"] == 0.5
+    assert open_result["none_auc"] == 1.0
+
+    threshold = (fetched["ferias"][0][0].distance + fetched["fora-parcial"][0][0].distance) / 2
+    strict = evaluate(golden, fetched, EvalConfig(5, 500, threshold, False))
+    assert strict["recall@5"] == 1.0
+    assert strict["abstain_rate"] == 1.0
+
+
+def test_live_backend_targets_the_app_corpus(monkeypatch):
+    gcp_setup = pytest.importorskip("gcp_setup")  # python-dotenv
+
+    monkeypatch.setenv("PROJECT_ID", "scripts-project")
+    monkeypatch.setenv("GCP_PROJECT_ID", "app-project")
+    monkeypatch.setenv("GCP_LOCATION", "us-central1")
+    monkeypatch.delenv("CORPUS_IDS", raising=False)
+    monkeypatch.setenv("CORPUS_ID", "123")
+    assert gcp_setup.app_target() == ("app-project", "us-central1")
+    assert gcp_setup.app_corpus_names() == ["projects/app-project/locations/us-central1/ragCorpora/123"]
+
+    monkeypatch.setenv("CORPUS_IDS", "123, projects/outro/locations/eu/ragCorpora/9")
+    assert gcp_setup.app_corpus_names() == [
+        "projects/app-project/locations/us-central1/ragCorpora/123",
+        "projects/outro/locations/eu/ragCorpora/9",
+    ]
+
+
+def test_live_backend_requires_a_corpus(monkeypatch):
+    pytest.importorskip("dotenv")
+    monkeypatch.delenv("CORPUS_IDS", raising=False)
+    monkeypatch.delenv("CORPUS_ID", raising=False)
+    with pytest.raises(ValueError, match="CORPUS_IDS ou CORPUS_ID"):
+        LiveBackend()
+
+
+def test_local_backend_requires_snapshot_argument(monkeypatch, capsys):
+    from eval_retrieval import main
+
+    monkeypatch.setenv("CORPUS_SNAPSHOT_PATH", "/tmp/nao-usado.snap")
+    with pytest.raises(SystemExit):
+        main(["--backend", "local"])
+    assert "--snapshot" in capsys.readouterr().err
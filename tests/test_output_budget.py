@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from output_budget import BudgetStats, classify, length_prompt, plan  # noqa: E402
+
+
+def test_classify():
+    assert classify("Posso parcelar as férias?") == "yes_no"
+    assert classify("Onde fica o menu de frequência?") == "navigation"
+    assert classify("Como solicito férias no SERH?") == "procedure"
+
+
+def test_word_target_goes_to_config_not_to_the_message():
+    budget = plan("Posso parcelar as férias?", 1024, token_budget=0, holdout=False)
+    configurable = budget.configurable()
+    assert configurable["max_output_tokens"] == budget.max_output_tokens
+    assert str(budget.word_target) in configurable["answer_instruction"]
+
+    long_answer = plan("Posso parcelar as férias?", 1024, answer_length="long", token_budget=0)
+    assert long_answer.configurable()["answer_instruction"] is None
+
+
+def test_length_prompt_adds_system_message_only_to_the_model_call():
+    pytest.importorskip("langchain_core.messages")
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    state = {"messages": [HumanMessage("Posso parcelar as férias?")]}
+    config = {"configurable": {"answer_instruction": "Responda em até 50 palavras."}}
+    messages = length_prompt(state, config)
+    assert isinstance(messages[0], SystemMessage)
+    assert messages[1:] == state["messages"]
+    # O estado da thread não muda
+    assert len(state["messages"]) == 1
+    assert state["messages"][0].content == "Posso parcelar as férias?"
+
+    assert length_prompt(state, {"configurable": {}}) == state["messages"]
+
+
+def test_holdout_runs_without_budget():
+    budget = plan("Posso parcelar as férias?", 1024, token_budget=0, holdout=True)
+    assert budget.holdout
+    assert budget.max_output_tokens == 1024
+    assert budget.configurable()["answer_instruction"] is None
+    # Pedido explícito do cliente nunca vira controle
+    assert not plan("Posso parcelar?", 1024, max_words=30, token_budget=0).holdout
+
+
+def test_savings_are_measured_against_the_holdout():
+    stats = BudgetStats()
+    question = "Posso parcelar as férias?"
+    budgeted = plan(question, 1024, token_budget=0, holdout=False)
+    for _ in range(4):
+        stats.record(budgeted, completion_tokens=60)
+    snapshot = stats.snapshot()
+    yes_no = snapshot["classes"]["yes_no"]
+    # Sem controle não há economia medida, só o teto retido
+    assert snapshot["completion_tokens_saved"] is None
+    assert snapshot["cap_tokens_withheld"] == 4 * (1024 - budgeted.max_output_tokens)
+
+    control = plan(question, 1024, token_budget=0, holdout=True)
+    stats.record(control, completion_tokens=80)
+    stats.record(control, completion_tokens=100)
+    yes_no = stats.snapshot()["classes"]["yes_no"]
+    assert yes_no["turns"] == 4
+    assert yes_no["holdout_avg_completion_tokens"] == 90
+    assert yes_no["completion_tokens_saved"] == (90 - 60) * 4
+    assert stats.snapshot()["completion_tokens_saved"] == 120
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+import prefetch  # noqa: E402
+import scheduler  # noqa: E402
+from deadline import Deadline, RequestCancelled, current_deadline, deadline_scope  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(prefetch, "stats", prefetch.PrefetchStats())
+    monkeypatch.setattr(scheduler, "retrieval", scheduler.Scheduler("retrieval", 2))
+
+
+def test_similar_query_reuses_result():
+    with deadline_scope(Deadline(5)):
+        with prefetch.prefetch_scope("como solicito férias no SERH", lambda q: ["trecho"]):
+            assert prefetch.lookup("solicito férias no SERH") == ["trecho"]
+    snapshot = prefetch.stats.snapshot()
+    assert snapshot["hits"] == 1
+    assert snapshot["unused"] == 0
+
+
+def test_unused_prefetch_is_cancelled_through_its_deadline():
+    started = threading.Event()
+    seen = {}
+
+    def slow_search(query):
+        deadline = current_deadline()
+        seen["deadline"] = deadline
+        started.set()
+        while not deadline.cancelled:
+            deadline.sleep(0.01)
+        deadline.check()
+
+    turn_deadline = Deadline(5)
+    with deadline_scope(turn_deadline):
+        with prefetch.prefetch_scope("como solicito férias", slow_search) as entry:
+            started.wait(1)
+    with pytest.raises(RequestCancelled):
+        entry.future.result(timeout=1)
+
+    assert seen["deadline"] is not turn_deadline
+    assert not turn_deadline.cancelled
+    snapshot = prefetch.stats.snapshot()
+    assert snapshot["unused"] == 1
+    assert snapshot["wasted"] == 1
+
+
+def test_different_query_cancels_prefetch():
+    with deadline_scope(Deadline(5)):
+        with prefetch.prefetch_scope("como solicito férias", lambda q: ["trecho"]) as entry:
+            assert prefetch.lookup("auxílio-transporte cadastro") is None
+            assert entry.deadline.cancelled
+    assert prefetch.stats.snapshot()["misses"] == 1
+
+
+def test_skipped_without_free_retrieval_slot():
+    scheduler.retrieval.acquire()
+    scheduler.retrieval.acquire()
+    with prefetch.prefetch_scope("como solicito férias", lambda q: ["trecho"]) as entry:
+        assert entry is None
+        assert prefetch.lookup("como solicito férias") is None
+    assert prefetch.stats.snapshot()["skipped_busy"] == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from rate_limit import (
+    MemoryBackend,
+    RateLimit,
+    RateLimiter,
+    SQLiteBackend,
+    client_identity,
+    parse_api_keys,
+    parse_rate_limits,
+)
+
+
+def test_parse_rate_limits_orders_most_specific_first():
+    limits = parse_rate_limits("/chat=30/min:10,/chat/jobs=6/min")
+    assert [l.route for l in limits] == ["/chat/jobs", "/chat"]
+    assert limits[1].rate == 0.5
+    assert limits[1].burst == 10
+    assert limits[0].burst == 6
+
+
+def test_parse_rate_limits_rejects_unknown_unit():
+    with pytest.raises(ValueError):
+        parse_rate_limits("/chat=30/week")
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_bucket_allows_burst_then_refills(backend, tmp_path):
+    limit = RateLimit("/chat", rate=1.0, burst=2)
+    store = MemoryBackend() if backend == "memory" else SQLiteBackend(str(tmp_path / "rl.db"))
+
+    assert store.consume("c", limit, now=100.0).allowed
+    assert store.consume("c", limit, now=100.0).allowed
+    denied = store.consume("c", limit, now=100.0)
+    assert not denied.allowed
+    assert denied.retry_after == 1
+    assert store.consume("c", limit, now=101.0).allowed
+    # Outro cliente tem o próprio balde
+    assert store.consume("d", limit, now=101.0).allowed
+
+
+def test_memory_backend_drops_idle_buckets():
+    limit = RateLimit("/chat", rate=1.0, burst=2)
+    store = MemoryBackend()
+    store.consume("a", limit, now=0.0)
+    store.consume("b", limit, now=10.0)
+    assert len(store) == 1
+
+
+def test_limiter_matches_route_prefix():
+    limiter = RateLimiter(parse_rate_limits("/chat=1/min"))
+    limit = limiter.limit_for("/chat/jobs")
+    assert limit.route == "/chat"
+    assert limiter.limit_for("/health") is None
+    assert limiter.check("c", limit).allowed
+    assert not limiter.check("c", limit).allowed
+    assert limiter.stats()["routes"]["/chat"] == {
+        "rate_per_s": 1 / 60, "burst": 1.0, "allowed": 1, "limited": 1,
+    }
+
+
+def test_identity_ignores_unknown_api_keys():
+    keys = parse_api_keys("segredo")
+    known = client_identity({"x-api-key": "segredo"}, "10.0.0.1", api_keys=keys)
+    assert known.startswith("key:")
+    assert client_identity({"x-api-key": "outra"}, "10.0.0.1", api_keys=keys) == "ip:10.0.0.1"
+
+
+def test_identity_uses_forwarded_for_only_behind_proxy():
+    headers = {"x-forwarded-for": "1.2.3.4, 5.6.7.8"}
+    assert client_identity(headers, "10.0.0.1", trust_proxy=False, api_keys=frozenset()) == "ip:10.0.0.1"
+    assert client_identity(headers, "10.0.0.1", trust_proxy=True, api_keys=frozenset()) == "ip:5.6.7.8"
+
+
+def test_memory_backend_evicts_short_ttl_behind_long_ttl():
+    long_ttl = RateLimit("/chat/jobs", rate=1 / 3600, burst=1)  # 1 h ocioso
+    short_ttl = RateLimit("/chat", rate=1.0, burst=2)  # 2 s ocioso
+    store = MemoryBackend()
+    store.consume("job-client", long_ttl, now=0.0)
+    for i in range(50):
+        store.consume(f"chat-{i}", short_ttl, now=1.0)
+    assert len(store) == 51
+    # O balde de TTL longo é o mais antigo, mas não segura os de TTL curto
+    store.consume("job-client", long_ttl, now=10.0)
+    assert len(store) == 1
+
+
+def test_memory_backend_max_buckets_drops_least_recently_used():
+    fast = RateLimit("/chat", rate=1.0, burst=100)
+    slow = RateLimit("/chat/jobs", rate=0.01, burst=100)
+    store = MemoryBackend(max_buckets=2)
+    store.consume("a", slow, now=0.0)
+    store.consume("b", fast, now=1.0)
+    store.consume("c", fast, now=2.0)
+    assert len(store) == 2
+    # "a" era o menos recente: volta com o balde cheio
+    assert store.consume("a", slow, now=3.0).remaining == 99
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+import rerank as rerank_module
+from rerank import rerank, tokenize
+
+FILLER = [
+    "O SERH é o sistema de recursos humanos do órgão.",
+    "Acesse o portal com seu login e senha institucionais.",
+    "Dúvidas gerais podem ser enviadas pelo formulário de contato.",
+    "O menu principal reúne cadastro, consultas e relatórios.",
+    "Mantenha seus dados pessoais atualizados no sistema.",
+    "Os relatórios podem ser exportados em PDF.",
+    "O suporte atende em dias úteis.",
+]
+RELEVANT = "Para cancelar o auxílio-transporte, abra Benefícios > Auxílio-transporte > Cancelamento."
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        assert rerank_module.np is not None
+    else:
+        monkeypatch.setattr(rerank_module, "np", None)
+    return request.param
+
+
+def candidates():
+    # Ordem da busca vetorial: o trecho relevante vem por último
+    texts = FILLER + [RELEVANT]
+    return [SimpleNamespace(text=t, score=0.0) for t in texts]
+
+
+def test_relevant_candidate_is_promoted_into_top_n(backend):
+    kept = rerank("como cancelar o auxílio-transporte?", candidates(), top_n=3)
+    assert len(kept) == 3
+    assert kept[0].text == RELEVANT
+    assert kept[0].score >= kept[1].score >= kept[2].score
+
+
+def test_backends_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    query = "cancelar auxílio-transporte"
+    with_numpy = rerank_module.score_chunks(query, candidates())
+    monkeypatch.setattr(rerank_module, "np", None)
+    without = rerank_module.score_chunks(query, candidates())
+    assert with_numpy == pytest.approx(without, rel=1e-5)
+
+
+def test_query_without_terms_keeps_search_order(backend):
+    kept = rerank("o que é?", candidates(), top_n=2)
+    assert [c.text for c in kept] == FILLER[:2]
+
+
+def test_tokenize_folds_accents_and_plurals():
+    assert tokenize("Férias dos Documentos") == ["feria", "documento"]
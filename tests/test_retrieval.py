@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("vertexai")
+
+import corpus_version  # noqa: E402
+import retrieval  # noqa: E402
+from retrieval import RetrievedChunk, ResultCache, extract_chunks, normalize_scores  # noqa: E402
+
+CORPUS = "projects/p/locations/l/ragCorpora/123"
+
+
+def response(*contexts):
+    return SimpleNamespace(contexts=SimpleNamespace(contexts=list(contexts)))
+
+
+def context(text, score=None, distance=None):
+    return SimpleNamespace(text=text, score=score, distance=distance, source_uri=None)
+
+
+def test_cosine_distance_score_is_a_distance(monkeypatch):
+    monkeypatch.setattr(retrieval, "SCORE_METRICS", {})
+    monkeypatch.setattr(retrieval, "DEFAULT_SCORE_METRIC", "cosine_distance")
+    chunks = extract_chunks(response(context("perto", score=0.1), context("longe", score=0.9)), CORPUS)
+    assert [c.distance for c in chunks] == [0.1, 0.9]
+    normalize_scores(chunks)
+    assert chunks[0].score > chunks[1].score
+
+
+def test_similarity_metric_per_corpus(monkeypatch):
+    monkeypatch.setattr(retrieval, "SCORE_METRICS", retrieval.parse_score_metrics("123=dot_product"))
+    chunks = extract_chunks(response(context("melhor", score=0.9), context("pior", score=0.2)), CORPUS)
+    assert chunks[0].distance == pytest.approx(0.1)
+    normalize_scores(chunks)
+    assert chunks[0].score > chunks[1].score
+
+
+def test_explicit_distance_wins(monkeypatch):
+    monkeypatch.setattr(retrieval, "SCORE_METRICS", {})
+    chunks = extract_chunks(response(context("a", score=0.9, distance=0.3)), CORPUS)
+    assert chunks[0].distance == 0.3
+
+
+def test_unknown_metric_is_rejected():
+    with pytest.raises(ValueError):
+        retrieval.parse_score_metrics("123=manhattan")
+
+
+def test_normalize_without_distances_uses_rank():
+    chunks = [RetrievedChunk("a", CORPUS), RetrievedChunk("b", CORPUS)]
+    normalize_scores(chunks)
+    assert [c.score for c in chunks] == [1.0, 0.5]
+
+
+def test_cache_returns_copies_and_invalidates_by_generation():
+    cache = ResultCache(max_entries=8, ttl=60)
+    key = cache.key("Como solicito férias?", [CORPUS], 3)
+    cache.put(key, [RetrievedChunk("a", CORPUS, score=0.5)])
+
+    hit = cache.get(cache.key("  como solicito FÉRIAS? ", [CORPUS], 3))
+    assert [c.text for c in hit] == ["a"]
+    hit[0].score = 9.0
+    assert cache.get(key)[0].score == 0.5
+
+    corpus_version.bump("teste")
+    assert cache.get(cache.key("Como solicito férias?", [CORPUS], 3)) is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, ttl=60)
+    for q in ("a", "b", "c"):
+        cache.put(cache.key(q, [CORPUS], 3), [])
+    assert cache.get(cache.key("a", [CORPUS], 3)) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_slot_timeout_is_raised_not_empty(monkeypatch):
+    import scheduler
+
+    busy = scheduler.Scheduler("retrieval", 1, class_limits={})
+    busy.acquire(scheduler.INTERACTIVE)
+    monkeypatch.setattr(scheduler, "retrieval", busy)
+    monkeypatch.setattr(retrieval.cache, "get", lambda key: None)
+    with pytest.raises(scheduler.SlotTimeout):
+        retrieval.federated_search("férias", [CORPUS], corpus_timeout=0.05)
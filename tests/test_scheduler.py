@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import BATCH, INTERACTIVE, MAINTENANCE, Scheduler, SlotTimeout, priority_scope
+
+
+def wait_queued(scheduler, priority, count):
+    for _ in range(200):
+        if scheduler.stats()["classes"][priority]["queued"] >= count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"{priority} não entrou na fila")
+
+
+def test_weighted_fair_queueing_order():
+    scheduler = Scheduler("t", 1, weights={INTERACTIVE: 8, BATCH: 2, MAINTENANCE: 1}, class_limits={})
+    scheduler.acquire(INTERACTIVE)
+    order = []
+    lock = threading.Lock()
+
+    def waiter(priority, name):
+        scheduler.acquire(priority, timeout=5)
+        with lock:
+            order.append(name)
+        scheduler.release(priority)
+
+    threads = []
+    queued = {INTERACTIVE: 0, BATCH: 0, MAINTENANCE: 0}
+    # Trabalho de fundo enfileirado antes; o interativo chega por último
+    for priority, name in [(MAINTENANCE, "m1"), (BATCH, "b1"), (BATCH, "b2"), (INTERACTIVE, "i1")]:
+        thread = threading.Thread(target=waiter, args=(priority, name))
+        thread.start()
+        threads.append(thread)
+        queued[priority] += 1
+        wait_queued(scheduler, priority, queued[priority])
+
+    scheduler.release(INTERACTIVE)
+    for thread in threads:
+        thread.join(5)
+    # Marcas: i1=0.125, b1=0.5, b2=1.0, m1=1.0 (empate: ordem das classes)
+    assert order == ["i1", "b1", "b2", "m1"]
+
+
+def test_class_limit_keeps_room_for_interactive():
+    scheduler = Scheduler("t", 2, class_limits={BATCH: 1})
+    scheduler.acquire(BATCH)
+    assert not scheduler.has_free_slot(BATCH)
+    with pytest.raises(SlotTimeout):
+        scheduler.acquire(BATCH, timeout=0.01)
+    assert scheduler.has_free_slot(INTERACTIVE)
+    assert scheduler.acquire(INTERACTIVE, timeout=0.01) == INTERACTIVE
+    assert scheduler.stats()["classes"][BATCH]["timeouts"] == 1
+
+
+def test_priority_comes_from_context():
+    scheduler = Scheduler("t", 1, class_limits={})
+    with priority_scope(BATCH):
+        assert scheduler.acquire() == BATCH
+    with pytest.raises(ValueError):
+        with priority_scope("urgente"):
+            pass
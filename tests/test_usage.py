@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from usage import Usage, UsageLedger, client_label  # noqa: E402
+
+
+def test_metrics_never_expose_client_ip():
+    ledger = UsageLedger()
+    ledger.record("c1", "ip:203.0.113.7", Usage(prompt_tokens=100, completion_tokens=20, rounds=1))
+    ledger.record("c2", "key:0123456789abcdef", Usage(prompt_tokens=5, rounds=1))
+
+    top = ledger.stats()["top_clients"]
+    labels = [entry["client"] for entry in top]
+    assert labels == [client_label("ip:203.0.113.7"), client_label("key:0123456789abcdef")]
+    assert all("203.0.113" not in label and not label.startswith(("ip:", "key:")) for label in labels)
+    assert top[0]["total_tokens"] == 120
+
+
+def turns(n, size=400):
+    from conversation_store import Turn
+
+    return [Turn("user" if i % 2 == 0 else "assistant", "x" * size) for i in range(n)]
+
+
+def test_history_is_compacted_to_the_prompt_budget():
+    from usage import fit_history
+
+    history = turns(10)  # 100 tokens por mensagem
+    kept, compacted = fit_history(history, prompt_budget=450, token_budget=0)
+    assert compacted
+    assert sum(t.tokens for t in kept) <= 450
+    assert kept == history[-len(kept):]
+    assert kept[0].role == "user"
+
+    kept, compacted = fit_history(history, prompt_budget=5000, token_budget=0)
+    assert kept == history and not compacted
+
+
+def test_history_shrinks_once_the_conversation_budget_is_spent():
+    from usage import BUDGET_MIN_MESSAGES, fit_history
+
+    history = turns(10)
+    kept, compacted = fit_history(history, spent_tokens=999, prompt_budget=0, token_budget=1000)
+    assert not compacted
+    kept, compacted = fit_history(history, spent_tokens=1000, prompt_budget=0, token_budget=1000)
+    assert compacted
+    assert kept == history[-BUDGET_MIN_MESSAGES:]
+
+
+class _Generation:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.message = type("Message", (), {"usage_metadata": usage_metadata})()
+
+
+class _Result:
+    def __init__(self, *generations, llm_output=None):
+        self.generations = [list(generations)]
+        self.llm_output = llm_output
+
+
+def test_usage_falls_back_to_local_estimate_without_metadata():
+    from usage import UsageCallbackHandler
+
+    handler = UsageCallbackHandler()
+    handler.on_llm_start({}, ["p" * 400], run_id="r1")
+    handler.on_llm_end(_Result(_Generation("r" * 80)), run_id="r1")
+    assert handler.usage.prompt_tokens == 100
+    assert handler.usage.completion_tokens == 20
+    assert handler.usage.estimated_rounds == 1
+    assert handler.rounds[0]["estimated"]
+
+    handler.on_llm_start({}, ["p" * 400], run_id="r2")
+    reported = {"input_tokens": 321, "output_tokens": 12}
+    handler.on_llm_end(_Result(_Generation("r" * 80, reported)), run_id="r2")
+    assert handler.usage.prompt_tokens == 100 + 321
+    assert handler.usage.completion_tokens == 20 + 12
+    assert handler.usage.rounds == 2
+    assert handler.usage.estimated_rounds == 1
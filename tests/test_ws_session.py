@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("fastapi")
+
+from starlette.websockets import WebSocket  # noqa: E402
+
+import ws_session  # noqa: E402
+from ws_session import ChatSession  # noqa: E402
+
+
+def make_websocket(frames):
+    """WebSocket do Starlette sobre uma conversa ASGI roteirizada"""
+    incoming = [{"type": "websocket.connect"}] + frames + [
+        {"type": "websocket.disconnect", "code": 1000}
+    ]
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message["type"] == "websocket.send":
+            sent.append(json.loads(message["text"]))
+
+    scope = {"type": "websocket", "path": "/ws/chat", "headers": [], "query_string": b""}
+    return WebSocket(scope, receive, send), sent
+
+
+def run_session(frames):
+    handled = []
+
+    async def scenario():
+        websocket, sent = make_websocket(frames)
+        await websocket.accept()
+        session = ChatSession(websocket, "c1")
+
+        async def handle(data):
+            handled.append(data)
+            await session.send({"type": "done", "echo": data})
+
+        await asyncio.wait_for(session.run(handle), timeout=2)
+        return sent
+
+    return asyncio.run(scenario()), handled
+
+
+def test_bad_frames_get_400_and_session_continues(monkeypatch):
+    events = []
+    monkeypatch.setattr(ws_session.eventlog, "log", lambda event, **fields: events.append(event))
+    frames = [
+        {"type": "websocket.receive", "bytes": b"\x00\x01"},
+        {"type": "websocket.receive", "text": "{nao é json"},
+        {"type": "websocket.receive", "text": json.dumps({"message": "oi"})},
+    ]
+    sent, handled = run_session(frames)
+
+    assert handled == [{"message": "oi"}]
+    errors = [e for e in sent if e["type"] == "error"]
+    assert [e["status"] for e in errors] == [400, 400]
+    assert "ws.session_error" not in events
@@ -0,0 +1,149 @@
+"""Gravação amostrada do tráfego do /chat para planejamento de capacidade.
+
+Opt-in: só grava com TRAFFIC_RECORD_PATH definido (ex.: traffic.jsonl). A
+amostragem é por conversa (hash do ID), então uma conversa amostrada é
+gravada inteira e o replay preserva a sequência dos turnos.
+
+Cada requisição vira uma linha JSON:
+    {"ts": chegada (epoch), "conversation": id anonimizado, "new": bool,
+     "text": texto mascarado, "chars": tamanho original, "timeout": s,
+     "status": HTTP, "latency_ms": duração}
+
+Anonimização: IDs de conversa passam por HMAC-SHA256 com TRAFFIC_SALT
+(aleatório por processo se não for definido) e o texto tem e-mails, CPFs e
+sequências de dígitos (matrícula, telefone, datas) mascarados.
+
+O /chat só enfileira o registro (put_nowait numa fila limitada); uma thread
+de fundo grava em lote. Com a fila cheia o registro é descartado e contado,
+nunca bloqueia a requisição.
+
+O replay fica em replay_traffic.py.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from typing import Optional
+
+import eventlog
+
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+TRAFFIC_SAMPLE_RATE = float(os.getenv("TRAFFIC_SAMPLE_RATE", 0.1))
+TRAFFIC_QUEUE_SIZE = int(os.getenv("TRAFFIC_QUEUE_SIZE", 10000))
+FLUSH_INTERVAL = 1.0
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_CPF = re.compile(r"\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b")
+_DIGITS = re.compile(r"\d{4,}")
+
+
+def mask_text(text: str) -> str:
+    """Mascara dados pessoais mantendo o tamanho aproximado do texto"""
+    text = _EMAIL.sub("<email>", text)
+    text = _CPF.sub("<cpf>", text)
+    return _DIGITS.sub(lambda m: "0" * len(m.group()), text)
+
+
+class TrafficRecorder:
+    """Gravador amostrado e não bloqueante de requisições do /chat"""
+
+    def __init__(self, path: str, sample_rate: float = TRAFFIC_SAMPLE_RATE,
+                 salt: Optional[str] = None, queue_size: int = TRAFFIC_QUEUE_SIZE):
+        self.path = path
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self._salt = (salt or os.getenv("TRAFFIC_SALT") or secrets.token_hex(16)).encode()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["TrafficRecorder"]:
+        if not TRAFFIC_RECORD_PATH:
+            return None
+        return cls(TRAFFIC_RECORD_PATH)
+
+    def anonymize(self, value: str) -> str:
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:20]
+
+    def sampled(self, conversation_id: str) -> bool:
+        """Decisão estável por conversa"""
+        if self.sample_rate >= 1.0:
+            return True
+        digest = hmac.new(self._salt, conversation_id.encode("utf-8"), hashlib.sha256).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64 < self.sample_rate
+
+    def record(self, arrived: float, conversation_id: Optional[str], new: bool, text: str,
+               timeout: Optional[float], status: int, latency: float):
+        """Enfileira uma requisição (descarta se não amostrada ou fila cheia)"""
+        # Sem ID (turno que falhou antes de criar a conversa): amostra pelo texto
+        key = conversation_id or text
+        if not self.sampled(key):
+            self.skipped += 1
+            return
+        entry = {
+            "ts": round(arrived, 3),
+            "conversation": self.anonymize(conversation_id) if conversation_id else None,
+            "new": new,
+            "text": mask_text(text),
+            "chars": len(text),
+            "timeout": timeout,
+            "status": status,
+            "latency_ms": round(latency * 1000, 1),
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+            self._thread.start()
+
+    def _drain(self) -> list:
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self.recorded += len(batch)
+
+    def _run(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            try:
+                self._write(self._drain())
+            except OSError as e:
+                eventlog.log("traffic.write_error", level="error", exc=e, path=self.path)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._write(self._drain())
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "recorded": self.recorded,
+            "queued": self._queue.qsize(),
+            "dropped_queue_full": self.dropped,
+            "not_sampled": self.skipped,
+        }
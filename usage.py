@@ -0,0 +1,237 @@
+"""Contabilidade de tokens do chat.
+
+Cada turno registra, por rodada do modelo, os tokens de prompt e de resposta
+(do usage_metadata devolvido pelo Gemini, ou estimados localmente quando não
+vierem) e os tokens de contexto trazidos pelas ferramentas. O total do turno
+pode ir na ChatResponse (`include_usage` ou CHAT_INCLUDE_USAGE) e é somado por
+conversa e por cliente.
+
+Orçamentos por conversa:
+- CONVERSATION_PROMPT_BUDGET: tokens de histórico enviados por turno. Acima
+  disso o histórico é compactado (ficam as mensagens mais recentes que cabem).
+- CONVERSATION_TOKEN_BUDGET: total de tokens gastos pela conversa. Depois de
+  estourado, cada turno leva só as últimas BUDGET_MIN_MESSAGES mensagens, em
+  vez de prompts que crescem sem limite.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from conversation_store import estimate_tokens
+
+CHAT_INCLUDE_USAGE = os.getenv("CHAT_INCLUDE_USAGE", "false").lower() in ("1", "true", "yes")
+
+# Orçamentos por conversa (0 desativa)
+CONVERSATION_PROMPT_BUDGET = int(os.getenv("CONVERSATION_PROMPT_BUDGET", 8000))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", 0))
+BUDGET_MIN_MESSAGES = 4
+
+# Conversas/clientes mantidos no agregado (os mais antigos saem primeiro)
+USAGE_MAX_KEYS = int(os.getenv("USAGE_MAX_KEYS", 50000))
+
+# Chave do rótulo dos clientes no /metrics (por processo: estável entre
+# consultas, mas não dá para testar IPs candidatos contra o rótulo)
+_CLIENT_LABEL_KEY = secrets.token_bytes(16)
+
+
+def client_label(client: str) -> str:
+    """Rótulo público da identidade do cliente (nunca o IP ou a chave)"""
+    return hmac.new(_CLIENT_LABEL_KEY, client.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+@dataclass
+class Usage:
+    """Tokens de um turno (ou acumulados)"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tool_tokens: int = 0
+    rounds: int = 0
+    estimated_rounds: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "Usage"):
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.tool_tokens += other.tool_tokens
+        self.rounds += other.rounds
+        self.estimated_rounds += other.estimated_rounds
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+
+def _message_tokens(messages) -> int:
+    return sum(estimate_tokens(str(getattr(m, "content", m))) for m in messages)
+
+
+def _reported_usage(response) -> Optional[tuple]:
+    """(prompt, completion) do usage_metadata do LLMResult, se houver"""
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+
+    llm_output = getattr(response, "llm_output", None) or {}
+    metadata = llm_output.get("usage_metadata") or llm_output.get("token_usage")
+    if metadata:
+        prompt = metadata.get("prompt_token_count", metadata.get("prompt_tokens", 0))
+        completion = metadata.get("candidates_token_count", metadata.get("completion_tokens", 0))
+        return prompt, completion
+    return None
+
+
+def _generated_text(response) -> str:
+    return "".join(
+        getattr(generation, "text", "") or ""
+        for generations in getattr(response, "generations", None) or []
+        for generation in generations
+    )
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Coleta os tokens de cada rodada do modelo e das ferramentas.
+
+    Registrado em config["callbacks"] do agent.query(), ao lado do
+    DeadlineCallbackHandler. O prompt de cada rodada é estimado na largada;
+    se o modelo devolver usage_metadata, os números reportados prevalecem.
+    """
+
+    def __init__(self):
+        self.usage = Usage()
+        self.rounds = []
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id=None, **kwargs):
+        with self._lock:
+            self._pending[run_id] = sum(_message_tokens(batch) for batch in messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        with self._lock:
+            self._pending[run_id] = sum(estimate_tokens(p) for p in prompts)
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        reported = _reported_usage(response)
+        with self._lock:
+            estimated_prompt = self._pending.pop(run_id, 0)
+            if reported:
+                prompt, completion = reported
+            else:
+                prompt = estimated_prompt
+                completion = estimate_tokens(_generated_text(response))
+            self.usage.prompt_tokens += prompt
+            self.usage.completion_tokens += completion
+            self.usage.rounds += 1
+            self.usage.estimated_rounds += 0 if reported else 1
+            self.rounds.append({
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "estimated": not reported,
+            })
+
+    def on_tool_end(self, output, **kwargs):
+        with self._lock:
+            self.usage.tool_tokens += estimate_tokens(str(getattr(output, "content", output)))
+
+
+class UsageLedger:
+    """Uso acumulado por conversa e por cliente (LRU limitado a max_keys)"""
+
+    def __init__(self, max_keys: int = USAGE_MAX_KEYS):
+        self.max_keys = max_keys
+        self.total = Usage()
+        self.turns = 0
+        self.compactions = 0
+        self._conversations = OrderedDict()
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, table: OrderedDict, key: str) -> Usage:
+        usage = table.get(key)
+        if usage is None:
+            usage = table[key] = Usage()
+            if len(table) > self.max_keys:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return usage
+
+    def record(self, conversation_id: str, client: Optional[str], usage: Usage):
+        with self._lock:
+            self.turns += 1
+            self.total.add(usage)
+            self._bucket(self._conversations, conversation_id).add(usage)
+            if client:
+                self._bucket(self._clients, client).add(usage)
+
+    def record_compaction(self):
+        with self._lock:
+            self.compactions += 1
+
+    def conversation(self, conversation_id: str) -> Optional[Usage]:
+        with self._lock:
+            return self._conversations.get(conversation_id)
+
+    def forget(self, conversation_id: str):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def stats(self, top: int = 10) -> dict:
+        with self._lock:
+            heaviest = sorted(self._clients.items(), key=lambda kv: kv[1].total_tokens,
+                              reverse=True)[:top]
+            return {
+                "turns": self.turns,
+                "history_compactions": self.compactions,
+                "total": self.total.as_dict(),
+                "conversations_tracked": len(self._conversations),
+                "clients_tracked": len(self._clients),
+                # Identidades por IP ("ip:1.2.3.4") não podem ir para o /metrics
+                "top_clients": [
+                    {"client": client_label(client), **usage.as_dict()} for client, usage in heaviest
+                ],
+            }
+
+
+def fit_history(history: list, spent_tokens: int = 0,
+                prompt_budget: int = CONVERSATION_PROMPT_BUDGET,
+                token_budget: int = CONVERSATION_TOKEN_BUDGET) -> tuple:
+    """Compacta o histórico enviado ao agente conforme os orçamentos.
+
+    Args:
+        history: Turns da janela ativa (mais antigos primeiro).
+        spent_tokens: Tokens já gastos pela conversa.
+        prompt_budget: Máximo de tokens de histórico por turno (0 = sem limite).
+        token_budget: Máximo acumulado da conversa (0 = sem limite).
+
+    Returns:
+        (turns mantidos, True se o histórico foi compactado)
+    """
+    if token_budget and spent_tokens >= token_budget:
+        kept = history[-BUDGET_MIN_MESSAGES:]
+        return kept, len(kept) < len(history)
+
+    if not prompt_budget:
+        return history, False
+
+    used = 0
+    start = len(history)
+    while start > 0 and used + history[start - 1].tokens <= prompt_budget:
+        start -= 1
+        used += history[start].tokens
+    # Não começa o histórico por uma resposta sem a pergunta correspondente
+    if start < len(history) and history[start].role != "user":
+        start += 1
+    return history[start:], start > 0
@@ -0,0 +1,153 @@
+"""Sessões de chat por WebSocket.
+
+Uma conexão fica ligada a uma conversa. Três tarefas por conexão:
+
+- leitura: recebe as mensagens do cliente e as enfileira (pipelining). A fila
+  é limitada a WS_MAX_PIPELINE; cheia, a leitura para e o TCP segura o
+  cliente.
+- processamento: executa os turnos um de cada vez, na ordem de chegada.
+- escrita: envia os eventos (trechos da resposta, fim do turno, erros). A
+  fila de saída é limitada a WS_SEND_BUFFER; se o cliente lê devagar, quem
+  produz os trechos (a thread do agente) espera, dentro da deadline do turno.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+import eventlog
+from deadline import Deadline, DeadlineExceeded
+
+WS_MAX_PIPELINE = int(os.getenv("WS_MAX_PIPELINE", 8))
+WS_SEND_BUFFER = int(os.getenv("WS_SEND_BUFFER", 64))
+
+# Espera máxima para enfileirar um evento quando não há deadline
+SEND_TIMEOUT = 30.0
+
+
+class SessionStats:
+    """Contadores das conexões WebSocket"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.total = 0
+        self.messages = 0
+        self.backpressure_waits = 0
+
+    def incr(self, name: str, delta: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.open,
+                "total_connections": self.total,
+                "messages": self.messages,
+                "backpressure_waits": self.backpressure_waits,
+            }
+
+
+stats = SessionStats()
+
+
+class ChatSession:
+    """Uma conexão WebSocket ligada a uma conversa"""
+
+    def __init__(self, websocket: WebSocket, conversation_id: str,
+                 max_pipeline: int = WS_MAX_PIPELINE, send_buffer: int = WS_SEND_BUFFER):
+        self.websocket = websocket
+        self.conversation_id = conversation_id
+        self.inbox = asyncio.Queue(maxsize=max_pipeline)
+        self.outbox = asyncio.Queue(maxsize=send_buffer)
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+
+    async def is_disconnected(self) -> bool:
+        """Mesma interface do Request usada por run_until_deadline"""
+        return self.closed
+
+    async def send(self, event: dict):
+        """Enfileira um evento para o cliente (espera se a fila estiver cheia)"""
+        if self.outbox.full():
+            stats.incr("backpressure_waits")
+        await self.outbox.put(event)
+
+    def send_threadsafe(self, event: dict, deadline: Optional[Deadline] = None):
+        """Enfileira um evento a partir da thread do agente.
+
+        Bloqueia enquanto o cliente não consome a fila de saída; desiste
+        quando a deadline do turno acaba ou a conexão fecha.
+        """
+        if self.closed:
+            raise DeadlineExceeded("Conexão encerrada")
+        timeout = deadline.remaining() if deadline is not None else SEND_TIMEOUT
+        future = asyncio.run_coroutine_threadsafe(self.send(event), self._loop)
+        try:
+            future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise DeadlineExceeded("Cliente não consumiu a resposta a tempo")
+
+    async def _read(self):
+        try:
+            while True:
+                try:
+                    data = await self.websocket.receive_json()
+                except ValueError:
+                    await self.send({"type": "error", "status": 400, "error": "JSON inválido"})
+                    continue
+                except KeyError:
+                    # Frame binário: receive_json() só lê o campo "text"
+                    await self.send({"type": "error", "status": 400,
+                                     "error": "Frame binário não suportado; envie JSON como texto"})
+                    continue
+                stats.incr("messages")
+                await self.inbox.put(data)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+
+    async def _write(self):
+        while True:
+            event = await self.outbox.get()
+            await self.websocket.send_json(event)
+
+    async def _process(self, handle):
+        while True:
+            data = await self.inbox.get()
+            await handle(data)
+
+    async def run(self, handle):
+        """Atende a conexão até o cliente desconectar.
+
+        Args:
+            handle: Corrotina chamada com cada mensagem do cliente, em ordem.
+        """
+        stats.incr("open")
+        stats.incr("total")
+        tasks = [
+            asyncio.create_task(self._read()),
+            asyncio.create_task(self._write()),
+            asyncio.create_task(self._process(handle)),
+        ]
+        try:
+            # Qualquer tarefa que termine (desconexão ou erro de envio)
+            # encerra a sessão
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None \
+                        and not isinstance(task.exception(), WebSocketDisconnect):
+                    eventlog.log("ws.session_error", level="error", exc=task.exception())
+        finally:
+            self.closed = True
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stats.incr("open", -1)